@@ -1,24 +1,156 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-import pandas as pd
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Sequence, Tuple
 import io
-from services import DatabaseService
+import itertools
+import os
+import sqlite3
+from services import ResultSet
+from services.result_set import iter_csv, write_excel
+from services.export_formats import column_types, get_export_format, storage_classes_query
+from services.admission import Ticket, admission
+from services.metrics import stage
+from services.container import get_container
 
 router = APIRouter()
 
-# Initialize database service
-db_service = DatabaseService()
+# Rows fetched from the cursor per encoded chunk (one Parquet row group / Arrow batch each)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 10000))
 
 
 class DownloadRequest(BaseModel):
     """Request model for downloading results"""
     data: Optional[List[Dict[str, Any]]] = None  # For backward compatibility
+    result_id: Optional[str] = None  # Spilled result from /api/query, read from disk
     sql_query: Optional[str] = None  # New: execute query on backend
     table_name: Optional[str] = None  # Required if using sql_query
     filename: str = "results"
-    format: str = "csv"  # csv or excel
+    format: str = "csv"  # csv, excel, ndjson, parquet or arrow (POST /download)
+
+
+def _load_results(request: DownloadRequest) -> Tuple[Sequence[str], Iterable[List[tuple]]]:
+    """
+    Get column names and row batches from a spilled result, the query or provided data
+
+    Blocks while the table is attached (or restored from the archive) and
+    the query runs up to its first batch, so handlers call it in the threadpool.
+
+    Returns:
+        Tuple of (column_names, iterable of row-tuple batches)
+    """
+    container = get_container()
+    if request.result_id:
+        # Stream from the spilled copy without running the query again
+        spilled = container.result_store.iter_batches(request.result_id, batch_size=EXPORT_BATCH_SIZE)
+        if spilled is None:
+            raise HTTPException(status_code=404, detail=f"Result '{request.result_id}' not found or expired")
+        return spilled
+    if request.sql_query and request.table_name:
+        # Execute query on backend, reading the cursor in batches
+        batches = container.db.iter_query(
+            request.sql_query, batch_size=EXPORT_BATCH_SIZE, table_name=request.table_name
+        )
+        columns, first = next(batches)
+        if not first:
+            batches.close()
+            raise HTTPException(status_code=400, detail="Query returned no results")
+        return columns, itertools.chain([first], (rows for _, rows in batches))
+    if request.data:
+        # Use provided data (backward compatibility)
+        data = ResultSet.from_records(request.data)
+        return data.columns, [data.rows]
+    raise HTTPException(status_code=400, detail="Either result_id, data or sql_query must be provided")
+
+
+def _column_types(request: DownloadRequest, columns: Sequence[str]) -> Optional[List[set]]:
+    """
+    Python types of every value in each result column, for Parquet and Arrow
+
+    Their schema is written before the first row, so it is settled over the
+    whole result rather than the first rows. This reads the result a second
+    time. None leaves the types to be inferred from the first rows.
+    """
+    container = get_container()
+    if request.result_id:
+        return container.result_store.column_types(request.result_id)
+    if request.sql_query and request.table_name:
+        try:
+            _, rows = next(container.db.iter_query(
+                storage_classes_query(request.sql_query, len(columns)), table_name=request.table_name
+            ))
+        except sqlite3.Error:
+            return None  # Not a query that can be wrapped, e.g. a PRAGMA
+        return column_types(rows[0])
+    if request.data:
+        rows = ResultSet.from_records(request.data).rows
+        return [{type(value) for value in values if value is not None} for values in zip(*rows)]
+    return None
+
+
+def _release_after(chunks: Iterable, ticket: Ticket) -> Iterator:
+    """
+    Pass a response body through, releasing the export slot however it ends
+
+    The response's background task is skipped when the body raises, so the
+    slot is also released here; Ticket.release() only acts once.
+    """
+    try:
+        yield from chunks
+    finally:
+        ticket.release()
+
+
+@router.post("/download")
+async def download(request: DownloadRequest):
+    """
+    Download query results in the format named by request.format
+
+    csv, ndjson, parquet and arrow are encoded batch by batch while the
+    response streams, so memory stays bounded by EXPORT_BATCH_SIZE rows.
+    Parquet writes one row group per batch and Arrow one record batch per
+    batch, keeping INTEGER, REAL, TEXT and BLOB columns typed. Their column
+    types are settled over the whole result before the response starts; a
+    column mixing TEXT with other values is written as text.
+
+    Args:
+        request: DownloadRequest with result_id/data/sql_query, filename and format
+
+    Returns:
+        File download
+    """
+    try:
+        export_format = get_export_format(request.format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Held until the file has been sent
+    ticket = await admission.acquire("export")
+    try:
+        columns, batches = await run_in_threadpool(_load_results, request)
+        if export_format.requires_pyarrow:
+            types = await run_in_threadpool(_column_types, request, columns)
+            encoded = export_format.encode(columns, batches, types=types)
+        else:
+            encoded = export_format.encode(columns, batches)
+
+        return StreamingResponse(
+            _release_after(encoded, ticket),
+            media_type=export_format.media_type,
+            headers={
+                "Content-Disposition": f"attachment; filename={request.filename}.{export_format.extension}"
+            },
+            background=BackgroundTask(ticket.release)  # Also when the client leaves before the body starts
+        )
+
+    except HTTPException:
+        ticket.release()
+        raise
+    except Exception as e:
+        ticket.release()
+        raise HTTPException(status_code=500, detail=f"Error creating {request.format} file: {str(e)}")
 
 
 @router.post("/download/csv")
@@ -27,44 +159,31 @@ async def download_csv(request: DownloadRequest):
     Download query results as CSV
 
     Args:
-        request: DownloadRequest with data/sql_query and filename
+        request: DownloadRequest with result_id/data/sql_query and filename
 
     Returns:
         CSV file download
     """
+    # Held until the file has been sent
+    ticket = await admission.acquire("export")
     try:
-        # Get data either from provided data or by executing query
-        if request.sql_query and request.table_name:
-            # Execute query on backend (efficient for large datasets)
-            data = db_service.execute_query(request.sql_query)
-            if not data:
-                raise HTTPException(status_code=400, detail="Query returned no results")
-        elif request.data:
-            # Use provided data (backward compatibility)
-            data = request.data
-        else:
-            raise HTTPException(status_code=400, detail="Either data or sql_query must be provided")
-
-        # Convert to DataFrame
-        df = pd.DataFrame(data)
+        columns, batches = await run_in_threadpool(_load_results, request)
 
-        # Create CSV in memory with optimization for large files
-        output = io.StringIO()
-        df.to_csv(output, index=False, chunksize=1000)
-        output.seek(0)
-
-        # Return as streaming response
+        # Stream CSV chunks straight from the row tuples
         return StreamingResponse(
-            iter([output.getvalue()]),
+            _release_after(iter_csv(columns, batches), ticket),
             media_type="text/csv",
             headers={
                 "Content-Disposition": f"attachment; filename={request.filename}.csv"
-            }
+            },
+            background=BackgroundTask(ticket.release)  # Also when the client leaves before the body starts
         )
 
     except HTTPException:
+        ticket.release()
         raise
     except Exception as e:
+        ticket.release()
         raise HTTPException(status_code=500, detail=f"Error creating CSV: {str(e)}")
 
 
@@ -74,41 +193,20 @@ async def download_excel(request: DownloadRequest):
     Download query results as Excel
 
     Args:
-        request: DownloadRequest with data/sql_query and filename
+        request: DownloadRequest with result_id/data/sql_query and filename
 
     Returns:
         Excel file download
     """
     try:
-        # Get data either from provided data or by executing query
-        if request.sql_query and request.table_name:
-            # Execute query on backend (efficient for large datasets)
-            data = db_service.execute_query(request.sql_query)
-            if not data:
-                raise HTTPException(status_code=400, detail="Query returned no results")
-        elif request.data:
-            # Use provided data (backward compatibility)
-            data = request.data
-        else:
-            raise HTTPException(status_code=400, detail="Either data or sql_query must be provided")
-
-        # Convert to DataFrame
-        df = pd.DataFrame(data)
-
-        # Create Excel in memory with optimization for large files
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # For very large datasets, you might want to add options like:
-            # - Split into multiple sheets if > 1M rows
-            # - Disable autofilter for performance
-            df.to_excel(writer, index=False, sheet_name='Results')
-
-            # Optional: Add some formatting for better readability
-            worksheet = writer.sheets['Results']
-            # Freeze the header row
-            worksheet.freeze_panes = 'A2'
-
-        output.seek(0)
+        async with admission.slot("export"):
+            columns, batches = await run_in_threadpool(_load_results, request)
+
+            with stage("encode"):
+                # Create Excel in memory, appending rows in write-only mode
+                output = io.BytesIO()
+                await run_in_threadpool(write_excel, output, columns, batches, sheet_name='Results')
+                output.seek(0)
 
         # Return as streaming response
         return StreamingResponse(
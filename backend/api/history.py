@@ -0,0 +1,104 @@
+from fastapi import APIRouter, HTTPException, Query
+from models.schemas import (
+    HistoryResponse, HistoryEntry, FingerprintStatsResponse, FingerprintStats,
+    TableUsageResponse, TableUsage
+)
+from services.container import get_container
+
+router = APIRouter()
+
+
+@router.get("/history", response_model=HistoryResponse)
+async def get_history(limit: int = Query(50, ge=1, le=1000)):
+    """
+    Get the most recently executed queries
+
+    Args:
+        limit: Maximum number of entries
+
+    Returns:
+        HistoryResponse with entries, newest first
+    """
+    container = get_container()
+    try:
+        entries = [HistoryEntry(**entry) for entry in container.query_history.recent(limit)]
+        return HistoryResponse(success=True, entries=entries)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching history: {str(e)}")
+
+
+@router.get("/history/slow", response_model=FingerprintStatsResponse)
+async def get_slow_queries(
+    hours: float = Query(24, gt=0),
+    limit: int = Query(20, ge=1, le=500)
+):
+    """
+    Get the slowest SQL fingerprints by p95 latency
+
+    Args:
+        hours: Look-back window in hours
+        limit: Maximum number of fingerprints
+
+    Returns:
+        FingerprintStatsResponse ordered slowest first
+    """
+    container = get_container()
+    try:
+        stats = container.query_history.fingerprint_stats(hours=hours, order_by="p95", limit=limit)
+        return FingerprintStatsResponse(
+            success=True,
+            hours=hours,
+            fingerprints=[FingerprintStats(**item) for item in stats]
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching slow queries: {str(e)}")
+
+
+@router.get("/history/fingerprints", response_model=FingerprintStatsResponse)
+async def get_fingerprints(
+    hours: float = Query(24, gt=0),
+    limit: int = Query(20, ge=1, le=500)
+):
+    """
+    Get p50/p95/p99 latency per SQL fingerprint
+
+    Args:
+        hours: Look-back window in hours
+        limit: Maximum number of fingerprints
+
+    Returns:
+        FingerprintStatsResponse ordered by query count
+    """
+    container = get_container()
+    try:
+        stats = container.query_history.fingerprint_stats(hours=hours, order_by="count", limit=limit)
+        return FingerprintStatsResponse(
+            success=True,
+            hours=hours,
+            fingerprints=[FingerprintStats(**item) for item in stats]
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching fingerprints: {str(e)}")
+
+
+@router.get("/history/tables", response_model=TableUsageResponse)
+async def get_table_usage(hours: float = Query(24, gt=0)):
+    """
+    Get query volume and time spent per table
+
+    Args:
+        hours: Look-back window in hours
+
+    Returns:
+        TableUsageResponse ordered by total time
+    """
+    container = get_container()
+    try:
+        tables = [TableUsage(**item) for item in container.query_history.table_stats(hours=hours)]
+        return TableUsageResponse(success=True, hours=hours, tables=tables)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching table usage: {str(e)}")
@@ -1,85 +1,210 @@
-from fastapi import APIRouter, HTTPException
-from models.schemas import QueryRequest, QueryResponse, ErrorResponse, TablesResponse, SchemaResponse, TableInfo
-from services import DatabaseService, LLMService, QueryExecutor
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from models.schemas import (
+    QueryRequest, QueryResponse, ErrorResponse, TablesResponse, SchemaResponse, TableInfo,
+    BatchQueryRequest, BatchQueryItem, BatchQueryResponse
+)
+from services import DatabaseService, QueryExecutor, ResultSet
+from services import json_encoding
+from services.admission import Overloaded, admission
+from services.metrics import stage, current_timer, ROWS_RETURNED
+from services.compression import strip_encoding_suffix
+from services.container import get_container
+import asyncio
+import hashlib
 import os
+import time
+from typing import Optional
 
 router = APIRouter()
 
-# Initialize services
-db_service = DatabaseService()
-llm_service = None  # Will be initialized when API key is available
 query_executor = QueryExecutor()
 
+# Rows per "rows" event in the streaming endpoint
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 500))
+
+# Concurrent LLM calls and query executions within one batch request
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", 8))
+BATCH_EXECUTION_CONCURRENCY = int(os.getenv("BATCH_EXECUTION_CONCURRENCY", DatabaseService.READ_POOL_SIZE))
+
 
 def get_llm_service():
     """Get or initialize LLM service"""
-    global llm_service
-    if llm_service is None:
-        try:
-            llm_service = LLMService()
-        except ValueError as e:
-            raise HTTPException(status_code=500, detail=str(e))
-    return llm_service
+    try:
+        return get_container().get_llm()
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Result shapes for /api/query, selected by ?format= or the Accept header
+RESULT_FORMATS = {
+    "records": "application/json",
+    "columnar": "application/vnd.analytics-gpt.columnar+json",
+    "column_major": "application/vnd.analytics-gpt.column-major+json",
+}
+
+
+def _negotiate_format(format_param: Optional[str], accept: str) -> str:
+    """Pick the result format from the query parameter, else the Accept header"""
+    if format_param:
+        if format_param not in RESULT_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported format '{format_param}'. Allowed: {', '.join(RESULT_FORMATS)}"
+            )
+        return format_param
+
+    for result_format, media_type in RESULT_FORMATS.items():
+        if media_type in accept and result_format != "records":
+            return result_format
+    return "records"
+
+
+def _result_fields(results: ResultSet, result_format: str) -> dict:
+    """Rows of a ResultSet in the payload layout of the negotiated format"""
+    if result_format == "records":
+        return {"results": results.records()}
+    if result_format == "column_major":
+        return {"columns": results.columns, "data": results.column_major()}
+    return {"columns": results.columns, "rows": results.rows}
 
 
 @router.post("/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
+async def process_query(
+    request: QueryRequest,
+    http_request: Request,
+    format: Optional[str] = Query(None, description="records (default), columnar or column_major")
+):
     """
     Process natural language query and return results
 
+    The default "records" shape returns one object per row. "columnar" returns
+    `columns` plus `rows` as arrays of values, and "column_major" returns
+    `columns` plus `data` with one array per column.
+
+    Results with more than RESULT_SPILL_ROWS rows are spilled to disk. The
+    response then carries only the first rows, the full row_count and a
+    result_id for /api/results paging and downloads.
+
+    With mode "approximate", or "auto" on a full scan of a very large table,
+    COUNT/SUM/AVG questions are estimated from the table's sample and the
+    response carries `approximation` with per-column error bounds. Asking
+    again with mode "exact" reruns the (cached) SQL on the full table.
+
     Args:
-        request: QueryRequest with question and table_name
+        request: QueryRequest with question, table_name and mode
+        http_request: Incoming request, for Accept header negotiation
+        format: Result shape (overrides the Accept header)
 
     Returns:
         QueryResponse with SQL query and results
     """
+    container = get_container()
+    result_format = _negotiate_format(format, http_request.headers.get("accept", ""))
+
     try:
-        # Check if table exists
-        if not db_service.table_exists(request.table_name):
-            raise HTTPException(
-                status_code=404,
-                detail=f"Table '{request.table_name}' not found"
-            )
+        with stage("catalog"):
+            # Check if table exists
+            if not container.db.table_exists(request.table_name):
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Table '{request.table_name}' not found"
+                )
+
+        # Tables moved to the archive are restored before anything reads them
+        restore_seconds = await run_in_threadpool(container.db.restore_table, request.table_name)
 
-        # Get table schema
-        schema = db_service.get_table_schema(request.table_name)
+        with stage("catalog"):
+            # Get table schema
+            schema = await run_in_threadpool(container.db.get_table_schema, request.table_name)
 
         # Get LLM service
         llm = get_llm_service()
 
-        # Generate SQL from natural language
-        sql_query = llm.generate_sql(
-            question=request.question,
-            table_name=request.table_name,
-            schema=schema,
-            sample_data=schema.get('sample_data', [])
-        )
+        # Generate SQL from natural language, reusing a cached answer if possible
+        sql_query = llm.lookup_cached_sql(request.question, request.table_name, schema)
+        cache_outcome = "hit" if sql_query else "miss"
+        if not sql_query:
+            async with admission.slot("llm"):
+                with stage("llm"):
+                    sql_query = await run_in_threadpool(
+                        llm.generate_sql,
+                        question=request.question,
+                        table_name=request.table_name,
+                        schema=schema,
+                        sample_data=schema.get('sample_data', []),
+                        use_cache=False
+                    )
 
         # Validate SQL
-        if not llm.validate_response(sql_query):
+        with stage("validate"):
+            is_valid_response = llm.validate_response(sql_query)
+        if not is_valid_response:
+            _capture_query(request, result_format, schema, sql_query, cache_outcome, 400)
             raise HTTPException(
                 status_code=400,
                 detail="Generated SQL query is invalid"
             )
 
-        # Execute query safely
-        results, execution_time, error = query_executor.execute_safe_query(
-            database_service=db_service,
-            sql=sql_query,
-            table_name=request.table_name
-        )
+        # Execute query safely, from the table's sample if the mode and cost gate allow
+        async with admission.slot("query", request.table_name):
+            results, execution_time, error, approximation = await run_in_threadpool(
+                query_executor.execute_approximate_query,
+                database_service=container.db,
+                sql=sql_query,
+                table_name=request.table_name,
+                mode=request.mode
+            )
 
         if error:
+            _record_history(request.question, sql_query, request.table_name, 0, cache_outcome, error)
+            _capture_query(request, result_format, schema, sql_query, cache_outcome, 400)
+            if cache_outcome == "hit":
+                llm.forget_sql(request.table_name, schema, sql_query)
             raise HTTPException(status_code=400, detail=error)
 
-        return QueryResponse(
-            success=True,
-            question=request.question,
-            sql_query=sql_query,
-            results=results,
-            row_count=len(results),
-            execution_time=execution_time
-        )
+        row_count = len(results)
+
+        llm.remember_sql(request.question, request.table_name, schema, sql_query)
+        ROWS_RETURNED.observe(row_count, {"endpoint": "query"})
+
+        # Keep large results on disk and send only the first rows inline
+        result_id = None
+        if container.result_store.should_spill(results):
+            with stage("spill"):
+                result_id = await run_in_threadpool(
+                    container.result_store.spill, results, sql_query, request.table_name
+                )
+            if result_id:
+                results = results[:container.result_store.SPILL_ROWS]
+
+        with stage("serialize"):
+            payload = {
+                "success": True,
+                "question": request.question,
+                "sql_query": sql_query
+            }
+            payload.update(_result_fields(results, result_format))
+            messages = []
+            if restore_seconds:
+                messages.append(f"Table '{request.table_name}' was restored from the archive in {restore_seconds:.2f}s")
+            if approximation:
+                messages.append(_approximation_message(approximation))
+            payload.update(
+                row_count=row_count,
+                execution_time=execution_time,
+                message=" ".join(messages) or None,
+                result_id=result_id,
+                approximation=approximation
+            )
+            body = json_encoding.dumps(payload)
+
+        _record_history(request.question, sql_query, request.table_name, row_count, cache_outcome)
+        _capture_query(request, result_format, schema, sql_query, cache_outcome, 200, row_count)
+
+        return Response(content=body, media_type=RESULT_FORMATS[result_format])
 
     except HTTPException:
         raise
@@ -87,16 +212,403 @@ async def process_query(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
+def _record_history(
+    question: str,
+    sql_query: str,
+    table_name: str,
+    row_count: int,
+    cache: str,
+    error: str = "",
+    stages: dict = None,
+    total_seconds: float = None
+):
+    """Queue an executed query for the history log, timed by the current request by default"""
+    container = get_container()
+    timer = current_timer()
+    if stages is None:
+        stages = dict(timer.stages) if timer else {}
+    if total_seconds is None:
+        total_seconds = timer.elapsed() if timer else sum(stages.values())
+
+    container.query_history.record(
+        question=question,
+        sql_query=sql_query,
+        table_name=table_name,
+        stages=stages,
+        total_seconds=total_seconds,
+        row_count=row_count,
+        cache=cache,
+        error=error
+    )
+
+
+def _capture_query(
+    request: QueryRequest,
+    result_format: str,
+    schema: dict,
+    sql_query: str,
+    cache: str,
+    status: int,
+    row_count: int = 0
+):
+    """Queue a /api/query request for the traffic capture file, if capture is on"""
+    container = get_container()
+    if not container.capture.enabled:
+        return
+    timer = current_timer()
+    container.capture.record(
+        question=request.question,
+        table_name=request.table_name,
+        schema=schema,
+        table_rows=container.db.table_row_count(request.table_name) or 0,
+        mode=request.mode,
+        result_format=result_format,
+        sql_query=sql_query,
+        cache=cache,
+        status=status,
+        row_count=row_count,
+        stages=dict(timer.stages) if timer else {},
+        total_seconds=timer.elapsed() if timer else 0.0
+    )
+
+
+def _approximation_message(approximation: dict) -> str:
+    return (
+        f"Estimated from a sample of {approximation['sample_rows']:,} of "
+        f"{approximation['table_rows']:,} rows; ask again with mode \"exact\" for the exact answer"
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json_encoding.dumps(data).decode('utf-8')}\n\n"
+
+
+@router.post("/query/stream")
+async def stream_query(request: QueryRequest):
+    """
+    Process natural language query, streaming progress as Server-Sent Events
+
+    Events, in order:
+        token   - {"text": ...} for each LLM completion delta
+        sql     - {"sql_query": ...} once the SQL is complete and validated
+        columns - {"columns": [...]} before the first batch of rows
+        rows    - {"rows": [[...], ...]} batches of rows fetched from the cursor
+        done    - {"row_count": ..., "execution_time": ..., "result_id": ...,
+                   "approximation": ..., "message": ...}
+        error   - {"detail": ...} terminates the stream on failure
+
+    Answers the mode allows to estimate come from the table's sample, as in
+    /api/query. Results larger than RESULT_SPILL_ROWS are still streamed in
+    full, and are also written to the result store while they stream, so
+    downloads read result_id instead of running the query again.
+
+    Args:
+        request: QueryRequest with question, table_name and mode
+
+    Returns:
+        text/event-stream response
+    """
+    container = get_container()
+    if not container.db.table_exists(request.table_name):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Table '{request.table_name}' not found"
+        )
+
+    # Restores the table first if it was archived, which can take a while
+    schema = await run_in_threadpool(container.db.get_table_schema, request.table_name)
+    llm = get_llm_service()
+
+    request_start = time.perf_counter()
+    sql_query = llm.lookup_cached_sql(request.question, request.table_name, schema)
+    cache_outcome = "hit" if sql_query else "miss"
+
+    # Shed before the stream starts; the query slot is taken once the SQL is ready
+    tickets = [await admission.acquire("llm")] if not sql_query else []
+
+    def release_tickets():
+        for ticket in tickets:
+            ticket.release()
+
+    def event_stream():
+        nonlocal sql_query
+        stages = {}
+        row_count = 0
+        spill = None
+
+        try:
+            if not sql_query:
+                for event, payload in llm.stream_sql(
+                    question=request.question,
+                    table_name=request.table_name,
+                    schema=schema,
+                    sample_data=schema.get('sample_data', []),
+                    use_cache=False
+                ):
+                    if event == "token":
+                        yield _sse_event("token", {"text": payload})
+                    else:
+                        sql_query = payload
+                release_tickets()
+            stages["llm"] = time.perf_counter() - request_start
+
+            if not llm.validate_response(sql_query):
+                yield _sse_event("error", {"detail": "Generated SQL query is invalid"})
+                return
+
+            is_valid, error_msg = query_executor.validate_query(sql_query, request.table_name)
+            if not is_valid:
+                yield _sse_event("error", {"detail": error_msg})
+                return
+
+            yield _sse_event("sql", {"sql_query": sql_query})
+
+            tickets.append(admission.acquire_blocking("query", request.table_name))
+            start_time = time.time()
+            columns_sent = False
+            held = []  # Rows kept until the result is large enough to spill
+
+            approximated = query_executor.approximate_query(
+                container.db, sql_query, request.table_name, request.mode
+            )
+            approximation = approximated[2] if approximated else None
+            if approximated:
+                results = approximated[0]
+                batches = [
+                    (results.columns, results.rows[start:start + STREAM_BATCH_SIZE])
+                    for start in range(0, max(len(results.rows), 1), STREAM_BATCH_SIZE)
+                ]
+            else:
+                batches = query_executor.stream_safe_query(
+                    database_service=container.db,
+                    sql=sql_query,
+                    table_name=request.table_name,
+                    batch_size=STREAM_BATCH_SIZE
+                )
+
+            for columns, rows in batches:
+                if not columns_sent:
+                    yield _sse_event("columns", {"columns": columns})
+                    columns_sent = True
+                if rows:
+                    row_count += len(rows)
+                    yield _sse_event("rows", {"rows": rows})
+                    if spill is not None:
+                        spill.write(rows)
+                    else:
+                        held.extend(rows)
+                        if row_count > container.result_store.SPILL_ROWS:
+                            spill = container.result_store.open_spill(columns, sql_query, request.table_name)
+                            spill.write(held)
+                            held = []
+            result_id = spill.finish() if spill is not None else None
+
+            llm.remember_sql(request.question, request.table_name, schema, sql_query)
+            ROWS_RETURNED.observe(row_count, {"endpoint": "query_stream"})
+
+            execution_time = time.time() - start_time
+            stages["execute"] = execution_time
+            _record_history(
+                request.question, sql_query, request.table_name, row_count, cache_outcome,
+                stages=stages, total_seconds=time.perf_counter() - request_start
+            )
+
+            yield _sse_event("done", {
+                "row_count": row_count,
+                "execution_time": f"{execution_time:.3f}s",
+                "result_id": result_id,
+                "approximation": approximation,
+                "message": _approximation_message(approximation) if approximation else None
+            })
+
+        except Overloaded as e:
+            yield _sse_event("error", {"detail": e.detail, "retry_after": e.retry_after})
+        except Exception as e:
+            if "llm" in stages:
+                # Generation finished, so the failure happened validating or executing
+                _record_history(
+                    request.question, sql_query, request.table_name, row_count, cache_outcome, str(e),
+                    stages=stages, total_seconds=time.perf_counter() - request_start
+                )
+                if cache_outcome == "hit":
+                    llm.forget_sql(request.table_name, schema, sql_query)
+            yield _sse_event("error", {"detail": f"Error processing query: {str(e)}"})
+        finally:
+            if spill is not None:
+                spill.abort()  # Unless finished
+            release_tickets()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering so events flush immediately
+        },
+        background=BackgroundTask(release_tickets)  # Also when the client leaves before the stream starts
+    )
+
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def process_batch_query(request: BatchQueryRequest):
+    """
+    Answer many natural language questions against one table
+
+    The schema is fetched once and shared. SQL generation runs with at most
+    BATCH_LLM_CONCURRENCY concurrent LLM calls, and execution runs in
+    parallel on pooled read-only connections, so the batch takes roughly as
+    long as its slowest question.
+
+    Args:
+        request: BatchQueryRequest with table_name and questions
+
+    Returns:
+        BatchQueryResponse with one result per question, in request order
+    """
+    container = get_container()
+    if not container.db.table_exists(request.table_name):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Table '{request.table_name}' not found"
+        )
+
+    try:
+        # Restores the table first if it was archived, which can take a while
+        schema = await run_in_threadpool(container.db.get_table_schema, request.table_name)
+        llm = get_llm_service()
+
+        llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+        execution_slots = asyncio.Semaphore(BATCH_EXECUTION_CONCURRENCY)
+        batch_start = time.time()
+
+        async def answer(question: str) -> BatchQueryItem:
+            start_time = time.time()
+            generation_time = 0.0
+            sql_query = None
+
+            try:
+                sql_query = llm.lookup_cached_sql(question, request.table_name, schema)
+                cache_outcome = "hit" if sql_query else "miss"
+                if not sql_query:
+                    async with llm_slots, admission.slot("llm"):
+                        sql_query = await run_in_threadpool(
+                            llm.generate_sql,
+                            question=question,
+                            table_name=request.table_name,
+                            schema=schema,
+                            sample_data=schema.get('sample_data', []),
+                            use_cache=False
+                        )
+                generation_time = time.time() - start_time
+
+                if not llm.validate_response(sql_query):
+                    raise ValueError("Generated SQL query is invalid")
+
+                async with execution_slots, admission.slot("query", request.table_name):
+                    execution_start = time.time()
+                    results, execution_time, error = await run_in_threadpool(
+                        query_executor.execute_safe_query,
+                        database_service=container.db,
+                        sql=sql_query,
+                        table_name=request.table_name
+                    )
+                    stages = {"llm": generation_time, "execute": time.time() - execution_start}
+
+                _record_history(
+                    question, sql_query, request.table_name, len(results), cache_outcome, error,
+                    stages=stages, total_seconds=time.time() - start_time
+                )
+
+                if error:
+                    if cache_outcome == "hit":
+                        llm.forget_sql(request.table_name, schema, sql_query)
+                    raise ValueError(error)
+
+                llm.remember_sql(question, request.table_name, schema, sql_query)
+                ROWS_RETURNED.observe(len(results), {"endpoint": "query_batch"})
+
+                return BatchQueryItem(
+                    success=True,
+                    question=question,
+                    sql_query=sql_query,
+                    results=results.records(),
+                    row_count=len(results),
+                    generation_time=f"{generation_time:.3f}s",
+                    execution_time=execution_time,
+                    total_time=f"{time.time() - start_time:.3f}s"
+                )
+
+            except Exception as e:
+                return BatchQueryItem(
+                    success=False,
+                    question=question,
+                    sql_query=sql_query,
+                    generation_time=f"{generation_time:.3f}s",
+                    total_time=f"{time.time() - start_time:.3f}s",
+                    error=str(e)
+                )
+
+        items = await asyncio.gather(*(answer(question) for question in request.questions))
+
+        return BatchQueryResponse(
+            success=all(item.success for item in items),
+            table_name=request.table_name,
+            results=items,
+            total_time=f"{time.time() - batch_start:.3f}s"
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing batch query: {str(e)}")
+
+
+def _etag(*parts: str) -> str:
+    """Strong ETag from version strings"""
+    return '"' + hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def _not_modified(http_request: Request, etag: str) -> bool:
+    """Check If-None-Match against an ETag, ignoring weak and compression markers"""
+    header = http_request.headers.get("if-none-match")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if strip_encoding_suffix(candidate) == etag:
+            return True
+    return False
+
+
+def _cache_headers(etag: str) -> dict:
+    # no-cache: browsers keep the body but revalidate it on every load
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
 @router.get("/tables", response_model=TablesResponse)
-async def get_tables():
+async def get_tables(http_request: Request, response: Response):
     """
     Get list of all uploaded tables
 
+    Carries an ETag derived from the catalog version; a matching
+    If-None-Match gets an empty 304 without reading the table list.
+
     Returns:
         TablesResponse with list of tables
     """
+    container = get_container()
     try:
-        tables = db_service.get_all_tables()
+        etag = _etag("tables", container.db.catalog_version())
+        if _not_modified(http_request, etag):
+            return Response(status_code=304, headers=_cache_headers(etag))
+        response.headers.update(_cache_headers(etag))
+
+        tables = container.db.get_all_tables()
 
         table_infos = [
             TableInfo(
@@ -115,30 +627,42 @@ async def get_tables():
 
 
 @router.get("/schema/{table_name}", response_model=SchemaResponse)
-async def get_schema(table_name: str):
+async def get_schema(table_name: str, http_request: Request, response: Response):
     """
     Get schema information for a specific table
 
+    Carries an ETag derived from the table version; a matching If-None-Match
+    gets an empty 304 without reading the schema or sample rows.
+
     Args:
         table_name: Name of the table
 
     Returns:
         SchemaResponse with schema information
     """
+    container = get_container()
     try:
-        if not db_service.table_exists(table_name):
+        version = container.db.table_version(table_name)
+        if version is not None:
+            etag = _etag("schema", table_name, version)
+            if _not_modified(http_request, etag):
+                return Response(status_code=304, headers=_cache_headers(etag))
+            response.headers.update(_cache_headers(etag))
+
+        if not container.db.table_exists(table_name):
             raise HTTPException(
                 status_code=404,
                 detail=f"Table '{table_name}' not found"
             )
 
-        schema = db_service.get_table_schema(table_name)
+        # Restores the table first if it was archived, which can take a while
+        schema = await run_in_threadpool(container.db.get_table_schema, table_name)
 
         return SchemaResponse(
             success=True,
             table_name=schema["table_name"],
             columns=schema["columns"],
-            sample_data=schema["sample_data"]
+            sample_data=schema["sample_data"].records()
         )
 
     except HTTPException:
@@ -158,14 +682,15 @@ async def delete_table(table_name: str):
     Returns:
         Success message
     """
+    container = get_container()
     try:
-        if not db_service.table_exists(table_name):
+        if not container.db.table_exists(table_name):
             raise HTTPException(
                 status_code=404,
                 detail=f"Table '{table_name}' not found"
             )
 
-        db_service.delete_table(table_name)
+        container.db.delete_table(table_name)
 
         return {"success": True, "message": f"Table '{table_name}' deleted successfully"}
 
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from models.schemas import ResultPageResponse
+from services import json_encoding
+from services.container import get_container
+from api.query import RESULT_FORMATS, _negotiate_format, _result_fields
+from typing import Optional
+
+router = APIRouter()
+
+
+@router.get("/results/{result_id}", response_model=ResultPageResponse)
+async def get_result_page(
+    result_id: str,
+    http_request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=50000),
+    format: Optional[str] = Query(None, description="records (default), columnar or column_major")
+):
+    """
+    Get a page of rows from a spilled query result
+
+    Args:
+        result_id: Id from a /api/query response
+        http_request: Incoming request, for Accept header negotiation
+        offset: Index of the first row
+        limit: Maximum number of rows
+        format: Result shape (overrides the Accept header)
+
+    Returns:
+        ResultPageResponse with the requested rows
+    """
+    container = get_container()
+    result_format = _negotiate_format(format, http_request.headers.get("accept", ""))
+
+    try:
+        page = await run_in_threadpool(container.result_store.page, result_id, offset, limit)
+        if page is None:
+            raise HTTPException(status_code=404, detail=f"Result '{result_id}' not found or expired")
+
+        payload = {"success": True, "result_id": result_id, "offset": offset, "row_count": len(page)}
+        payload.update(_result_fields(page, result_format))
+
+        return Response(content=json_encoding.dumps(payload), media_type=RESULT_FORMATS[result_format])
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading result: {str(e)}")
+
+
+@router.delete("/results/{result_id}")
+async def delete_result(result_id: str):
+    """
+    Delete a spilled query result before it expires
+
+    Args:
+        result_id: Id from a /api/query response
+
+    Returns:
+        Success message
+    """
+    container = get_container()
+    if not await run_in_threadpool(container.result_store.delete, result_id):
+        raise HTTPException(status_code=404, detail=f"Result '{result_id}' not found")
+
+    return {"success": True, "message": f"Result '{result_id}' deleted"}
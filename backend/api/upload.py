@@ -1,15 +1,14 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from models.schemas import UploadResponse, ErrorResponse
-from services import DatabaseService, FileParserService
+from services.container import get_container
+from services.admission import admission
+from services.metrics import stage
 import os
 import uuid
 
 router = APIRouter()
 
-# Initialize services
-db_service = DatabaseService()
-file_parser = FileParserService()
-
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_file(file: UploadFile = File(...)):
@@ -22,26 +21,28 @@ async def upload_file(file: UploadFile = File(...)):
     Returns:
         UploadResponse with table information
     """
+    container = get_container()
     try:
         # Validate file
-        is_valid, error_msg = file_parser.validate_file(file)
+        is_valid, error_msg = container.file_parser.validate_file(file)
         if not is_valid:
             raise HTTPException(status_code=400, detail=error_msg)
 
-        # Generate table name
-        table_name = file_parser.generate_table_name(file.filename)
-
-        # Check if table already exists
-        if db_service.table_exists(table_name):
-            # Add unique suffix
-            table_name = f"{table_name}_{uuid.uuid4().hex[:6]}"
+        # Generate table name, with a unique suffix if it is taken
+        base_name = container.file_parser.generate_table_name(file.filename)
 
-        # Save and parse file
-        save_path = os.path.join("backend/uploads", f"{uuid.uuid4().hex}_{file.filename}")
-        df = await file_parser.parse_file(file, save_path)
+        with container.db.reserve_table_name(base_name) as table_name:
+            # Wait for an upload slot and memory for the DataFrame, or shed the request
+            async with admission.upload(file.size or container.file_parser.MAX_FILE_SIZE):
+                # Save and parse file
+                save_path = os.path.join("backend/uploads", f"{uuid.uuid4().hex}_{file.filename}")
+                with stage("parse"):
+                    df = await container.file_parser.parse_file(file, save_path)
 
-        # Create table in database
-        table_info = db_service.create_table_from_dataframe(df, table_name)
+                # Create table in database
+                with stage("store"):
+                    table_info = await run_in_threadpool(container.db.create_table_from_dataframe, df, table_name)
+                del df  # Free the DataFrame before its memory reservation ends
 
         # Clean up uploaded file
         try:
@@ -55,10 +56,12 @@ async def upload_file(file: UploadFile = File(...)):
             rows_count=table_info["rows_count"],
             columns=table_info["columns"],
             table_schema=table_info["schema"],
-            preview=table_info["preview"],
+            preview=table_info["preview"].records(),
             message=f"Successfully uploaded {file.filename} as table '{table_name}'"
         )
 
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
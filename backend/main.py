@@ -1,8 +1,19 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
-from api import upload, query, download
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from api import upload, query, download, history, results
+from services.database import ReadConnectionPool
+from services.query_executor import QueryExecutor
+from services.admission import admission
+from services.container import get_container
+from services.compression import CompressionMiddleware
+from services.workers import WORKERS
+from services.metrics import (
+    metrics, start_request_timer, end_request_timer,
+    REQUEST_DURATION, REQUESTS_TOTAL, RESPONSE_BYTES
+)
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -14,11 +25,23 @@ BACKEND_DIR = Path(__file__).resolve().parent
 # Load environment variables from project root
 load_dotenv(BASE_DIR / ".env")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the shared services and start background storage maintenance"""
+    container = get_container()
+    container.start()
+    yield
+    # Write any queued query history and table access times before exiting
+    container.close()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Analytics GPT API",
     description="Natural Language to SQL Query Interface",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware - Allow frontend to communicate with backend
@@ -30,10 +53,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON and streamed downloads (brotli when installed, else gzip)
+app.add_middleware(CompressionMiddleware)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time each request and report its stages in a Server-Timing header"""
+    timer, token = start_request_timer()
+    try:
+        response = await call_next(request)
+    finally:
+        end_request_timer(token)
+
+    # Label by route handler name to keep label cardinality bounded
+    endpoint = request.scope.get("endpoint")
+    label = getattr(endpoint, "__name__", "other")
+
+    response.headers["Server-Timing"] = timer.server_timing()
+    REQUEST_DURATION.observe(timer.elapsed(), {"endpoint": label})
+    REQUESTS_TOTAL.inc(labels={"endpoint": label, "status": str(response.status_code)})
+
+    content_length = response.headers.get("content-length")
+    if content_length:
+        RESPONSE_BYTES.observe(int(content_length), {"endpoint": label})
+
+    return response
+
+
 # Include API routers
 app.include_router(upload.router, prefix="/api", tags=["Upload"])
 app.include_router(query.router, prefix="/api", tags=["Query"])
 app.include_router(download.router, prefix="/api", tags=["Download"])
+app.include_router(history.router, prefix="/api", tags=["History"])
+app.include_router(results.router, prefix="/api", tags=["Results"])
 
 # Create necessary directories
 os.makedirs(BACKEND_DIR / "uploads", exist_ok=True)
@@ -57,6 +109,162 @@ async def health_check():
     return {"status": "healthy", "message": "Analytics GPT API is running"}
 
 
+def _cache_samples():
+    """Hit/miss counters for the question and validation caches"""
+    samples = [
+        ({"cache": "validation", "outcome": "hit"}, QueryExecutor.validation_cache_hits),
+        ({"cache": "validation", "outcome": "miss"}, QueryExecutor.validation_cache_misses),
+    ]
+    llm = get_container().llm
+    if llm is not None:
+        stats = llm.question_cache.stats()
+        samples += [
+            ({"cache": "question", "outcome": "hit"}, stats["hits"]),
+            ({"cache": "question", "outcome": "miss"}, stats["misses"]),
+        ]
+    return samples
+
+
+def _cache_hit_ratios():
+    """Hit ratio per cache, derived from _cache_samples"""
+    totals = {}
+    for labels, value in _cache_samples():
+        hits, lookups = totals.get(labels["cache"], (0, 0))
+        if labels["outcome"] == "hit":
+            hits += value
+        totals[labels["cache"]] = (hits, lookups + value)
+    return [({"cache": cache}, hits / lookups) for cache, (hits, lookups) in totals.items() if lookups]
+
+
+def _pool_samples():
+    """Read connection pool utilization across all database services"""
+    pools = list(ReadConnectionPool.all_pools)
+    return [
+        ({"state": "in_use"}, sum(pool.in_use for pool in pools)),
+        ({"state": "idle"}, sum(pool.idle for pool in pools)),
+        ({"state": "capacity"}, sum(pool.size for pool in pools)),
+    ]
+
+
+def _spill_samples():
+    """Spilled query results kept on disk"""
+    usage = get_container().result_store.usage()
+    return [({"unit": "results"}, usage["results"]), ({"unit": "bytes"}, usage["bytes"])]
+
+
+def _hot_table_samples():
+    """In-memory hot tier usage"""
+    stats = get_container().db.hot_tables.stats()
+    return [
+        ({"unit": "tables"}, len(stats["tables"])),
+        ({"unit": "bytes"}, stats["used_bytes"]),
+        ({"unit": "budget_bytes"}, stats["budget_bytes"]),
+    ]
+
+
+def _hot_table_events():
+    """Hot tier promotions, demotions and queries served from memory"""
+    stats = get_container().db.hot_tables.stats()
+    return [({"event": event}, stats[event]) for event in ("promotions", "demotions", "hot_hits")]
+
+
+def _storage_samples():
+    """Disk used by table files, the cold archive and the stores counted against the budget"""
+    usage = get_container().db.storage.usage()
+    tiers = ("live", "archive", "columnar", "rollup", "results", "history", "question_cache", "total", "budget")
+    return [({"tier": tier}, usage[f"{tier}_bytes"]) for tier in tiers]
+
+
+def _storage_events():
+    """Tables archived, restored or failed to archive, and columnar copies and rollups dropped for space"""
+    usage = get_container().db.storage.usage()
+    return [({"event": event}, usage[event]) for event in ("archived", "rehydrated", "derived_dropped", "failed_archives")]
+
+
+def _rollup_samples():
+    """Precomputed rollups and the groups they hold"""
+    stats = get_container().db.rollups.stats()
+    groups = sum(rollup["groups"] for rollups in stats["tables"].values() for rollup in rollups)
+    return [({"unit": "rollups"}, stats["rollups"]), ({"unit": "groups"}, groups)]
+
+
+def _rollup_events():
+    """Aggregate queries answered from a rollup or the table, and rollups built or failed"""
+    stats = get_container().db.rollups.stats()
+    return [({"event": event}, stats[event]) for event in ("routed", "misses", "builds", "failures")]
+
+
+def _engine_events():
+    """Queries answered by the columnar engine, fallbacks to SQLite, and columnar copies built or failed"""
+    stats = get_container().db.columnar.stats()
+    return [({"event": event}, stats[event]) for event in ("queries", "fallbacks", "builds", "failures")]
+
+
+def _admission_samples():
+    """Slots in use and requests queued per admission pool"""
+    samples = []
+    for pool, stats in admission.stats().items():
+        samples.append(({"pool": pool, "state": "active"}, stats["active"]))
+        samples.append(({"pool": pool, "state": "queued"}, stats["queued"]))
+    return samples
+
+
+def _admission_events():
+    """Requests admitted and shed per admission pool"""
+    samples = []
+    for pool, stats in admission.stats().items():
+        samples.append(({"pool": pool, "outcome": "admitted"}, stats["admitted"]))
+        samples += [({"pool": pool, "outcome": reason}, count) for reason, count in stats["rejected"].items()]
+    return samples
+
+
+metrics.register_callback(
+    "analytics_gpt_cache_lookups_total", "Cache lookups by cache and outcome", "counter", _cache_samples
+)
+metrics.register_callback(
+    "analytics_gpt_cache_hit_ratio", "Fraction of cache lookups that hit", "gauge", _cache_hit_ratios
+)
+metrics.register_callback(
+    "analytics_gpt_read_pool_connections", "Read-only SQLite connections by state", "gauge", _pool_samples
+)
+metrics.register_callback(
+    "analytics_gpt_result_spill_usage", "Spilled query results on disk, as a count and in bytes", "gauge", _spill_samples
+)
+metrics.register_callback(
+    "analytics_gpt_hot_tables", "In-memory hot tier usage", "gauge", _hot_table_samples
+)
+metrics.register_callback(
+    "analytics_gpt_hot_table_events_total", "Hot tier promotions, demotions and hits", "counter", _hot_table_events
+)
+metrics.register_callback(
+    "analytics_gpt_table_storage_bytes", "Disk used under the database directory, by store", "gauge", _storage_samples
+)
+metrics.register_callback(
+    "analytics_gpt_table_lifecycle_total", "Tables archived, restored and failed to archive, derived copies dropped", "counter", _storage_events
+)
+metrics.register_callback(
+    "analytics_gpt_rollups", "Precomputed rollups and their groups", "gauge", _rollup_samples
+)
+metrics.register_callback(
+    "analytics_gpt_rollup_events_total", "Aggregate queries routed to rollups, misses, builds and failed builds", "counter", _rollup_events
+)
+metrics.register_callback(
+    "analytics_gpt_admission_slots", "Admission slots in use and requests queued by pool", "gauge", _admission_samples
+)
+metrics.register_callback(
+    "analytics_gpt_admission_requests_total", "Requests admitted and shed by pool and reason", "counter", _admission_events
+)
+metrics.register_callback(
+    "analytics_gpt_columnar_events_total", "Columnar engine queries, SQLite fallbacks, copies built and failed copies", "counter", _engine_events
+)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -99,5 +307,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=port,
         reload=not is_production,  # Only auto-reload in development
+        workers=WORKERS if is_production else None,  # WEB_CONCURRENCY; reload runs a single process
         log_level="info"
     )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 from datetime import datetime
 
 
@@ -18,6 +18,17 @@ class QueryRequest(BaseModel):
     """Request model for natural language query"""
     question: str = Field(..., min_length=1, description="Natural language question")
     table_name: str = Field(..., min_length=1, description="Target table name")
+    mode: Literal["auto", "exact", "approximate"] = Field(
+        "auto", description="exact, approximate (answer from the table's sample) or auto (sample only for large scans)"
+    )
+
+
+class Approximation(BaseModel):
+    """How an approximate answer was estimated"""
+    sample_rows: int
+    table_rows: int
+    confidence: float
+    error_bounds: Dict[str, List[Optional[float]]]  # Column -> ± half-width of the confidence interval per row
 
 
 class QueryResponse(BaseModel):
@@ -29,6 +40,44 @@ class QueryResponse(BaseModel):
     row_count: int
     execution_time: str
     message: Optional[str] = None
+    result_id: Optional[str] = None  # Set when the full result was spilled; page it via /api/results/{result_id}
+    approximation: Optional[Approximation] = None  # Set when estimated from a sample; ask again with mode "exact"
+
+
+class ResultPageResponse(BaseModel):
+    """Response model for a page of a spilled result"""
+    success: bool
+    result_id: str
+    offset: int
+    row_count: int
+    results: List[Dict[str, Any]]
+
+
+class BatchQueryRequest(BaseModel):
+    """Request model for answering many questions against one table"""
+    table_name: str = Field(..., min_length=1, description="Target table name")
+    questions: List[str] = Field(..., min_length=1, max_length=200, description="Natural language questions")
+
+
+class BatchQueryItem(BaseModel):
+    """Result of a single question within a batch"""
+    success: bool
+    question: str
+    sql_query: Optional[str] = None
+    results: List[Dict[str, Any]] = []
+    row_count: int = 0
+    generation_time: str = "0s"
+    execution_time: str = "0s"
+    total_time: str = "0s"
+    error: Optional[str] = None
+
+
+class BatchQueryResponse(BaseModel):
+    """Response model for batch query execution"""
+    success: bool
+    table_name: str
+    results: List[BatchQueryItem]
+    total_time: str
 
 
 class TableInfo(BaseModel):
@@ -58,3 +107,65 @@ class ErrorResponse(BaseModel):
     success: bool = False
     error: str
     details: Optional[str] = None
+
+
+class HistoryEntry(BaseModel):
+    """A single executed query from the history log"""
+    created_at: str
+    question: Optional[str] = None
+    sql_query: Optional[str] = None
+    fingerprint: Optional[str] = None
+    table_name: Optional[str] = None
+    stages: Dict[str, float] = {}
+    total_ms: float
+    execution_ms: float
+    row_count: int
+    cache: Optional[str] = None
+    success: bool
+    error: Optional[str] = None
+
+
+class HistoryResponse(BaseModel):
+    """Response model for recent query history"""
+    success: bool
+    entries: List[HistoryEntry]
+
+
+class FingerprintStats(BaseModel):
+    """Latency statistics for one normalized SQL shape"""
+    fingerprint: str
+    normalized_sql: str
+    tables: List[str]
+    count: int
+    avg_rows: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    execution_p50_ms: float
+    execution_p95_ms: float
+    execution_p99_ms: float
+
+
+class FingerprintStatsResponse(BaseModel):
+    """Response model for per-fingerprint latency statistics"""
+    success: bool
+    hours: float
+    fingerprints: List[FingerprintStats]
+
+
+class TableUsage(BaseModel):
+    """Query volume and time spent against one table"""
+    table_name: Optional[str] = None
+    query_count: int
+    fingerprints: int
+    total_ms: float
+    avg_ms: float
+    execution_ms: float
+
+
+class TableUsageResponse(BaseModel):
+    """Response model for per-table query usage"""
+    success: bool
+    hours: float
+    tables: List[TableUsage]
@@ -1,4 +1,16 @@
+from .container import ServiceContainer, get_container
 from .database import DatabaseService
+from .engines import ColumnarEngine
 from .file_parser import FileParserService
+from .hot_tables import HotTableCache
 from .llm_service import LLMService
 from .query_executor import QueryExecutor
+from .question_cache import QuestionCache
+from .query_history import QueryHistoryStore
+from .result_set import ResultSet
+from .result_store import ResultStore
+from .rollups import RollupManager
+from .sampling import SampleTable
+from .storage_manager import StorageManager
+from .text_search import TextSearchIndex
+from .traffic_capture import TrafficCapture
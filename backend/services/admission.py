@@ -0,0 +1,415 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from .database import DatabaseService
+from .metrics import current_timer, metrics
+from .workers import per_worker
+
+QUEUE_WAIT = metrics.histogram(
+    "analytics_gpt_admission_wait_seconds",
+    "Time requests waited for an admission slot, by pool"
+)
+
+MB = 1024 * 1024
+
+
+class Overloaded(HTTPException):
+    """
+    Request shed by admission control
+
+    429 when a pool's queue is full, 503 when the wait for a slot timed out
+    or the process is out of memory. Retry-After tells the client when a
+    slot is likely to be free.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A queued acquire, woken from whichever thread releases capacity"""
+
+    __slots__ = ("cost", "granted", "_loop", "_future", "_event")
+
+    def __init__(self, cost: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.cost = cost
+        self.granted = False
+        self._loop = loop
+        self._future = loop.create_future() if loop is not None else None
+        self._event = threading.Event() if loop is None else None
+
+    def notify(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake)
+        else:
+            self._event.set()
+
+    def _wake(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait_async(self, timeout: float):
+        await asyncio.wait_for(asyncio.shield(self._future), timeout)
+
+    def wait(self, timeout: float) -> bool:
+        return self._event.wait(timeout)
+
+
+class AdmissionPool:
+    """
+    Bounded concurrency with a bounded FIFO queue
+
+    Capacity is counted in units: one per request for the concurrency pools,
+    megabytes for the upload memory pool. Slots can be acquired from the
+    event loop or from worker threads (streaming responses run there) and
+    released from either.
+    """
+
+    def __init__(self, name: str, capacity: int, queue_length: int, timeout: float):
+        """
+        Args:
+            name: Pool name, used in metrics and error messages
+            capacity: Units that may be held at once
+            queue_length: Requests that may wait for capacity; more are rejected with 429
+            timeout: Seconds a request waits before it is rejected with 503
+        """
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.queue_length = queue_length
+        self.timeout = timeout
+
+        self.active = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "timeout": 0, "memory": 0}
+
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self._hold_seconds = 1.0  # Moving average of how long a slot is held
+
+    def _admit_now(self, cost: int) -> bool:
+        """Take capacity at once if nobody is queued; False means wait (lock held)"""
+        if not self._waiters and self.active + cost <= self.capacity:
+            self.active += cost
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.queue_length:
+            self.rejected["queue_full"] += 1
+            raise Overloaded(429, f"Too many {self.name} requests queued, try again later", self.retry_after())
+        return False
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new request has likely drained"""
+        rounds = (len(self._waiters) + 1) / self.capacity
+        return max(1, math.ceil(rounds * self._hold_seconds))
+
+    async def acquire(self, cost: int = 1) -> float:
+        """
+        Wait for capacity from the event loop
+
+        Args:
+            cost: Units to take, capped at the pool's capacity
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            Overloaded: If the queue is full or the wait times out
+        """
+        cost = min(cost, self.capacity)
+        start = time.perf_counter()
+        with self._lock:
+            if self._admit_now(cost):
+                return self._waited(start)
+            waiter = _Waiter(cost, asyncio.get_running_loop())
+            self._waiters.append(waiter)
+        try:
+            await waiter.wait_async(self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            self._abandon(waiter)  # Client went away while queued
+            raise
+        self._settle(waiter)
+        return self._waited(start)
+
+    def acquire_blocking(self, cost: int = 1) -> float:
+        """acquire() for code running in a worker thread"""
+        cost = min(cost, self.capacity)
+        start = time.perf_counter()
+        with self._lock:
+            if self._admit_now(cost):
+                return self._waited(start)
+            waiter = _Waiter(cost)
+            self._waiters.append(waiter)
+        waiter.wait(self.timeout)
+        self._settle(waiter)
+        return self._waited(start)
+
+    def _settle(self, waiter: _Waiter):
+        """Keep a granted slot, or leave the queue and reject after a timeout"""
+        with self._lock:
+            if waiter.granted:
+                return
+            self._waiters.remove(waiter)
+            self.rejected["timeout"] += 1
+            retry_after = self.retry_after()
+        raise Overloaded(503, f"Timed out waiting for a {self.name} slot, try again later", retry_after)
+
+    def _abandon(self, waiter: _Waiter):
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return
+        self.release(waiter.cost)
+
+    def _waited(self, start: float) -> float:
+        seconds = time.perf_counter() - start
+        QUEUE_WAIT.observe(seconds, {"pool": self.name})
+        timer = current_timer()
+        if timer is not None and seconds >= 0.001:
+            timer.add("queue", seconds)
+        return seconds
+
+    def release(self, cost: int = 1, held_seconds: Optional[float] = None):
+        """
+        Return capacity and hand it to queued requests in order
+
+        Args:
+            cost: Units taken by acquire()
+            held_seconds: How long the slot was held, for Retry-After estimates
+        """
+        cost = min(cost, self.capacity)
+        with self._lock:
+            self.active -= cost
+            if held_seconds is not None:
+                self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held_seconds
+            while self._waiters and self.active + self._waiters[0].cost <= self.capacity:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self.active += waiter.cost
+                self.admitted += 1
+                waiter.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "active": self.active,
+                "queued": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+            }
+
+
+def _resident_mb() -> Optional[float]:
+    """Resident set size of this process in MB, where /proc is available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class AdmissionController:
+    """
+    Admission control and load shedding for expensive request stages
+
+    Each kind of work gets its own pool, so a burst of uploads cannot starve
+    queries and slow LLM calls do not hold execution slots:
+
+    - llm: SQL generation calls (ADMISSION_LLM_CONCURRENCY, default 16)
+    - query: query execution (ADMISSION_QUERY_CONCURRENCY, default READ_POOL_SIZE)
+    - upload: file parsing and table creation (ADMISSION_UPLOAD_CONCURRENCY, default 2)
+    - export: downloads, for as long as the file streams (ADMISSION_EXPORT_CONCURRENCY, default 2)
+
+    Each pool has a queue of ADMISSION_<POOL>_QUEUE requests (default four
+    per slot) that wait at most ADMISSION_<POOL>_TIMEOUT seconds. Uploads
+    also reserve an estimate of their DataFrame's size from
+    ADMISSION_UPLOAD_MEMORY_MB, and with ADMISSION_MAX_RSS_MB set, query,
+    upload and export work is shed while the process is above that size.
+
+    Pools are per worker process. With WEB_CONCURRENCY workers, the default
+    llm, upload and export concurrency and upload memory are divided
+    between them.
+
+    Queries also take a slot of their table's pool first: one table may use
+    at most ADMISSION_TABLE_CONCURRENCY query slots (default half).
+    """
+
+    MAX_RSS_MB = float(os.getenv("ADMISSION_MAX_RSS_MB", 0))  # 0 disables the check
+    UPLOAD_MEMORY_MB = int(os.getenv("ADMISSION_UPLOAD_MEMORY_MB", per_worker(1024)))
+
+    # Parsed DataFrames take several times the size of the file
+    UPLOAD_MEMORY_FACTOR = 6
+
+    # Pool -> (default concurrency, default timeout in seconds). Limits on
+    # shared resources (the OpenAI rate limit, memory) are split between workers.
+    DEFAULTS = {
+        "llm": (per_worker(16), 30.0),
+        "query": (DatabaseService.READ_POOL_SIZE, 10.0),
+        "upload": (per_worker(2), 60.0),
+        "export": (per_worker(2), 30.0),
+    }
+    MEMORY_BOUND = {"query", "upload", "export"}
+
+    # Query slots one table may hold, so a burst against one table leaves room for the others
+    TABLE_CONCURRENCY = int(os.getenv("ADMISSION_TABLE_CONCURRENCY", max(1, DEFAULTS["query"][0] // 2)))
+
+    def __init__(self):
+        self.pools: Dict[str, AdmissionPool] = {}
+        for name, (concurrency, timeout) in self.DEFAULTS.items():
+            prefix = f"ADMISSION_{name.upper()}"
+            concurrency = int(os.getenv(f"{prefix}_CONCURRENCY", concurrency))
+            self.pools[name] = AdmissionPool(
+                name,
+                concurrency,
+                int(os.getenv(f"{prefix}_QUEUE", 4 * concurrency)),
+                float(os.getenv(f"{prefix}_TIMEOUT", timeout))
+            )
+        self.memory = AdmissionPool(
+            "upload_memory", self.UPLOAD_MEMORY_MB, 4 * self.pools["upload"].capacity,
+            self.pools["upload"].timeout
+        )
+        self._table_pools: Dict[str, AdmissionPool] = {}
+        self._tables_lock = threading.Lock()
+
+    def _check_memory(self, pool: AdmissionPool):
+        if not self.MAX_RSS_MB or pool.name not in self.MEMORY_BOUND:
+            return
+        resident = _resident_mb()
+        if resident is not None and resident > self.MAX_RSS_MB:
+            with pool._lock:
+                pool.rejected["memory"] += 1
+            raise Overloaded(503, "Server is low on memory, try again later", pool.retry_after())
+
+    def _pools_for(self, name: str, table_name: Optional[str]) -> List[AdmissionPool]:
+        """Pools a request takes slots from: the table's own pool first for queries"""
+        pool = self.pools[name]
+        self._check_memory(pool)
+        if name != "query" or not table_name or self.TABLE_CONCURRENCY >= pool.capacity:
+            return [pool]
+        with self._tables_lock:
+            table_pool = self._table_pools.get(table_name)
+            if table_pool is None:
+                table_pool = self._table_pools[table_name] = AdmissionPool(
+                    f"'{table_name}' query", self.TABLE_CONCURRENCY, pool.queue_length, pool.timeout
+                )
+        return [table_pool, pool]
+
+    @asynccontextmanager
+    async def slot(self, name: str, table_name: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        Hold a slot of the named pool for the duration of the block
+
+        Args:
+            name: Pool name
+            table_name: Table a query reads, for the per-table limit
+
+        Raises:
+            Overloaded: If the request is shed
+        """
+        ticket = await self.acquire(name, table_name)
+        try:
+            yield
+        finally:
+            ticket.release()
+
+    async def acquire(self, name: str, table_name: Optional[str] = None) -> "Ticket":
+        """
+        Take a slot of the named pool to hand to a streaming response
+
+        Returns:
+            Ticket whose release() frees the slot, e.g. as the response's
+            background task once the stream is sent
+        """
+        ticket = Ticket()
+        try:
+            for pool in self._pools_for(name, table_name):
+                await pool.acquire()
+                ticket.pools.append(pool)
+        except BaseException:
+            ticket.release()
+            raise
+        return ticket
+
+    def acquire_blocking(self, name: str, table_name: Optional[str] = None) -> "Ticket":
+        """acquire() for code running in a worker thread"""
+        ticket = Ticket()
+        try:
+            for pool in self._pools_for(name, table_name):
+                pool.acquire_blocking()
+                ticket.pools.append(pool)
+        except BaseException:
+            ticket.release()
+            raise
+        return ticket
+
+    @asynccontextmanager
+    async def upload(self, size: int) -> AsyncIterator[None]:
+        """
+        Admit an upload: reserve memory for its DataFrame, then an upload slot
+
+        Args:
+            size: Upload size in bytes (the largest allowed file size if unknown)
+
+        Raises:
+            Overloaded: If the request is shed
+        """
+        megabytes = math.ceil(size * self.UPLOAD_MEMORY_FACTOR / MB)
+        self._check_memory(self.pools["upload"])
+        await self.memory.acquire(megabytes)
+        start = time.perf_counter()
+        try:
+            async with self.slot("upload"):
+                yield
+        finally:
+            self.memory.release(megabytes, held_seconds=time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-pool capacity, usage, queue depth and counters"""
+        stats = {name: pool.stats() for name, pool in self.pools.items()}
+        stats[self.memory.name] = self.memory.stats()
+        with self._tables_lock:
+            tables = [pool.stats() for pool in self._table_pools.values()]
+        stats["query_per_table"] = {
+            "capacity": self.TABLE_CONCURRENCY,
+            "active": sum(table["active"] for table in tables),
+            "queued": sum(table["queued"] for table in tables),
+            "admitted": sum(table["admitted"] for table in tables),
+            "rejected": {
+                reason: sum(table["rejected"][reason] for table in tables)
+                for reason in ("queue_full", "timeout", "memory")
+            },
+        }
+        return stats
+
+
+class Ticket:
+    """Admission slots held by one request, released once"""
+
+    def __init__(self):
+        self.pools: List[AdmissionPool] = []
+        self._start = time.perf_counter()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        held = time.perf_counter() - self._start
+        for pool in reversed(self.pools):
+            pool.release(held_seconds=held)
+
+
+admission = AdmissionController()
@@ -0,0 +1,174 @@
+import os
+import zlib
+from typing import List, Optional
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip is used when brotli is not installed
+    brotli = None
+
+# Media types that are already compressed or must not be buffered
+_SKIP_PREFIXES = ("image/", "video/", "audio/", "text/event-stream")
+_SKIP_TYPES = {
+    "application/zip",
+    "application/gzip",
+    "application/vnd.apache.parquet",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _accepted_encodings(header: str) -> List[str]:
+    """Encodings listed in Accept-Encoding, excluding any with q=0"""
+    encodings = []
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if name and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.append(name.lower())
+    return encodings
+
+
+class _Gzip:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    name = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip
+
+    Bodies sent in one piece are only compressed above MINIMUM_SIZE bytes.
+    Streamed bodies (downloads) are compressed chunk by chunk as they are
+    sent. Server-sent events and formats that are already compressed
+    (Parquet, Excel, images) pass through untouched.
+    """
+
+    MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024))
+    GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = self.MINIMUM_SIZE if minimum_size is None else minimum_size
+
+    def _choose_encoder(self, accept_encoding: str):
+        accepted = _accepted_encodings(accept_encoding)
+        if brotli is not None and "br" in accepted:
+            return _Brotli(self.BROTLI_QUALITY)
+        if "gzip" in accepted:
+            return _Gzip(self.GZIP_LEVEL)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        accept_encoding = headers.get(b"accept-encoding", b"").decode("latin-1")
+        if not accept_encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if encoder is None:
+                # First body chunk: decide whether to compress
+                response_headers = {key.lower(): value for key, value in start_message["headers"]}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip()
+                compressible = (
+                    start_message["status"] not in (204, 304)
+                    and b"content-encoding" not in response_headers
+                    and not content_type.startswith(_SKIP_PREFIXES)
+                    and content_type not in _SKIP_TYPES
+                    and (more_body or len(body) >= self.minimum_size)
+                )
+                encoder = self._choose_encoder(accept_encoding) if compressible else None
+
+                if encoder is None:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                new_headers = [
+                    (key, value) for key, value in start_message["headers"]
+                    if key.lower() not in (b"content-length", b"etag")
+                ]
+                new_headers.append((b"content-encoding", encoder.name.encode("latin-1")))
+                new_headers.append((b"vary", b"Accept-Encoding"))
+                if b"etag" in response_headers:
+                    new_headers.append((b"etag", _encoded_etag(response_headers[b"etag"], encoder.name)))
+
+                data = encoder.compress(body)
+                if not more_body:
+                    data += encoder.finish()
+                    new_headers.append((b"content-length", str(len(data)).encode("latin-1")))
+
+                await send({**start_message, "headers": new_headers})
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            data = encoder.compress(body)
+            if not more_body:
+                data += encoder.finish()
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+        # Response without a body message (should not happen, but never drop the start)
+        if start_message is not None and encoder is None and not passthrough:
+            await send(start_message)
+
+
+def _encoded_etag(etag: bytes, encoding: str) -> bytes:
+    """ETag of the compressed representation: the strong tag with an encoding suffix"""
+    if etag.endswith(b'"'):
+        return etag[:-1] + f"-{encoding}\"".encode("latin-1")
+    return etag
+
+
+def strip_encoding_suffix(etag: str) -> str:
+    """Undo _encoded_etag so If-None-Match can be compared with the identity ETag"""
+    for suffix in ('-gzip"', '-br"'):
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
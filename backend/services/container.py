@@ -0,0 +1,74 @@
+import os
+import threading
+from typing import Optional
+
+from .database import DatabaseService
+from .file_parser import FileParserService
+from .llm_service import LLMService
+from .query_history import QueryHistoryStore
+from .question_cache import QuestionCache
+from .result_store import ResultStore
+from .traffic_capture import TrafficCapture
+
+
+class ServiceContainer:
+    """
+    Services shared by every router
+
+    The app builds one container per process in its lifespan hook, so the
+    catalog is opened and migrated once and all routers share the same
+    connection pools and caches. The LLM client is created on the first
+    question that needs it. Worker processes share the same db_dir, so the
+    question cache is kept in a file there that every worker reads.
+    """
+
+    def __init__(self, db_dir: str = "backend/databases"):
+        """
+        Args:
+            db_dir: Directory holding the catalog, table files and stores
+        """
+        self.db_dir = db_dir
+        self.db = DatabaseService(db_dir=db_dir)
+        self.query_history = QueryHistoryStore(db_dir=db_dir)
+        self.result_store = ResultStore(db_dir=db_dir)
+        self.file_parser = FileParserService()
+        self.capture = TrafficCapture()
+        self.llm: Optional[LLMService] = None
+        self._llm_lock = threading.Lock()
+
+    def get_llm(self) -> LLMService:
+        """
+        LLM service, created on first use
+
+        Raises:
+            ValueError: If no OpenAI API key is configured
+        """
+        with self._llm_lock:
+            if self.llm is None:
+                self.llm = LLMService(
+                    question_cache=QuestionCache(path=os.path.join(self.db_dir, "question_cache.db"))
+                )
+            return self.llm
+
+    def start(self):
+        """Start background maintenance"""
+        self.db.storage.start()
+
+    def close(self):
+        """Write any queued query history, captured traffic and table access times"""
+        self.query_history.close()
+        self.capture.close()
+        self.db.storage.stop()
+
+
+_container: Optional[ServiceContainer] = None
+_container_lock = threading.Lock()
+
+
+def get_container() -> ServiceContainer:
+    """The process's ServiceContainer, built on first use if the lifespan hook has not run"""
+    global _container
+    with _container_lock:
+        if _container is None:
+            _container = ServiceContainer()
+        return _container
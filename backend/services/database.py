@@ -1,23 +1,241 @@
 import sqlite3
 import os
-import pandas as pd
-from typing import List, Dict, Any, Tuple
+import queue
+import re
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Any, Optional, Tuple, Iterator, TYPE_CHECKING
 from datetime import datetime
 import json
+from .hot_tables import HotTableCache, retry_if_locked
+from .metrics import stage
+from .engines import COLUMNAR, SQLITE, ColumnarEngine
+from .result_set import ResultSet
+from .rollups import RollupManager
+from .sampling import SampleTable
+from .sql_functions import register_functions
+from .storage_manager import StorageManager, _file_identity
+from .text_search import TextSearchIndex
+from .workers import FileLock, per_worker
+
+if TYPE_CHECKING:
+    import pandas as pd  # Imported inside the functions that need it, off the startup path
+
+
+# Table names double as file names under databases/tables
+_TABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_MISSING_TABLE = re.compile(r"^no such table: ([A-Za-z_][A-Za-z0-9_]*)$")
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+# Column types pandas.to_sql uses for SQLite, by pandas.api.types.infer_dtype result
+_SQLITE_TYPES = {
+    "string": "TEXT",
+    "floating": "REAL",
+    "integer": "INTEGER",
+    "datetime": "TIMESTAMP",
+    "date": "DATE",
+    "time": "TIME",
+    "boolean": "INTEGER",
+}
+
+
+def _sqlite_type(series: "pd.Series") -> str:
+    """Declared type to_sql would give a column"""
+    import pandas as pd
+
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if kind == "timedelta64":
+        kind = "integer"
+    elif kind == "datetime64":
+        kind = "datetime"
+    return _SQLITE_TYPES.get(kind, "TEXT")
+
+
+def _to_epoch(series: "pd.Series") -> "Tuple[pd.Series, str]":
+    """
+    Convert a datetime column to Unix epoch seconds
+
+    Timezone-aware values are converted to UTC. Whole seconds are stored as
+    INTEGER; values with fractional seconds as REAL.
+
+    Returns:
+        Tuple of (epoch values with NaT as NULL, SQLite column type)
+    """
+    import pandas as pd
+
+    if series.dt.tz is not None:
+        series = series.dt.tz_convert("UTC").dt.tz_localize(None)
+    nanoseconds = series.astype("datetime64[ns]").astype("int64")
+    missing = series.isna()
+    if (nanoseconds[~missing] % 1_000_000_000 == 0).all():
+        epoch = (nanoseconds // 1_000_000_000).astype("Int64")
+        epoch[missing] = pd.NA
+        return epoch, "INTEGER"
+    epoch = nanoseconds / 1e9
+    epoch[missing] = None
+    return epoch, "REAL"
+
+
+class PooledConnection(sqlite3.Connection):
+    """Read connection that remembers its hot-table views and attached table files"""
+    hot_version = -1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.attached: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()  # Table -> file identity, LRU order
+        self.table_slots = 0  # ATTACH slots left for table files
+
+
+class ReadConnectionPool:
+    """Pool of read-only SQLite connections shared across threads"""
+
+    # Every live pool, for utilization metrics
+    all_pools = weakref.WeakSet()
+
+    def __init__(
+        self,
+        db_path: str,
+        size: int = 4,
+        on_connect: Optional[Callable[[sqlite3.Connection], None]] = None,
+        on_checkout: Optional[Callable[[sqlite3.Connection], None]] = None
+    ):
+        self.db_path = db_path
+        self.size = size
+        self.on_connect = on_connect  # Called once for each new connection
+        self.on_checkout = on_checkout  # Called every time a connection is borrowed
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        ReadConnectionPool.all_pools.add(self)
+
+    @property
+    def idle(self) -> int:
+        """Number of open connections waiting in the pool"""
+        return self._idle.qsize()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new read-only connection"""
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro",
+            uri=True,
+            check_same_thread=False,  # Handed between threads, used by one at a time
+            factory=PooledConnection
+        )
+        conn.row_factory = sqlite3.Row
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a read-only connection
+
+        Never blocks: when every pooled connection is busy an extra one is
+        opened and closed again on release.
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        with self._lock:
+            self.in_use += 1
+
+        try:
+            if self.on_checkout is not None:
+                self.on_checkout(conn)
+            yield conn
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def _copy_table(dest: sqlite3.Connection, src_path: str, table_name: str):
+    """Copy a table and its indexes from another database file into dest"""
+    dest.execute("ATTACH DATABASE ? AS src", (src_path,))
+    try:
+        statements = dest.execute(
+            "SELECT type, sql FROM src.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+            "ORDER BY type = 'index'",  # Table first, then its indexes
+            (table_name,)
+        ).fetchall()
+        for object_type, sql in statements:
+            dest.execute(sql)
+            if object_type == "table":
+                dest.execute(f"INSERT INTO main.{_quote(table_name)} SELECT * FROM src.{_quote(table_name)}")
+        dest.commit()
+    finally:
+        dest.execute("DETACH DATABASE src")
 
 
 class DatabaseService:
-    """Service for SQLite database operations"""
+    """
+    Service for SQLite database operations
+
+    Each uploaded table is stored in its own file under <db_dir>/tables, so
+    uploads never contend for a shared writer lock and deleting a table
+    frees its disk space at once. analytics_gpt.db only holds the _metadata
+    catalog. Read connections open the catalog and ATTACH table files as
+    queries need them. Tables that are not queried for a while may be moved
+    to a compressed archive by the StorageManager; they are restored on the
+    next query.
+
+    Several worker processes may share db_dir. Changes to the catalog, and
+    choosing the name of a new table, happen under a lock file in
+    <db_dir>/locks that excludes other processes as well as other threads.
+    """
+
+    # Read-only connections kept open for queries, per worker process
+    READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", per_worker(max(4, os.cpu_count() or 1), minimum=2)))
 
     def __init__(self, db_dir: str = "backend/databases"):
         self.db_dir = db_dir
-        os.makedirs(db_dir, exist_ok=True)
+        self.tables_dir = os.path.join(db_dir, "tables")
+        os.makedirs(self.tables_dir, exist_ok=True)
+        self.locks_dir = os.path.join(db_dir, "locks")
+        os.makedirs(self.locks_dir, exist_ok=True)
+        self.catalog_lock = FileLock(os.path.join(self.locks_dir, "catalog.lock"))
         self.db_path = os.path.join(db_dir, "analytics_gpt.db")
-        self._init_metadata_table()
+        # Workers start at the same time; one creates and migrates the catalog
+        with self.catalog_lock:
+            self._init_metadata_table()
+            self._migrate_legacy_tables()
+        self.storage = StorageManager.for_database(self)
+        self.hot_tables = HotTableCache.for_database(self.db_path, self.table_path)
+        self.rollups = RollupManager.for_database(self)
+        self.columnar = ColumnarEngine.for_database(self)
+        self.read_pool = ReadConnectionPool(
+            self.db_path,
+            size=self.READ_POOL_SIZE,
+            on_connect=self._on_connect,
+            on_checkout=self._on_checkout
+        )
 
     def _init_metadata_table(self):
         """Initialize metadata table to track uploaded tables"""
         conn = sqlite3.connect(self.db_path)
+        # WAL lets readers run in parallel with each other and with catalog writes
+        conn.execute("PRAGMA journal_mode=WAL")
         cursor = conn.cursor()
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS _metadata (
@@ -30,13 +248,186 @@ class DatabaseService:
         conn.commit()
         conn.close()
 
+    def _migrate_legacy_tables(self):
+        """Move tables stored inside the catalog (before per-table files) into their own files"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            legacy = [
+                row[0] for row in conn.execute("""
+                    SELECT m.table_name FROM _metadata m
+                    JOIN sqlite_master s ON s.type = 'table' AND s.name = m.table_name
+                """)
+            ]
+            for table_name in legacy:
+                if _TABLE_NAME.match(table_name) and not os.path.exists(self.table_path(table_name)):
+                    self.write_table_file(
+                        table_name, lambda dest: _copy_table(dest, self.db_path, table_name)
+                    )
+                conn.execute(f"DROP TABLE IF EXISTS {_quote(table_name)}")
+                conn.commit()
+            if legacy:
+                conn.execute("VACUUM")  # Give the moved tables' pages back
+        finally:
+            conn.close()
+
+    def table_path(self, table_name: str) -> str:
+        """
+        Path of the file holding a table
+
+        Raises:
+            ValueError: If the name cannot be used as a file name
+        """
+        if not _TABLE_NAME.match(table_name or ""):
+            raise ValueError(f"Invalid table name '{table_name}'")
+        return os.path.join(self.tables_dir, f"{table_name}.db")
+
+    def _reservation_path(self, table_name: str) -> str:
+        return os.path.join(self.locks_dir, f"{table_name}.reserved")
+
+    @contextmanager
+    def reserve_table_name(self, table_name: str) -> Iterator[str]:
+        """
+        Claim a name for a new table until it has been created
+
+        The name is checked and claimed under the catalog lock, so two
+        uploads of the same file, in any worker, never get the same name.
+        A claim left behind by a crashed worker only makes later uploads of
+        that name take a suffix.
+
+        Args:
+            table_name: Preferred name
+
+        Yields:
+            table_name, or table_name with a random suffix if it is taken
+        """
+        self.table_path(table_name)  # Raises ValueError for names that cannot be file names
+        with self.catalog_lock:
+            name = table_name
+            while self.table_exists(name) or os.path.exists(self._reservation_path(name)):
+                name = f"{table_name}_{uuid.uuid4().hex[:6]}"
+            open(self._reservation_path(name), "w").close()
+        try:
+            yield name
+        finally:
+            with self.catalog_lock:
+                os.remove(self._reservation_path(name))
+
+    def write_table_file(self, table_name: str, fill: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        Build a table file next to its final path and move it into place
+
+        Readers keep seeing the previous file (if any) until the rename.
+
+        Args:
+            table_name: Table stored in the file
+            fill: Called with a connection to the new file; its result is returned
+
+        Returns:
+            Whatever fill returned
+        """
+        path = self.table_path(table_name)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        conn = sqlite3.connect(tmp_path)
+        try:
+            # Nothing reads the file before the rename, so a rollback journal is not needed
+            conn.execute("PRAGMA journal_mode=OFF")
+            result = fill(conn)
+            conn.commit()
+            conn.close()
+            os.replace(tmp_path, path)
+            return result
+        except BaseException:
+            conn.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _on_connect(self, conn: PooledConnection):
+        register_functions(conn)  # median, percentile_cont, stddev, corr, ...
+        self.hot_tables.attach(conn)
+        self.rollups.attach(conn)
+        attached = [row[1] for row in conn.execute("PRAGMA database_list") if row[1] not in ("main", "temp")]
+        conn.table_slots = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - len(attached)
+
+    def _on_checkout(self, conn: PooledConnection):
+        # Detach files that were replaced or deleted since the connection was last used
+        for table_name, identity in list(conn.attached.items()):
+            if _file_identity(self.table_path(table_name)) != identity:
+                self._detach(conn, table_name)
+        self.hot_tables.sync(conn)
+
+    def _attach(self, conn: PooledConnection, table_name: str) -> bool:
+        """
+        Make a table visible to a read connection
+
+        Args:
+            conn: Pooled read connection
+            table_name: Table to attach
+
+        Returns:
+            True if the table is attached, False if it has no file
+        """
+        if table_name in conn.attached:
+            conn.attached.move_to_end(table_name)
+            return True
+
+        try:
+            path = self.table_path(table_name)
+        except ValueError:
+            return False
+        identity = _file_identity(path)
+        if identity is None:
+            # Archived tables are restored by whichever query reaches them first
+            if not self.storage.rehydrate(table_name):
+                return False
+            identity = _file_identity(path)
+            if identity is None:
+                return False
+
+        while conn.attached and len(conn.attached) >= conn.table_slots:
+            self._detach(conn, next(iter(conn.attached)))  # Least recently used
+        conn.execute(f"ATTACH DATABASE ? AS {_quote('table_' + table_name)}", (f"file:{path}?mode=ro",))
+        conn.attached[table_name] = identity
+        return True
+
+    @staticmethod
+    def _detach(conn: PooledConnection, table_name: str):
+        conn.execute(f"DETACH DATABASE {_quote('table_' + table_name)}")
+        del conn.attached[table_name]
+
+    def _execute(self, conn: PooledConnection, cursor: sqlite3.Cursor, query: str, table_name: Optional[str]):
+        """Execute a query, attaching the files of the tables it reads"""
+        if table_name:
+            self._attach(conn, table_name)
+        attached = 0
+        resynced = False
+        while True:
+            try:
+                return retry_if_locked(lambda: cursor.execute(query))
+            except sqlite3.OperationalError as e:
+                if str(e).startswith("no such table: hot.") and not resynced:
+                    # A hot copy was demoted after this connection's views were built
+                    conn.hot_version = -1
+                    self.hot_tables.sync(conn)
+                    resynced = True
+                    continue
+                missing = _MISSING_TABLE.match(str(e))
+                if (
+                    missing is None
+                    or attached == conn.table_slots  # Reads more tables than can be attached at once
+                    or missing.group(1) in conn.attached
+                    or not self._attach(conn, missing.group(1))
+                ):
+                    raise
+                attached += 1
+
     def get_connection(self) -> sqlite3.Connection:
-        """Get database connection"""
+        """Get a read-write connection to the catalog"""
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row  # Enable column access by name
         return conn
 
-    def create_table_from_dataframe(self, df: pd.DataFrame, table_name: str) -> Dict[str, Any]:
+    def create_table_from_dataframe(self, df: "pd.DataFrame", table_name: str) -> Dict[str, Any]:
         """
         Create SQLite table from pandas DataFrame
 
@@ -47,148 +438,357 @@ class DatabaseService:
         Returns:
             Dict with table information
         """
-        conn = self.get_connection()
-
-        try:
-            # Drop table if exists
-            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
-
-            # Prepare DataFrame for SQLite with better date handling
-            df_to_insert = df.copy()
-
-            # Convert datetime columns to ISO format strings for better SQLite compatibility
-            datetime_columns = []
-            for col in df_to_insert.columns:
-                if pd.api.types.is_datetime64_any_dtype(df_to_insert[col]):
-                    datetime_columns.append(col)
-                    # Convert to ISO format string, preserve NaT as None
-                    df_to_insert[col] = df_to_insert[col].apply(
-                        lambda x: x.isoformat() if pd.notna(x) else None
-                    )
-
-            # Create table and insert data
-            df_to_insert.to_sql(table_name, conn, if_exists='replace', index=False)
+        import pandas as pd
+
+        # Stop serving the old copy before the table is replaced
+        self.hot_tables.invalidate(table_name)
+
+        # Prepare DataFrame for SQLite with better date handling
+        df_to_insert = df.copy()
+        taken = {str(col) for col in df.columns}
+
+        # Datetime columns are stored as sortable epoch numbers in <col>_epoch. The
+        # original column becomes a virtual ISO-8601 column computed from it, so
+        # existing queries and results look the same, and virtual <col>_year,
+        # <col>_month and <col>_day columns are indexed for range and group-by queries.
+        datetime_columns = []
+        date_columns = {}
+        definitions = []
+        extra_definitions = []
+        indexes = []
+        for col in df.columns:
+            name = str(col)
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                definitions.append(f"{_quote(name)} {_sqlite_type(df[col])}")
+                continue
+
+            parts = {part: f"{name}_{part}" for part in ("epoch", "year", "month", "day")}
+            if taken & set(parts.values()):
+                # Derived names clash with uploaded columns: keep ISO strings, as before
+                datetime_columns.append(name)
+                df_to_insert[col] = df[col].apply(lambda x: x.isoformat() if pd.notna(x) else None)
+                definitions.append(f"{_quote(name)} TEXT")
+                continue
+            taken.update(parts.values())
+
+            epoch, epoch_type = _to_epoch(df[col])
+            df_to_insert = df_to_insert.drop(columns=[col])
+            df_to_insert[parts["epoch"]] = epoch
+            datetime_columns.append(name)
+            date_columns[name] = parts
+
+            seconds = "%f" if epoch_type == "REAL" else "%S"
+            epoch_column = _quote(parts["epoch"])
+            definitions.append(
+                f"{_quote(name)} DATETIME GENERATED ALWAYS AS "
+                f"(strftime('%Y-%m-%dT%H:%M:{seconds}', {epoch_column}, 'unixepoch')) VIRTUAL"
+            )
+            extra_definitions.append(f"{epoch_column} {epoch_type}")
+            for part, pattern in (("year", "%Y"), ("month", "%m"), ("day", "%d")):
+                extra_definitions.append(
+                    f"{_quote(parts[part])} INTEGER GENERATED ALWAYS AS "
+                    f"(CAST(strftime('{pattern}', {epoch_column}, 'unixepoch') AS INTEGER)) VIRTUAL"
+                )
+            indexes.append(f"CREATE INDEX {_quote(parts['epoch'] + '_idx')} ON {_quote(table_name)} ({epoch_column})")
+            indexes.append(
+                f"CREATE INDEX {_quote(name + '_year_month_idx')} ON {_quote(table_name)} "
+                f"({_quote(parts['year'])}, {_quote(parts['month'])})"
+            )
 
-            # Get column info with enhanced type information
-            cursor = conn.cursor()
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns_info = cursor.fetchall()
-
-            # Build schema with type hints
-            schema = {}
-            for col in columns_info:
-                col_name = col[1]
-                sql_type = col[2]
-
-                # Add type hints for datetime columns
-                if col_name in datetime_columns:
-                    schema[col_name] = "DATETIME"
-                else:
-                    schema[col_name] = sql_type
+        # Trigram index for substring search on free-text columns
+        search_columns = [
+            col for col in TextSearchIndex.choose_columns(df_to_insert) if col not in datetime_columns
+        ]
 
-            columns = list(schema.keys())
+        # Weighted sample for approximate answers on very large tables
+        sample = {"strata": SampleTable.choose_strata(df_to_insert)} if SampleTable.wanted(len(df)) else None
 
-            # Store metadata with type information
-            metadata = {
-                "columns": columns,
-                "datetime_columns": datetime_columns
-            }
+        def fill(conn: sqlite3.Connection):
+            # Create table and insert data
+            conn.execute(f"CREATE TABLE {_quote(table_name)} ({', '.join(definitions + extra_definitions)})")
+            df_to_insert.to_sql(table_name, conn, if_exists='append', index=False)
+            for sql in indexes:
+                conn.execute(sql)
+            if search_columns:
+                TextSearchIndex.create(conn, table_name, search_columns)
+            if sample is not None:
+                sample["rows"] = SampleTable.create(conn, table_name, sample["strata"])
+            # table_xinfo also lists generated columns
+            return conn.execute(f"PRAGMA table_xinfo({_quote(table_name)})").fetchall()
+
+        columns_info = self.write_table_file(table_name, fill)
+
+        # Build schema with type hints
+        schema = {}
+        for col in columns_info:
+            col_name = col[1]
+            sql_type = col[2]
+
+            # Add type hints for datetime columns
+            if col_name in datetime_columns:
+                schema[col_name] = "DATETIME"
+            else:
+                schema[col_name] = sql_type
+
+        columns = list(schema.keys())
+
+        # Store metadata with type information
+        metadata = {
+            "columns": columns,
+            "datetime_columns": datetime_columns,
+            "date_columns": date_columns,
+            "search_columns": search_columns,
+            "sample": sample
+        }
+
+        with self.catalog_lock:
+            conn = self.get_connection()
+            try:
+                conn.execute("""
+                    INSERT OR REPLACE INTO _metadata (table_name, row_count, columns, created_at)
+                    VALUES (?, ?, ?, ?)
+                """, (table_name, len(df), json.dumps(metadata), datetime.now().isoformat()))
+                conn.commit()
+            finally:
+                conn.close()
+
+        # The new file supersedes any archived copy
+        self.storage.forget(table_name)
+        self.storage.record_access(table_name)
+
+        # Rollups and the columnar copy of the previous upload no longer match; rebuild them in the background
+        self.rollups.table_replaced(table_name, self.rollups.suggest_dimensions(df, date_columns))
+        self.columnar.table_replaced(table_name, len(df), len(columns))
+
+        # Get preview data
+        preview = self.execute_query(f"SELECT * FROM {table_name} LIMIT 10")
+
+        return {
+            "table_name": table_name,
+            "rows_count": len(df),
+            "columns": columns,
+            "schema": schema,
+            "preview": preview
+        }
+
+    def restore_table(self, table_name: str) -> float:
+        """
+        Restore a table from the archive if it was moved there
 
-            cursor.execute("""
-                INSERT OR REPLACE INTO _metadata (table_name, row_count, columns, created_at)
-                VALUES (?, ?, ?, ?)
-            """, (table_name, len(df), json.dumps(metadata), datetime.now().isoformat()))
+        Timed as the "rehydrate" stage, so the cost shows up in Server-Timing.
 
-            conn.commit()
+        Args:
+            table_name: Name of the table
 
-            # Get preview data
-            preview = self.execute_query(f"SELECT * FROM {table_name} LIMIT 10")
+        Returns:
+            Seconds spent restoring; 0.0 if the table was not archived
+        """
+        if os.path.exists(self.table_path(table_name)) or not self.storage.is_archived(table_name):
+            return 0.0
+        with stage("rehydrate"):
+            return self.storage.rehydrate(table_name) or 0.0
+
+    def _touch(self, table_name: Optional[str]):
+        """Record a query against a table: restore it if archived, note the access, count it for the hot tier"""
+        if not table_name or not _TABLE_NAME.match(table_name):
+            return
+        self.restore_table(table_name)
+        self.storage.record_access(table_name)
+        if self.hot_tables.enabled:
+            self.hot_tables.touch(table_name, self.table_version(table_name))
+
+    def choose_engine(self, query: str, table_name: Optional[str]) -> Tuple[str, str]:
+        """
+        Pick the engine for a validated query
 
-            return {
-                "table_name": table_name,
-                "rows_count": len(df),
-                "columns": columns,
-                "schema": schema,
-                "preview": preview
-            }
+        Args:
+            query: SQL query string
+            table_name: Table the query reads
 
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+        Returns:
+            Tuple of (engine, SQL for that engine): COLUMNAR with the
+            translated SQL if the table has a columnar copy and the query
+            suits it (see ColumnarEngine.translate), else SQLITE and query
+        """
+        translated = self.columnar.translate(query, table_name)
+        if translated is not None and self.columnar.ready(table_name):
+            return COLUMNAR, translated
+        return SQLITE, query
 
-    def execute_query(self, query: str) -> List[Dict[str, Any]]:
+    def execute_query(self, query: str, table_name: Optional[str] = None, engine: str = SQLITE) -> ResultSet:
         """
         Execute SQL query and return results
 
         Args:
             query: SQL query string
+            table_name: Table the query reads, counted for hot-tier promotion
+            engine: SQLITE, or COLUMNAR for SQL from choose_engine
 
         Returns:
-            List of dictionaries representing rows
+            ResultSet with the column names and row tuples
+
+        Raises:
+            COLUMNAR_ERRORS: If the columnar engine cannot answer; run the
+                original query on SQLite instead
         """
-        conn = self.get_connection()
-        try:
+        if engine == COLUMNAR:
+            self.storage.record_access(table_name)
+            with stage("execute"):
+                return self.columnar.execute(query, table_name)
+
+        self._touch(table_name)
+        with self.read_pool.connection() as conn:
+            with stage("execute"):
+                cursor = conn.cursor()
+                cursor.row_factory = None  # Plain tuples, no per-row objects
+                self._execute(conn, cursor, query, table_name)
+                return ResultSet.from_cursor(cursor)
+
+    def iter_query(
+        self,
+        query: str,
+        batch_size: int = 500,
+        table_name: Optional[str] = None,
+        engine: str = SQLITE
+    ) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """
+        Execute SQL query and yield results in batches straight from the cursor
+
+        Args:
+            query: SQL query string
+            batch_size: Maximum number of rows per batch
+            table_name: Table the query reads, counted for hot-tier promotion
+            engine: SQLITE, or COLUMNAR for SQL from choose_engine
+
+        Yields:
+            Tuples of (column_names, rows) where rows is a list of value tuples.
+            A query with no rows yields a single empty batch so callers still
+            receive the column names.
+        """
+        if engine == COLUMNAR:
+            self.storage.record_access(table_name)
+            yield from self.columnar.iter_query(query, table_name, batch_size)
+            return
+
+        self._touch(table_name)
+        with self.read_pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(query)
+            cursor.row_factory = None  # Plain tuples, no per-row dicts
+            try:
+                self._execute(conn, cursor, query, table_name)
 
-            # Get column names
-            columns = [description[0] for description in cursor.description] if cursor.description else []
+                columns = [description[0] for description in cursor.description] if cursor.description else []
 
-            # Fetch all rows
-            rows = cursor.fetchall()
+                rows = cursor.fetchmany(batch_size)
+                yield columns, rows
 
-            # Convert to list of dicts
-            results = []
-            for row in rows:
-                row_dict = {}
-                for idx, col in enumerate(columns):
-                    row_dict[col] = row[idx]
-                results.append(row_dict)
+                while len(rows) == batch_size:
+                    rows = cursor.fetchmany(batch_size)
+                    if rows:
+                        yield columns, rows
+            finally:
+                # Reset the statement if the consumer stopped early
+                cursor.close()
 
-            return results
+    def search_columns(self, table_name: str) -> List[str]:
+        """
+        Columns of a table with a trigram search index
 
-        finally:
-            conn.close()
+        Args:
+            table_name: Name of the table
 
-    def get_table_schema(self, table_name: str) -> Dict[str, Any]:
+        Returns:
+            Column names usable by TextSearchIndex.rewrite
         """
-        Get schema information for a table
+        with self.read_pool.connection() as conn:
+            row = conn.execute("SELECT columns FROM _metadata WHERE table_name = ?", (table_name,)).fetchone()
+        metadata = json.loads(row[0]) if row else {}
+        if not isinstance(metadata, dict) or "rowid" in (col.lower() for col in metadata.get("columns", [])):
+            return []  # A column named rowid hides the row id the index returns
+        return metadata.get("search_columns", [])
+
+    def sample_info(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Sample of a table kept for approximate answers
 
         Args:
             table_name: Name of the table
 
         Returns:
-            Dict with schema information
+            Dict with the sample's "rows", its "strata" column and the
+            table's "table_rows", or None if the table has no sample
         """
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
+        with self.read_pool.connection() as conn:
+            row = conn.execute(
+                "SELECT columns, row_count FROM _metadata WHERE table_name = ?", (table_name,)
+            ).fetchone()
+        metadata = json.loads(row[0]) if row else {}
+        sample = metadata.get("sample") if isinstance(metadata, dict) else None
+        if not sample or "rowid" in (col.lower() for col in metadata.get("columns", [])):
+            return None
+        return {**sample, "table_rows": row[1]}
+
+    def query_plan(self, query: str, table_name: Optional[str] = None) -> List[str]:
+        """
+        EXPLAIN QUERY PLAN details of a query, one string per plan step
 
-            # Get column information
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns_info = cursor.fetchall()
+        Args:
+            query: SQL query string
+            table_name: Table the query reads
 
-            if not columns_info:
-                raise ValueError(f"Table '{table_name}' does not exist")
+        Returns:
+            Plan step descriptions such as "SCAN sales"
+        """
+        with self.read_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            self._execute(conn, cursor, f"EXPLAIN QUERY PLAN {query}", table_name)
+            return [row[3] for row in cursor.fetchall()]
 
-            columns = [
-                {"name": col[1], "type": col[2]}
-                for col in columns_info
-            ]
+    def get_table_schema(self, table_name: str) -> Dict[str, Any]:
+        """
+        Get schema information for a table
 
-            # Get sample data
-            sample_data = self.execute_query(f"SELECT * FROM {table_name} LIMIT 5")
+        Args:
+            table_name: Name of the table
 
-            return {
-                "table_name": table_name,
-                "columns": columns,
-                "sample_data": sample_data
-            }
+        Returns:
+            Dict with schema information
+        """
+        with self.read_pool.connection() as conn:
+            if not self._attach(conn, table_name):
+                raise ValueError(f"Table '{table_name}' does not exist")
 
-        finally:
-            conn.close()
+            # Get column information; table_xinfo also lists generated columns
+            self.storage.record_access(table_name)
+            columns_info = conn.execute(
+                f"PRAGMA {_quote('table_' + table_name)}.table_xinfo({_quote(table_name)})"
+            ).fetchall()
+            metadata_row = conn.execute(
+                "SELECT columns FROM _metadata WHERE table_name = ?", (table_name,)
+            ).fetchone()
+
+        if not columns_info:
+            raise ValueError(f"Table '{table_name}' does not exist")
+
+        columns = [
+            {"name": col[1], "type": col[2]}
+            for col in columns_info
+            if col[6] != 1  # Hidden columns of virtual tables
+        ]
+
+        metadata = json.loads(metadata_row[0]) if metadata_row else {}
+        date_columns = metadata.get("date_columns", {}) if isinstance(metadata, dict) else {}
+
+        # Get sample data
+        sample_data = self.execute_query(f"SELECT * FROM {table_name} LIMIT 5")
+
+        return {
+            "table_name": table_name,
+            "columns": columns,
+            "date_columns": date_columns,
+            "sample_data": sample_data
+        }
 
     def get_all_tables(self) -> List[Dict[str, Any]]:
         """
@@ -228,26 +828,69 @@ class DatabaseService:
         finally:
             conn.close()
 
+    def table_version(self, table_name: str) -> Optional[str]:
+        """
+        Version string of a table that changes whenever it is uploaded again
+
+        Args:
+            table_name: Name of the table
+
+        Returns:
+            Version string, or None if the table is not in the catalog
+        """
+        with self.read_pool.connection() as conn:
+            row = conn.execute(
+                "SELECT created_at, row_count FROM _metadata WHERE table_name = ?", (table_name,)
+            ).fetchone()
+        return f"{row[0]}|{row[1]}" if row else None
+
+    def table_row_count(self, table_name: str) -> Optional[int]:
+        """
+        Rows in a table, as recorded in the catalog
+
+        Args:
+            table_name: Name of the table
+
+        Returns:
+            Row count, or None if the table is not in the catalog
+        """
+        with self.read_pool.connection() as conn:
+            row = conn.execute(
+                "SELECT row_count FROM _metadata WHERE table_name = ?", (table_name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def catalog_version(self) -> str:
+        """Version string of the table list that changes on every upload or delete"""
+        with self.read_pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT table_name, created_at, row_count FROM _metadata ORDER BY table_name"
+            ).fetchall()
+        return ";".join(f"{name}|{created_at}|{row_count}" for name, created_at, row_count in rows)
+
     def table_exists(self, table_name: str) -> bool:
         """Check if table exists"""
-        conn = self.get_connection()
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT name FROM sqlite_master
-                WHERE type='table' AND name=?
-            """, (table_name,))
-            return cursor.fetchone() is not None
-        finally:
-            conn.close()
+            return os.path.exists(self.table_path(table_name)) or self.storage.is_archived(table_name)
+        except ValueError:
+            return False
 
     def delete_table(self, table_name: str):
-        """Delete a table and its metadata"""
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-            cursor.execute("DELETE FROM _metadata WHERE table_name = ?", (table_name,))
-            conn.commit()
-        finally:
-            conn.close()
+        """Delete a table file and its metadata"""
+        self.hot_tables.invalidate(table_name)
+        with self.catalog_lock:
+            conn = self.get_connection()
+            try:
+                conn.execute("DELETE FROM _metadata WHERE table_name = ?", (table_name,))
+                conn.commit()
+            finally:
+                conn.close()
+
+            # Connections that still have the file attached detach it on their next checkout
+            try:
+                os.remove(self.table_path(table_name))
+            except FileNotFoundError:
+                pass
+        self.storage.forget(table_name)
+        self.rollups.forget(table_name)
+        self.columnar.forget(table_name)
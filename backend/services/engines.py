@@ -0,0 +1,493 @@
+import importlib.util
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .result_set import ResultSet
+from .sql_tokenizer import TRIVIA, identifier_name, tokenize
+from .workers import FileLock, per_worker
+
+# Optional: without duckdb every query runs on SQLite. It is imported on
+# first use, when a columnar copy is built or opened.
+HAS_DUCKDB = importlib.util.find_spec("duckdb") is not None
+
+logger = logging.getLogger(__name__)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+# Query engines a table can be served by
+SQLITE = "sqlite"
+COLUMNAR = "columnar"
+
+
+class ColumnarError(Exception):
+    """DuckDB could not run a translated query"""
+
+
+# Raised by the columnar engine when SQLite should answer instead
+COLUMNAR_ERRORS = (LookupError, ColumnarError)
+
+# Functions that return the same values in SQLite and DuckDB for the column
+# types an upload produces. CAST (DuckDB rounds, SQLite truncates), LOWER and
+# UPPER (SQLite only folds ASCII), date functions and the statistical UDFs are
+# deliberately missing.
+_FUNCTIONS = {
+    "COUNT", "SUM", "AVG", "MIN", "MAX", "ABS", "ROUND", "LENGTH",
+    "COALESCE", "IFNULL", "NULLIF", "TRIM", "LTRIM", "RTRIM", "SUBSTR", "REPLACE",
+}
+_AGGREGATES = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+
+# Words whose SQLite meaning DuckDB does not share, or that make row order ambiguous
+_UNSUPPORTED = {
+    "GLOB", "REGEXP", "MATCH", "ESCAPE", "COLLATE", "OVER", "WINDOW", "WITH", "UNION", "INTERSECT",
+    "EXCEPT", "VALUES", "ROWID", "_ROWID_", "OID", "TOTAL", "CAST",
+}
+
+# Keywords that may be followed by "(" without being a function call
+_PAREN_KEYWORDS = {
+    "SELECT", "FROM", "JOIN", "ON", "WHERE", "AND", "OR", "NOT", "IN", "EXISTS", "WHEN", "THEN", "ELSE",
+    "BY", "AS", "HAVING", "IS", "BETWEEN", "CASE", "DISTINCT", "LIMIT", "OFFSET", "LIKE",
+}
+
+# Clauses that end GROUP BY
+_AFTER_GROUP_BY = {"HAVING", "ORDER", "LIMIT"}
+
+
+def _duckdb_type(declared: str) -> str:
+    """DuckDB column type for a SQLite declared type, by SQLite's affinity rules"""
+    declared = declared.upper()
+    if "INT" in declared:
+        return "BIGINT"
+    if any(kind in declared for kind in ("REAL", "FLOA", "DOUB")):
+        return "DOUBLE"
+    return "VARCHAR"  # TEXT, and dates, which SQLite stores as ISO strings
+
+
+class ColumnarEngine:
+    """
+    Embedded columnar engine (DuckDB) for scan-heavy queries on large tables
+
+    SQLite reads whole rows even when a query needs two columns of a wide
+    table. Tables with at least MIN_CELLS values (rows x columns) also get a
+    DuckDB copy in <db_dir>/columnar/<table>.duckdb, built in the background
+    from the table file after each upload, including generated date columns.
+    DuckDB scans only the columns a query touches, vectorized and on THREADS
+    cores.
+
+    translate() decides per query: aggregates, GROUP BY, ORDER BY and
+    DISTINCT queries over the table go to DuckDB when they only use
+    constructs both engines evaluate the same way. It adapts the SQL so the
+    answer matches SQLite's (LIKE is case-insensitive, GROUP BY output is
+    sorted, NULLs sort first, result columns keep their source text).
+    Everything else, and anything DuckDB rejects, runs on SQLite.
+    """
+
+    # "auto": tables above MIN_CELLS, "all": every table, "off": SQLite only
+    MODE = os.getenv("COLUMNAR_ENGINE", "auto").lower()
+    MIN_CELLS = int(os.getenv("COLUMNAR_MIN_CELLS", 20000000))
+    THREADS = int(os.getenv("COLUMNAR_THREADS", per_worker(os.cpu_count() or 1)))
+    MEMORY_LIMIT = os.getenv("COLUMNAR_MEMORY_LIMIT", "1GB")
+
+    BATCH_SIZE = 100000
+
+    _instances: Dict[str, "ColumnarEngine"] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_database(cls, database) -> "ColumnarEngine":
+        """Shared engine for a catalog, so every DatabaseService reuses the same DuckDB files"""
+        key = os.path.abspath(database.db_path)
+        with cls._instances_lock:
+            engine = cls._instances.get(key)
+            if engine is None:
+                engine = cls._instances[key] = cls(database)
+            return engine
+
+    def __init__(self, database):
+        """
+        Args:
+            database: DatabaseService whose tables get columnar copies
+        """
+        self.database = database
+        self.directory = os.path.join(database.db_dir, "columnar")
+        self.enabled = HAS_DUCKDB and self.MODE != "off"
+
+        self.queries = 0
+        self.fallbacks = 0
+        self.builds = 0
+        self.failures = 0
+
+        self._lock = threading.Lock()
+        # One copy is written at a time, across worker processes
+        self._build_lock = FileLock(os.path.join(database.locks_dir, "columnar.lock"))
+        self._tables: Dict[str, Tuple[str, Any]] = {}  # table -> (version, read-only connection)
+        self._building: set = set()
+
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, table_name: str) -> str:
+        """Path of a table's DuckDB copy"""
+        return os.path.join(self.directory, f"{table_name}.duckdb")
+
+    def wanted(self, row_count: int, column_count: int) -> bool:
+        """Whether a table of this size is served by the columnar engine"""
+        return self.enabled and (self.MODE == "all" or row_count * column_count >= self.MIN_CELLS)
+
+    # Copies
+
+    def table_replaced(self, table_name: str, row_count: int, column_count: int):
+        """
+        Rebuild a table's copy after an upload
+
+        Args:
+            table_name: Table that was written
+            row_count: Rows in the new table
+            column_count: Columns in the new table
+        """
+        self.forget(table_name)
+        if self.wanted(row_count, column_count):
+            self._build_in_background(table_name)
+
+    def forget(self, table_name: str):
+        """Close and delete a table's copy (deleted, replaced or archived table)"""
+        with self._lock:
+            entry = self._tables.pop(table_name, None)
+        if entry is not None:
+            entry[1].close()
+        if not self.enabled:
+            return
+        with self._build_lock:
+            try:
+                os.remove(self.path(table_name))
+            except FileNotFoundError:
+                pass
+
+    def _build_in_background(self, table_name: str):
+        with self._lock:
+            if table_name in self._building:
+                return
+            self._building.add(table_name)
+
+        def run():
+            try:
+                self.build(table_name)
+            except Exception:
+                logger.exception("Columnar copy of '%s' failed", table_name)
+                with self._lock:
+                    self.failures += 1
+            finally:
+                with self._lock:
+                    self._building.discard(table_name)
+
+        # Not a daemon: DuckDB aborts the process if it is torn down mid-copy
+        threading.Thread(target=run, name=f"columnar-{table_name}").start()
+
+    def build(self, table_name: str) -> bool:
+        """
+        Copy a table file into DuckDB
+
+        Args:
+            table_name: Table to copy
+
+        Returns:
+            True if the copy is in place, False if the table is gone or
+            changed while it was copied
+        """
+        import duckdb
+        import pandas as pd
+
+        source_path = self.database.table_path(table_name)
+        version = self.database.table_version(table_name)
+        if version is None or not os.path.exists(source_path):
+            return False
+
+        path = self.path(table_name)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with self._build_lock:
+            source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+            target = duckdb.connect(tmp_path, config={"threads": self.THREADS, "memory_limit": self.MEMORY_LIMIT})
+            try:
+                columns = [
+                    (row[1], row[2]) for row in source.execute(f"PRAGMA table_xinfo({_quote(table_name)})")
+                    if row[6] != 1  # Hidden columns of virtual tables
+                ]
+                target.execute(
+                    f"CREATE TABLE {_quote(table_name)} ("
+                    f"{', '.join(f'{_quote(name)} {_duckdb_type(declared)}' for name, declared in columns)})"
+                )
+                names = [name for name, _ in columns]
+                cursor = source.execute(
+                    f"SELECT {', '.join(_quote(name) for name in names)} FROM {_quote(table_name)} ORDER BY rowid"
+                )
+                for rows in iter(lambda: cursor.fetchmany(self.BATCH_SIZE), []):
+                    target.append(table_name, pd.DataFrame.from_records(rows, columns=names))
+                target.execute("CREATE TABLE _source (version VARCHAR)")
+                target.execute("INSERT INTO _source VALUES (?)", [version])
+                target.execute("CHECKPOINT")
+            except BaseException:
+                target.close()
+                source.close()
+                for leftover in (tmp_path, f"{tmp_path}.wal"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+                raise
+            target.close()
+            source.close()
+
+            if self.database.table_version(table_name) != version:
+                os.remove(tmp_path)  # Uploaded again while being copied
+                return False
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            entry = self._tables.pop(table_name, None)
+            self.builds += 1
+        if entry is not None:
+            entry[1].close()
+        return True
+
+    def _connection(self, table_name: str, version: str):
+        """Read-only connection to a table's copy if it matches version, else None"""
+        with self._lock:
+            entry = self._tables.get(table_name)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+        import duckdb
+
+        path = self.path(table_name)
+        if not os.path.exists(path):
+            return None
+        conn = duckdb.connect(path, read_only=True, config={
+            "threads": self.THREADS,
+            "memory_limit": self.MEMORY_LIMIT,
+            "default_null_order": "nulls_first_on_asc_last_on_desc",  # SQLite's NULL ordering
+        })
+        copied = conn.execute("SELECT version FROM _source").fetchone()
+        if copied is None or copied[0] != version:
+            conn.close()
+            return None
+        with self._lock:
+            previous = self._tables.get(table_name)
+            self._tables[table_name] = (version, conn)
+        if previous is not None:
+            previous[1].close()
+        return conn
+
+    # Queries
+
+    def translate(self, sql: str, table_name: Optional[str]) -> Optional[str]:
+        """
+        DuckDB form of a query if the columnar engine should run it
+
+        Args:
+            sql: Validated, sanitized SELECT
+            table_name: Table the query reads
+
+        Returns:
+            SQL for DuckDB, or None to run the query on SQLite
+        """
+        if not self.enabled or not table_name:
+            return None
+        tokens = [token for token in tokenize(sql) if token.kind not in TRIVIA]
+        words = [token.value.upper() if token.kind == "word" else None for token in tokens]
+        if not tokens or words[0] != "SELECT":
+            return None
+
+        depths, depth = [], 0
+        scan_heavy = False
+        replacements = []
+        for index, token in enumerate(tokens):
+            word = words[index]
+            following = tokens[index + 1].value if index + 1 < len(tokens) else None
+            if token.value == "(":
+                depth += 1
+            elif token.value == ")":
+                depth -= 1
+            depths.append(depth)
+
+            if word in _UNSUPPORTED or token.kind == "parameter":
+                return None
+            if token.value in ("/", "%", ";"):
+                return None  # Integer division and modulo differ; one statement only
+            if token.kind == "identifier" and token.value[0] in "[`":
+                return None
+            if token.kind == "number" and token.value[:2].lower() == "0x":
+                return None
+            if word in ("FROM", "JOIN"):
+                source = tokens[index + 1] if index + 1 < len(tokens) else None
+                if source is None or (source.value != "(" and identifier_name(source).lower() != table_name.lower()):
+                    return None  # Only the table itself has a copy
+            if token.kind == "word" and following == "(" and word not in _PAREN_KEYWORDS:
+                if word not in _FUNCTIONS:
+                    return None
+                scan_heavy = scan_heavy or word in _AGGREGATES
+            if word in ("GROUP", "ORDER", "DISTINCT"):
+                scan_heavy = True
+            if word == "LIKE":
+                # SQLite's LIKE ignores case, but only for ASCII letters
+                pattern = tokens[index + 1] if index + 1 < len(tokens) else None
+                if pattern is None or pattern.kind != "string" or not pattern.value.isascii():
+                    return None
+                replacements.append((token.start, token.end, "ILIKE"))
+
+        if not scan_heavy:
+            return None  # Lookups and plain scans with LIMIT are fast enough on SQLite
+
+        top = [index for index in range(len(tokens)) if depths[index] == 0]
+        top_words = {words[index] for index in top}
+        if len(tokens) > 1 and words[1] == "DISTINCT" and "ORDER" not in top_words:
+            return None  # SQLite's DISTINCT order has no DuckDB equivalent
+
+        # SQLite returns groups in key order; make DuckDB do the same
+        if "GROUP" in top_words and "ORDER" not in top_words:
+            group = next(index for index in top if words[index] == "GROUP")
+            end = next(
+                (index for index in top if index > group and words[index] in _AFTER_GROUP_BY), len(tokens)
+            )
+            keys = sql[tokens[group + 2].start:tokens[end - 1].end]
+            limit = next((index for index in top if words[index] == "LIMIT"), None)
+            if limit is None:
+                replacements.append((len(sql), len(sql), f" ORDER BY {keys}"))
+            else:
+                replacements.append((tokens[limit].start, tokens[limit].start, f"ORDER BY {keys} "))
+
+        # SQLite names unaliased result columns after their source text; DuckDB normalizes it
+        from_index = next((index for index in top if words[index] == "FROM"), len(tokens))
+        item_start = 2 if words[1] == "DISTINCT" else 1
+        for index in range(item_start, from_index + 1):
+            if index < from_index and (tokens[index].value != "," or depths[index] != 0):
+                continue
+            item_end = index - 1
+            if item_end >= item_start and self._needs_name(tokens, words, item_start, item_end):
+                text = sql[tokens[item_start].start:tokens[item_end].end]
+                replacements.append((tokens[item_end].end, tokens[item_end].end, f" AS {_quote(text)}"))
+            item_start = index + 1
+
+        for start, end, text in sorted(replacements, key=lambda replacement: replacement[0], reverse=True):
+            sql = f"{sql[:start]}{text}{sql[end:]}"
+        return sql
+
+    @staticmethod
+    def _needs_name(tokens, words, item_start: int, item_end: int) -> bool:
+        """Whether a select item is an unaliased expression, which the engines name differently"""
+        if tokens[item_end].value == "*":
+            return False
+        if item_end == item_start or (item_end == item_start + 2 and tokens[item_start + 1].value == "."):
+            return False  # A column reference: both engines use the column's name
+        if words[item_end - 1] == "AS":
+            return False
+        # An implicit alias directly follows a complete operand
+        previous = tokens[item_end - 1]
+        return not (
+            tokens[item_end].kind in ("word", "identifier")
+            and words[item_end] not in ("END", "NULL", "TRUE", "FALSE")
+            and (previous.value == ")" or previous.kind in ("word", "identifier", "number", "string"))
+            and words[item_end - 1] not in _PAREN_KEYWORDS
+        )
+
+    def execute(self, sql: str, table_name: str) -> ResultSet:
+        """
+        Run translated SQL against a table's copy
+
+        Args:
+            sql: Result of translate()
+            table_name: Table the query reads
+
+        Returns:
+            ResultSet with the column names and row tuples
+
+        Raises:
+            LookupError: If the copy is missing or older than the table
+            ColumnarError: If DuckDB cannot run the query
+        """
+        import duckdb
+
+        cursor = self._cursor(table_name)
+        try:
+            cursor.execute(sql)
+            columns = [description[0] for description in cursor.description] if cursor.description else []
+            return ResultSet(columns, cursor.fetchall())
+        except duckdb.Error as e:
+            raise ColumnarError(str(e)) from e
+        finally:
+            cursor.close()
+
+    def iter_query(self, sql: str, table_name: str, batch_size: int = 500) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """Run translated SQL in batches, like DatabaseService.iter_query"""
+        import duckdb
+
+        cursor = self._cursor(table_name)
+        try:
+            try:
+                cursor.execute(sql)
+                columns = [description[0] for description in cursor.description] if cursor.description else []
+                rows = cursor.fetchmany(batch_size)
+            except duckdb.Error as e:
+                raise ColumnarError(str(e)) from e
+            yield columns, rows
+            while len(rows) == batch_size:
+                rows = cursor.fetchmany(batch_size)
+                if rows:
+                    yield columns, rows
+        finally:
+            cursor.close()
+
+    def _cursor(self, table_name: str):
+        version = self.database.table_version(table_name)
+        conn = self._connection(table_name, version) if version else None
+        if conn is None:
+            raise LookupError(f"No current columnar copy of '{table_name}'")
+        with self._lock:
+            self.queries += 1
+        return conn.cursor()
+
+    def ready(self, table_name: str) -> bool:
+        """
+        Whether a table has a columnar copy
+
+        A table that should have one but does not (restored from the
+        archive, or the process restarted mid-build) gets it rebuilt.
+        """
+        if os.path.exists(self.path(table_name)):
+            return True
+        with self.database.read_pool.connection() as conn:
+            row = conn.execute(
+                "SELECT row_count, columns FROM _metadata WHERE table_name = ?", (table_name,)
+            ).fetchone()
+        if row is None or not os.path.exists(self.database.table_path(table_name)):
+            return False
+        metadata = json.loads(row[1])
+        columns = metadata.get("columns", []) if isinstance(metadata, dict) else metadata
+        if self.wanted(row[0], len(columns)):
+            self._build_in_background(table_name)
+        return False
+
+    def record_fallback(self):
+        """Count a query DuckDB could not run, answered by SQLite instead"""
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Tables with a columnar copy and query counters"""
+        with self._lock:
+            tables = sorted(self._tables)
+        copies = [
+            name[:-len(".duckdb")] for name in os.listdir(self.directory) if name.endswith(".duckdb")
+        ] if self.enabled else []
+        return {
+            "enabled": self.enabled,
+            "tables": sorted(set(tables) | set(copies)),
+            "queries": self.queries,
+            "fallbacks": self.fallbacks,
+            "builds": self.builds,
+            "failures": self.failures,
+        }
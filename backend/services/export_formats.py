@@ -0,0 +1,283 @@
+import importlib.util
+import io
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+from . import json_encoding
+from .result_set import iter_csv, write_excel
+
+# Optional: only needed for Parquet and Arrow exports, and imported on first use
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+RowBatches = Iterable[List[tuple]]
+
+# Python type of each SQLite storage class, as named by typeof()
+STORAGE_CLASS_TYPES = {"integer": int, "real": float, "text": str, "blob": bytes}
+
+
+class ExportFormat(NamedTuple):
+    """A download format: how to encode row batches and how to label the file"""
+    media_type: str
+    extension: str
+    encode: Callable[[Sequence[str], RowBatches], Iterator[bytes]]
+    requires_pyarrow: bool = False
+
+
+def _encode_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    for chunk in chunks:
+        yield chunk.encode("utf-8")
+
+
+def iter_csv_bytes(columns: Sequence[str], batches: RowBatches) -> Iterator[bytes]:
+    """CSV, one chunk per batch"""
+    return _encode_chunks(iter_csv(columns, batches))
+
+
+def iter_excel(columns: Sequence[str], batches: RowBatches) -> Iterator[bytes]:
+    """Excel workbook; the .xlsx container can only be emitted once complete"""
+    output = io.BytesIO()
+    write_excel(output, columns, batches)
+    yield output.getvalue()
+
+
+def iter_ndjson(columns: Sequence[str], batches: RowBatches) -> Iterator[bytes]:
+    """
+    Newline-delimited JSON, one object per row
+
+    Integers, floats, text and NULL keep their JSON types; BLOBs are hex encoded.
+    """
+    for rows in batches:
+        lines = [json_encoding.dumps(dict(zip(columns, row))) for row in rows]
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+
+
+def storage_classes_query(sql: str, width: int) -> str:
+    """
+    Query listing the storage classes found in each result column of another query
+
+    Arrow and Parquet write their schema before the first batch. Running this
+    first settles the column types over the whole result, so a TEXT value
+    after thousands of INTEGERs widens the column instead of failing the
+    stream. Pass its single row to column_types().
+
+    Args:
+        sql: SELECT whose result is described
+        width: Number of result columns
+    """
+    names = [f"c{position}" for position in range(width)]
+    body = sql.strip().rstrip(";")
+    return (
+        f"WITH _described ({', '.join(names)}) AS ({body}\n) SELECT "
+        + ", ".join(f"group_concat(DISTINCT typeof({name}))" for name in names)
+        + " FROM _described"
+    )
+
+
+def column_types(row: Sequence[Optional[str]]) -> List[set]:
+    """Python types per column from the row of storage_classes_query()"""
+    return [
+        {STORAGE_CLASS_TYPES[name] for name in (classes or "").split(",") if name in STORAGE_CLASS_TYPES}
+        for classes in row
+    ]
+
+
+def _arrow_type(seen: set):
+    """
+    Arrow type for a column from the Python types of its non-NULL values
+
+    A column holding both INTEGER and REAL values becomes float64; any TEXT
+    makes it a string column.
+    """
+    import pyarrow as pa
+
+    if not seen:
+        return pa.string()  # Only NULLs seen
+    if seen == {int}:
+        return pa.int64()
+    if seen <= {int, float}:
+        return pa.float64()
+    if seen <= {bytes}:
+        return pa.binary()
+    return pa.string()
+
+
+def _coerce(value: Any, arrow_type) -> Any:
+    """Convert a value that does not match its column's inferred type"""
+    import pyarrow as pa
+
+    if value is None:
+        return None
+    if pa.types.is_string(arrow_type):
+        return value.hex() if isinstance(value, bytes) else str(value)
+    if pa.types.is_floating(arrow_type) and isinstance(value, int):
+        return float(value)
+    if pa.types.is_integer(arrow_type) and isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise ValueError(f"Value {value!r} does not fit column type {arrow_type}")
+
+
+class _ArrowBatchBuilder:
+    """
+    Turns row tuples into Arrow record batches with a fixed schema
+
+    Arrow and Parquet streams need the schema before the first batch is
+    written. Column types come from the SQLite storage classes of every
+    value when the caller knows them (see storage_classes_query), otherwise
+    from those seen in the batches passed to observe(); the caller then
+    holds batches back until every column has a non-NULL value or
+    SCHEMA_SAMPLE_ROWS rows were seen. Later values are converted to the
+    inferred type where that is lossless (e.g. an INTEGER in a REAL column);
+    anything else raises ValueError, which only a sampled schema can meet.
+    """
+
+    SCHEMA_SAMPLE_ROWS = 100_000
+
+    def __init__(self, columns: Sequence[str], types: Optional[List[set]] = None):
+        self.columns = list(columns)
+        self.known = types is not None
+        self.types = [set(seen) for seen in types] if self.known else [set() for _ in self.columns]
+        self.sampled = 0
+        self.schema = None
+
+    def observe(self, rows: List[tuple]):
+        """Record the value types of a batch that precedes the schema"""
+        for position, values in enumerate(zip(*rows)):
+            self.types[position].update(type(value) for value in values if value is not None)
+        self.sampled += len(rows)
+
+    @property
+    def ready(self) -> bool:
+        """Whether enough rows were seen to fix the schema"""
+        return self.known or all(self.types) or self.sampled >= self.SCHEMA_SAMPLE_ROWS
+
+    def fix_schema(self):
+        import pyarrow as pa
+
+        self.schema = pa.schema([pa.field(name, _arrow_type(seen)) for name, seen in zip(self.columns, self.types)])
+        return self.schema
+
+    def build(self, rows: List[tuple]):
+        import pyarrow as pa
+
+        column_values = [list(values) for values in zip(*rows)] if rows else [[] for _ in self.columns]
+        arrays = []
+        for field, values in zip(self.schema, column_values):
+            try:
+                arrays.append(pa.array(values, type=field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+                arrays.append(pa.array([_coerce(value, field.type) for value in values], type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _iter_arrow_container(
+    columns: Sequence[str], batches: RowBatches, open_writer: Callable, types: Optional[List[set]] = None
+) -> Iterator[bytes]:
+    """Encode batches with a pyarrow writer, yielding bytes as each batch is flushed"""
+    builder = _ArrowBatchBuilder(columns, types)
+    sink = _ChunkSink()
+    pending: List[List[tuple]] = []
+    writer = None
+
+    def write(rows: List[tuple]) -> bytes:
+        writer.write_batch(builder.build(rows))
+        return sink.drain()
+
+    for rows in batches:
+        if not rows:
+            continue
+        if writer is None:
+            # Hold batches back until the column types are known
+            pending.append(rows)
+            builder.observe(rows)
+            if not builder.ready:
+                continue
+            writer = open_writer(sink, builder.fix_schema())
+            for held in pending:
+                yield write(held)
+            pending = []
+        else:
+            yield write(rows)
+
+    if writer is None:
+        writer = open_writer(sink, builder.fix_schema())
+        for held in pending:
+            yield write(held)
+    writer.close()
+    yield sink.drain()
+
+
+def iter_parquet(
+    columns: Sequence[str], batches: RowBatches, compression: str = "snappy", types: Optional[List[set]] = None
+) -> Iterator[bytes]:
+    """Parquet file with one row group per batch; types as from column_types(), if known"""
+    import pyarrow.parquet as pq
+
+    return _iter_arrow_container(
+        columns, batches, lambda sink, schema: pq.ParquetWriter(sink, schema, compression=compression), types
+    )
+
+
+def iter_arrow(columns: Sequence[str], batches: RowBatches, types: Optional[List[set]] = None) -> Iterator[bytes]:
+    """Arrow IPC stream with one record batch per batch; types as from column_types(), if known"""
+    import pyarrow as pa
+
+    return _iter_arrow_container(columns, batches, pa.ipc.new_stream, types)
+
+
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    "csv": ExportFormat("text/csv", "csv", iter_csv_bytes),
+    "excel": ExportFormat("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx", iter_excel),
+    "ndjson": ExportFormat("application/x-ndjson", "ndjson", iter_ndjson),
+    "parquet": ExportFormat("application/vnd.apache.parquet", "parquet", iter_parquet, requires_pyarrow=True),
+    "arrow": ExportFormat("application/vnd.apache.arrow.stream", "arrows", iter_arrow, requires_pyarrow=True),
+}
+
+
+def get_export_format(name: str) -> ExportFormat:
+    """
+    Look up a download format
+
+    Args:
+        name: csv, excel, ndjson, parquet or arrow
+
+    Returns:
+        ExportFormat for the name
+
+    Raises:
+        ValueError: If the format is unknown or needs pyarrow and it is not installed
+    """
+    export_format = EXPORT_FORMATS.get((name or "").lower())
+    if export_format is None:
+        raise ValueError(f"Unsupported format '{name}'. Allowed: {', '.join(EXPORT_FORMATS)}")
+    if export_format.requires_pyarrow and not HAS_PYARROW:
+        raise ValueError(f"The {name} format requires pyarrow to be installed")
+    return export_format
@@ -1,9 +1,11 @@
-import pandas as pd
 import os
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple
 from fastapi import UploadFile
 import re
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 class FileParserService:
     """Service for parsing uploaded files (CSV, Excel)"""
@@ -56,7 +58,7 @@ class FileParserService:
         return name
 
     @staticmethod
-    async def parse_file(file: UploadFile, save_path: str) -> pd.DataFrame:
+    async def parse_file(file: UploadFile, save_path: str) -> "pd.DataFrame":
         """
         Parse uploaded file to pandas DataFrame
 
@@ -70,6 +72,8 @@ class FileParserService:
         Raises:
             ValueError: If file cannot be parsed
         """
+        import pandas as pd
+
         # Save file temporarily
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
@@ -149,7 +153,7 @@ class FileParserService:
         return col.lower()
 
     @staticmethod
-    def get_dataframe_info(df: pd.DataFrame) -> dict:
+    def get_dataframe_info(df: "pd.DataFrame") -> dict:
         """
         Get information about DataFrame
 
@@ -167,7 +171,7 @@ class FileParserService:
         }
 
     @staticmethod
-    def _optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    def _optimize_dtypes(df: "pd.DataFrame") -> "pd.DataFrame":
         """
         Optimize data types for better performance and SQLite compatibility
 
@@ -177,6 +181,8 @@ class FileParserService:
         Returns:
             DataFrame with optimized data types
         """
+        import pandas as pd
+
         df = df.copy()
 
         for col in df.columns:
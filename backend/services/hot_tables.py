@@ -0,0 +1,378 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from .workers import per_worker
+
+_cache_ids = itertools.count(1)
+
+T = TypeVar("T")
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def retry_if_locked(operation: Callable[[], T], attempts: int = 20, delay: float = 0.01) -> T:
+    """
+    Run an operation, retrying while the hot database's schema is locked
+
+    Statements cannot be prepared on a connection that attaches the shared
+    in-memory database while a copy is being created or dropped there.
+    Those schema changes are short, so waiting briefly is enough.
+    """
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or attempt == attempts - 1:
+                raise
+            time.sleep(delay)
+
+
+class HotTableCache:
+    """
+    In-memory copies of frequently queried tables
+
+    Promoted tables are copied (with their indexes) into a shared-cache
+    in-memory SQLite database that every pooled read connection attaches as
+    "hot". On checkout, a connection gets a TEMP VIEW named after each hot
+    table. Unqualified names resolve to the temp schema first, so the SQL the
+    LLM writes is unchanged. Every promotion copies into a new uniquely named
+    table that is never written again once published, so a view built before
+    a demotion fails with "no such table: hot...." instead of reading another
+    copy while it is being filled. The on-disk table stays authoritative: a copy is
+    dropped as soon as its _metadata version changes, and least recently used
+    copies are demoted to stay within the memory budget.
+    """
+
+    # Memory for hot copies in each worker process; 0 disables the tier
+    MEMORY_BUDGET_BYTES = int(float(os.getenv("HOT_TABLE_MEMORY_MB", per_worker(256))) * 1024 * 1024)
+
+    # Queries against a table before it is promoted
+    MIN_HITS = int(os.getenv("HOT_TABLE_MIN_HITS", 3))
+
+    # Attempts to drop a copy while readers still have statements open on it
+    DROP_RETRIES = 40
+    DROP_RETRY_DELAY = 0.025
+
+    _instances: Dict[str, "HotTableCache"] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_database(cls, db_path: str, table_path: Callable[[str], str]) -> "HotTableCache":
+        """Shared cache for a catalog, so every DatabaseService sees the same copies"""
+        key = os.path.abspath(db_path)
+        with cls._instances_lock:
+            cache = cls._instances.get(key)
+            if cache is None:
+                cache = cls._instances[key] = cls(db_path, table_path)
+            return cache
+
+    def __init__(self, db_path: str, table_path: Callable[[str], str]):
+        """
+        Args:
+            db_path: Catalog database holding _metadata
+            table_path: Maps a table name to the file that stores it
+        """
+        self.db_path = db_path
+        self.table_path = table_path
+        self.uri = f"file:analytics_gpt_hot_{os.getpid()}_{next(_cache_ids)}?mode=memory&cache=shared"
+        self.enabled = self.MEMORY_BUDGET_BYTES > 0
+
+        self.version = 0  # Bumped whenever the set of hot tables changes
+        self.hot: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # LRU order, oldest first
+        self.hits: Dict[str, int] = {}
+        self.used_bytes = 0
+        self.promotions = 0
+        self.demotions = 0
+        self.hot_hits = 0
+
+        self._lock = threading.Lock()
+        self._keeper_lock = threading.Lock()
+        self._keeper: Optional[sqlite3.Connection] = None
+        self._promoting = set()
+        self._too_large: Dict[str, str] = {}  # table -> version that did not fit
+        self._pending_drops = set()  # Copies that could not be dropped yet
+        self._copy_ids = itertools.count(1)
+
+    def _keeper_connection(self) -> sqlite3.Connection:
+        """Connection that owns the in-memory database and keeps it alive"""
+        if self._keeper is None:
+            self._keeper = sqlite3.connect(self.uri, uri=True, check_same_thread=False, isolation_level=None)
+        return self._keeper
+
+    def attach(self, conn: sqlite3.Connection):
+        """Attach the in-memory database to a new pooled read connection"""
+        if not self.enabled:
+            return
+        with self._keeper_lock:
+            self._keeper_connection()  # The database must exist before readers attach it
+        conn.execute(f"ATTACH DATABASE '{self.uri}' AS hot")
+        # Readers never see a copy before it is committed and published
+        conn.execute("PRAGMA read_uncommitted = 1")
+
+    def sync(self, conn: sqlite3.Connection):
+        """Point a connection's TEMP VIEWs at the current set of hot tables"""
+        if not self.enabled or getattr(conn, "hot_version", -1) == self.version:
+            return
+
+        with self._lock:
+            version = self.version
+            tables = [(name, entry["copy"]) for name, entry in self.hot.items()]
+
+        def rebuild_views():
+            existing = [row[0] for row in conn.execute("SELECT name FROM temp.sqlite_master WHERE type = 'view'")]
+            for name in existing:
+                conn.execute(f"DROP VIEW temp.{_quote(name)}")
+            for name, copy in tables:
+                conn.execute(f"CREATE TEMP VIEW {_quote(name)} AS SELECT * FROM hot.{_quote(copy)}")
+
+        retry_if_locked(rebuild_views)
+        conn.hot_version = version
+
+    def touch(self, table_name: str, version: Optional[str]) -> bool:
+        """
+        Record a query against a table
+
+        Drops a copy whose version is stale and starts a background promotion
+        once a table reaches MIN_HITS queries.
+
+        Args:
+            table_name: Queried table
+            version: Current _metadata version of the table
+
+        Returns:
+            True if the query will be served from memory
+        """
+        if not self.enabled or version is None:
+            return False
+
+        with self._lock:
+            entry = self.hot.get(table_name)
+            if entry is not None:
+                if entry["version"] == version:
+                    self.hot.move_to_end(table_name)
+                    self.hot_hits += 1
+                    return True
+                stale = True
+            else:
+                stale = False
+
+            hits = self.hits.get(table_name, 0) + 1
+            self.hits[table_name] = hits
+            start = (
+                not stale
+                and hits >= self.MIN_HITS
+                and table_name not in self._promoting
+                and self._too_large.get(table_name) != version
+            )
+            if start:
+                self._promoting.add(table_name)
+
+        if stale:
+            self.demote(table_name)
+        elif start:
+            threading.Thread(
+                target=self._promote, args=(table_name,), name=f"hot-table-{table_name}", daemon=True
+            ).start()
+        return False
+
+    def _promote(self, table_name: str):
+        try:
+            self.promote(table_name)
+        except sqlite3.Error:
+            pass
+        finally:
+            with self._lock:
+                self._promoting.discard(table_name)
+
+    def promote(self, table_name: str) -> bool:
+        """
+        Copy a table and its indexes into memory
+
+        Args:
+            table_name: Table to promote
+
+        Returns:
+            True if the table is now hot
+        """
+        with self._keeper_lock:
+            keeper = self._keeper_connection()
+            self._retry_pending_drops(keeper)
+
+            path = self.table_path(table_name)
+            try:
+                estimate = os.path.getsize(path)
+            except FileNotFoundError:
+                return False
+
+            try:
+                keeper.execute("ATTACH DATABASE ? AS catalog", (f"file:{self.db_path}?mode=ro",))
+                keeper.execute("ATTACH DATABASE ? AS src", (f"file:{path}?mode=ro",))
+                if estimate > self.MEMORY_BUDGET_BYTES:
+                    with self._lock:
+                        self._too_large[table_name] = self._source_version(keeper, table_name)
+                    return False
+
+                self._make_room(keeper, estimate)
+                before = self._allocated_bytes(keeper)
+
+                copy = f"{table_name}__hot{next(self._copy_ids)}"
+                indexes = self._index_statements(keeper, table_name, copy)
+
+                # Readers cannot prepare statements while the shared schema is being
+                # changed, so create the empty table and indexes in a short transaction
+                def create_schema():
+                    keeper.execute("BEGIN")
+                    try:
+                        keeper.execute(
+                            f"CREATE TABLE main.{_quote(copy)} AS SELECT * FROM src.{_quote(table_name)} WHERE 0"
+                        )
+                        for sql in indexes:
+                            keeper.execute(sql)
+                        keeper.execute("COMMIT")
+                    except BaseException:
+                        if keeper.in_transaction:
+                            keeper.execute("ROLLBACK")
+                        raise
+
+                retry_if_locked(create_schema)
+
+                # One read transaction, so the copy matches the version recorded for it
+                keeper.execute("BEGIN")
+                try:
+                    version = self._source_version(keeper, table_name)
+                    if version is not None:
+                        keeper.execute(f"INSERT INTO main.{_quote(copy)} SELECT * FROM src.{_quote(table_name)}")
+                    keeper.execute("COMMIT")
+                except BaseException:
+                    if keeper.in_transaction:
+                        keeper.execute("ROLLBACK")
+                    self._drop_or_defer(keeper, copy)
+                    raise
+
+                if version is None:
+                    self._drop_or_defer(keeper, copy)
+                    return False
+            finally:
+                for schema in ("src", "catalog"):
+                    try:
+                        keeper.execute(f"DETACH DATABASE {schema}")
+                    except sqlite3.OperationalError:
+                        pass  # Not attached
+
+            size = max(self._allocated_bytes(keeper) - before, 0)
+
+        with self._lock:
+            self.hot[table_name] = {"copy": copy, "version": version, "bytes": size, "promoted_at": time.time()}
+            self.used_bytes += size
+            self.promotions += 1
+            self.version += 1
+        return True
+
+    @staticmethod
+    def _source_version(keeper: sqlite3.Connection, table_name: str) -> Optional[str]:
+        """_metadata version of the on-disk table (same format as DatabaseService.table_version)"""
+        row = keeper.execute(
+            "SELECT created_at, row_count FROM catalog._metadata WHERE table_name = ?", (table_name,)
+        ).fetchone()
+        return f"{row[0]}|{row[1]}" if row else None
+
+    @staticmethod
+    def _index_statements(keeper: sqlite3.Connection, table_name: str, copy: str):
+        """CREATE INDEX statements for the copy, from the source table's plain column indexes"""
+        statements = []
+        for _, index_name, unique, origin, partial in keeper.execute(
+            f"PRAGMA src.index_list({_quote(table_name)})"
+        ).fetchall():
+            if origin != "c" or partial:
+                continue  # Constraint indexes come with the data; partial indexes are skipped
+            columns = keeper.execute(f"PRAGMA src.index_xinfo({_quote(index_name)})").fetchall()
+            key = [(name, desc) for _, cid, name, desc, _, is_key in columns if is_key]
+            if any(name is None for name, _ in key):
+                continue  # Expression index
+            column_list = ", ".join(f"{_quote(name)}{' DESC' if desc else ''}" for name, desc in key)
+            statements.append(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX main.{_quote(f'{copy}__{index_name}')} "
+                f"ON {_quote(copy)} ({column_list})"
+            )
+        return statements
+
+    def _make_room(self, keeper: sqlite3.Connection, needed: int):
+        """Demote least recently used copies until `needed` bytes fit in the budget"""
+        while True:
+            with self._lock:
+                if not self.hot or self.used_bytes + needed <= self.MEMORY_BUDGET_BYTES:
+                    return
+                victim = next(iter(self.hot))
+            self._demote_locked(keeper, victim)
+
+    def demote(self, table_name: str):
+        """Drop the in-memory copy of a table, if any"""
+        with self._keeper_lock:
+            if self._keeper is not None:
+                self._demote_locked(self._keeper, table_name)
+
+    def _demote_locked(self, keeper: sqlite3.Connection, table_name: str):
+        with self._lock:
+            entry = self.hot.pop(table_name, None)
+            if entry is None:
+                return
+            self.used_bytes -= entry["bytes"]
+            self.demotions += 1
+            self.version += 1  # Connections drop the view on their next checkout
+
+        self._drop_or_defer(keeper, entry["copy"])
+
+    def _drop_or_defer(self, keeper: sqlite3.Connection, copy: str):
+        if not self._drop(keeper, copy):
+            self._pending_drops.add(copy)
+
+    def _drop(self, keeper: sqlite3.Connection, copy: str) -> bool:
+        """Drop a copy, waiting for statements that still read it to finish"""
+        try:
+            retry_if_locked(
+                lambda: keeper.execute(f"DROP TABLE IF EXISTS main.{_quote(copy)}"),
+                attempts=self.DROP_RETRIES, delay=self.DROP_RETRY_DELAY
+            )
+            return True
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            return False
+
+    def _retry_pending_drops(self, keeper: sqlite3.Connection):
+        for copy in list(self._pending_drops):
+            if self._drop(keeper, copy):
+                self._pending_drops.discard(copy)
+
+    @staticmethod
+    def _allocated_bytes(keeper: sqlite3.Connection) -> int:
+        page_size = keeper.execute("PRAGMA main.page_size").fetchone()[0]
+        pages = keeper.execute("PRAGMA main.page_count").fetchone()[0]
+        free = keeper.execute("PRAGMA main.freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def invalidate(self, table_name: str):
+        """Forget a table that is being replaced or deleted"""
+        with self._lock:
+            self.hits.pop(table_name, None)
+            self._too_large.pop(table_name, None)
+        self.demote(table_name)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hot tables and counters"""
+        with self._lock:
+            return {
+                "tables": {name: dict(entry) for name, entry in self.hot.items()},
+                "used_bytes": self.used_bytes,
+                "budget_bytes": self.MEMORY_BUDGET_BYTES,
+                "promotions": self.promotions,
+                "demotions": self.demotions,
+                "hot_hits": self.hot_hits
+            }
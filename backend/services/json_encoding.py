@@ -0,0 +1,33 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib encoder
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    """Encode values the JSON encoders do not handle natively"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode an object to compact UTF-8 JSON
+
+    Uses orjson when installed, otherwise the stdlib encoder with compact
+    separators. Tuples encode as arrays, so row tuples from the cursor can be
+    passed through without conversion.
+
+    Args:
+        obj: JSON-compatible object
+
+    Returns:
+        Encoded JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
@@ -1,32 +1,40 @@
 import os
-from typing import Dict, List, Any
-from openai import OpenAI
+from typing import Dict, List, Any, Iterator, Tuple
 import json
+from .question_cache import QuestionCache
+from .sql_functions import FUNCTION_SIGNATURES
 
 
 class LLMService:
     """Service for LLM-based natural language to SQL conversion"""
 
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, question_cache: QuestionCache = None):
         """
         Initialize LLM service
 
         Args:
             api_key: OpenAI API key (defaults to env variable)
+            question_cache: Cache of validated SQL (defaults to one for this process only)
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI API key not provided. Set OPENAI_API_KEY environment variable.")
 
+        from openai import OpenAI  # Deferred: the SDK takes most of a second to import
+
         self.client = OpenAI(api_key=self.api_key)
         self.model = "gpt-4o-mini"  # Fast and cost-effective
 
+        # Reuses validated SQL for near-duplicate questions on the same schema
+        self.question_cache = question_cache or QuestionCache()
+
     def generate_sql(
         self,
         question: str,
         table_name: str,
         schema: Dict[str, Any],
-        sample_data: List[Dict[str, Any]] = None
+        sample_data: List[Dict[str, Any]] = None,
+        use_cache: bool = True
     ) -> str:
         """
         Generate SQL query from natural language question
@@ -36,6 +44,7 @@ class LLMService:
             table_name: Name of the table
             schema: Table schema information
             sample_data: Optional sample data for context
+            use_cache: Reuse SQL from the question cache when possible
 
         Returns:
             SQL query string
@@ -43,21 +52,17 @@ class LLMService:
         Raises:
             Exception: If LLM call fails
         """
+        if use_cache:
+            cached = self.lookup_cached_sql(question, table_name, schema)
+            if cached:
+                return cached
+
         prompt = self._build_prompt(question, table_name, schema, sample_data)
 
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a SQL expert. Convert natural language questions to SQLite queries. Return ONLY the SQL query, no explanations or markdown formatting."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+                messages=self._build_messages(prompt),
                 temperature=0,  # Deterministic output
                 max_tokens=500
             )
@@ -72,6 +77,116 @@ class LLMService:
         except Exception as e:
             raise Exception(f"Error generating SQL: {str(e)}")
 
+    def stream_sql(
+        self,
+        question: str,
+        table_name: str,
+        schema: Dict[str, Any],
+        sample_data: List[Dict[str, Any]] = None,
+        use_cache: bool = True
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Generate SQL query from natural language question, streaming tokens
+
+        Args:
+            question: Natural language question
+            table_name: Name of the table
+            schema: Table schema information
+            sample_data: Optional sample data for context
+            use_cache: Reuse SQL from the question cache when possible
+
+        Yields:
+            ("token", text) for each completion delta as it arrives, then
+            ("sql", query) once with the cleaned, complete SQL query
+
+        Raises:
+            Exception: If LLM call fails
+        """
+        if use_cache:
+            cached = self.lookup_cached_sql(question, table_name, schema)
+            if cached:
+                yield "sql", cached
+                return
+
+        prompt = self._build_prompt(question, table_name, schema, sample_data)
+
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(prompt),
+                temperature=0,  # Deterministic output
+                max_tokens=500,
+                stream=True
+            )
+
+            parts = []
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield "token", delta
+
+        except Exception as e:
+            raise Exception(f"Error generating SQL: {str(e)}")
+
+        yield "sql", self._clean_sql_response("".join(parts).strip())
+
+    def lookup_cached_sql(self, question: str, table_name: str, schema: Dict[str, Any]) -> str:
+        """
+        Get previously validated SQL for the same or a near-duplicate question
+
+        Args:
+            question: Natural language question
+            table_name: Name of the table
+            schema: Table schema information
+
+        Returns:
+            Cached SQL query string, or None on a cache miss
+        """
+        fingerprint = QuestionCache.schema_fingerprint(table_name, schema)
+        match = self.question_cache.lookup(fingerprint, question)
+        return match["sql"] if match else None
+
+    def remember_sql(self, question: str, table_name: str, schema: Dict[str, Any], sql: str):
+        """
+        Cache SQL that passed validation and executed successfully
+
+        Args:
+            question: Natural language question
+            table_name: Name of the table
+            schema: Table schema information
+            sql: Validated SQL query
+        """
+        fingerprint = QuestionCache.schema_fingerprint(table_name, schema)
+        self.question_cache.add(fingerprint, question, sql)
+
+    def forget_sql(self, table_name: str, schema: Dict[str, Any], sql: str):
+        """
+        Stop reusing cached SQL that failed validation or execution
+
+        Args:
+            table_name: Name of the table
+            schema: Table schema information
+            sql: The cached SQL query
+        """
+        fingerprint = QuestionCache.schema_fingerprint(table_name, schema)
+        self.question_cache.invalidate(fingerprint, sql)
+
+    def _build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Build chat messages for the SQL generation prompt"""
+        return [
+            {
+                "role": "system",
+                "content": "You are a SQL expert. Convert natural language questions to SQLite queries. Return ONLY the SQL query, no explanations or markdown formatting."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
     def _build_prompt(
         self,
         question: str,
@@ -100,6 +215,22 @@ class LLMService:
 
         columns_text = "\n".join(columns_desc)
 
+        # Date columns backed by epoch seconds, with indexed year/month/day parts
+        date_text = ""
+        date_columns = schema.get('date_columns') or {}
+        if date_columns:
+            date_lines = []
+            for col_name, parts in date_columns.items():
+                date_lines.append(
+                    f"  - {col_name}: ISO text. For date ranges filter on {parts['epoch']} "
+                    f"(Unix seconds), e.g. {parts['epoch']} >= unixepoch('2024-01-01'). "
+                    f"Filter and group by {parts['year']}, {parts['month']} and {parts['day']} "
+                    f"(integers) instead of strftime() on {col_name}."
+                )
+            date_text = "\n\nDate Columns (indexed):\n" + "\n".join(date_lines)
+
+        functions_text = ", ".join(FUNCTION_SIGNATURES)
+
         # Build sample data text if available
         sample_text = ""
         if sample_data and len(sample_data) > 0:
@@ -112,7 +243,7 @@ Database Information:
 Table Name: {table_name}
 
 Columns:
-{columns_text}
+{columns_text}{date_text}
 {sample_text}
 
 Question: {question}
@@ -124,7 +255,8 @@ Important Instructions:
 4. Ensure the query is safe (SELECT only, no DROP/DELETE/UPDATE)
 5. Handle case-insensitive searches with LOWER() if needed
 6. Use appropriate WHERE clauses and conditions
-7. Do not include any markdown formatting or explanations
+7. Besides the built-in SQLite functions, these aggregates are available: {functions_text}. All but approx_count_distinct also work as window functions with OVER. Use them instead of emulating them with subqueries; p is a fraction between 0 and 1
+8. Do not include any markdown formatting or explanations
 
 SQL Query:"""
 
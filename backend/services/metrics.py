@@ -0,0 +1,259 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Label set for one sample, e.g. (("stage", "llm"),)
+LabelKey = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))  # 256 B .. 64 MB
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing counter"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, labels: Dict[str, str] = None):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, List[float]] = {}  # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Dict[str, str] = None):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, state):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {state[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """Metric whose samples are read from live objects at scrape time"""
+
+    def __init__(self, name: str, documentation: str, metric_type: str,
+                 callback: Callable[[], List[Tuple[Dict[str, str], float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.type = metric_type
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        return [f"{self.name}{_format_labels(_label_key(labels))} {_format_value(value)}" for labels, value in values]
+
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def register_callback(self, name: str, documentation: str, metric_type: str,
+                          callback: Callable[[], List[Tuple[Dict[str, str], float]]]) -> CallbackMetric:
+        """
+        Register a gauge or counter computed on demand
+
+        Args:
+            name: Metric name
+            documentation: HELP text
+            metric_type: "gauge" or "counter"
+            callback: Returns a list of (labels, value) samples
+        """
+        with self._lock:
+            metric = CallbackMetric(name, documentation, metric_type, callback)
+            self._metrics[name] = metric  # Re-registration replaces the callback
+            return metric
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """Per-request stage durations, reported as a Server-Timing header"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """Format stages as a Server-Timing header value (durations in ms)"""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+metrics = MetricsRegistry()
+
+REQUEST_DURATION = metrics.histogram(
+    "analytics_gpt_request_duration_seconds",
+    "End-to-end HTTP request latency by endpoint"
+)
+STAGE_DURATION = metrics.histogram(
+    "analytics_gpt_stage_duration_seconds",
+    "Latency of individual request stages (catalog, llm, validate, execute, serialize, ...)"
+)
+RESPONSE_BYTES = metrics.histogram(
+    "analytics_gpt_response_bytes",
+    "Response body size by endpoint",
+    buckets=SIZE_BUCKETS
+)
+ROWS_RETURNED = metrics.histogram(
+    "analytics_gpt_rows_returned",
+    "Rows returned per query by endpoint",
+    buckets=ROW_BUCKETS
+)
+REQUESTS_TOTAL = metrics.counter(
+    "analytics_gpt_requests_total",
+    "HTTP requests by endpoint and status code"
+)
+
+_current_timer: ContextVar[Optional[RequestTimer]] = ContextVar("analytics_gpt_request_timer", default=None)
+_inside_stage: ContextVar[bool] = ContextVar("analytics_gpt_inside_stage", default=False)
+
+
+def start_request_timer() -> Tuple[RequestTimer, object]:
+    """
+    Start timing a request in the current context
+
+    Returns:
+        Tuple of (timer, token) - pass the token to end_request_timer
+    """
+    timer = RequestTimer()
+    return timer, _current_timer.set(timer)
+
+
+def end_request_timer(token: object):
+    """Stop tracking the request timer started with start_request_timer"""
+    _current_timer.reset(token)
+
+
+def current_timer() -> Optional[RequestTimer]:
+    """Timer of the request being handled, if any"""
+    return _current_timer.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a block as a named stage
+
+    The duration is recorded in the stage latency histogram and, when called
+    while handling a request, in that request's Server-Timing header. Stages
+    nested inside another stage (e.g. the sample-data query run during a
+    catalog lookup) only feed the histogram, so Server-Timing entries never
+    overlap.
+
+    Args:
+        name: Stage name, e.g. "llm" or "execute"
+    """
+    nested = _inside_stage.get()
+    token = _inside_stage.set(True)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _inside_stage.reset(token)
+        STAGE_DURATION.observe(seconds, {"stage": name})
+        timer = _current_timer.get()
+        if timer is not None and not nested:
+            timer.add(name, seconds)
@@ -1,7 +1,16 @@
-import re
+import hashlib
+import os
+import sqlite3
+import threading
 import time
-from typing import Tuple, List, Dict, Any
-import sqlparse
+from collections import OrderedDict
+from typing import Tuple, List, Dict, Any, Iterator, Optional
+from .sql_tokenizer import Token, tokenize, is_terminated, identifier_name
+from .engines import COLUMNAR_ERRORS, SQLITE
+from .metrics import stage
+from .result_set import ResultSet
+from .sampling import SampleTable
+from .text_search import TextSearchIndex
 
 
 class QueryExecutor:
@@ -15,14 +24,26 @@ class QueryExecutor:
         'EXEC', 'EXECUTE', 'PRAGMA'
     ]
 
+    _FORBIDDEN = frozenset(FORBIDDEN_KEYWORDS)
+
     # Allowed keywords for read-only queries
     ALLOWED_KEYWORDS = ['SELECT', 'FROM', 'WHERE', 'JOIN', 'ON', 'GROUP', 'ORDER', 'LIMIT', 'OFFSET']
 
+    # Validation verdicts memoized by SQL hash
+    VALIDATION_CACHE_SIZE = int(os.getenv("VALIDATION_CACHE_SIZE", 4096))
+    _validation_cache: "OrderedDict[bytes, Tuple[bool, str]]" = OrderedDict()
+    _validation_lock = threading.Lock()
+    validation_cache_hits = 0
+    validation_cache_misses = 0
+
     @staticmethod
     def validate_query(sql: str, table_name: str = None) -> Tuple[bool, str]:
         """
         Validate SQL query for security
 
+        Verdicts are memoized by a hash of the SQL and table name, so repeated
+        queries skip tokenizing altogether.
+
         Args:
             sql: SQL query string
             table_name: Expected table name (optional)
@@ -33,40 +54,93 @@ class QueryExecutor:
         if not sql or not sql.strip():
             return False, "Empty query"
 
-        sql_upper = sql.upper()
+        key = hashlib.blake2b(f"{table_name or ''}\0{sql}".encode("utf-8"), digest_size=16).digest()
+        cache = QueryExecutor._validation_cache
+
+        with QueryExecutor._validation_lock:
+            verdict = cache.get(key)
+            if verdict is not None:
+                cache.move_to_end(key)
+                QueryExecutor.validation_cache_hits += 1
+                return verdict
+
+        verdict = QueryExecutor._check_tokens(tokenize(sql), table_name)
+
+        with QueryExecutor._validation_lock:
+            QueryExecutor.validation_cache_misses += 1
+            cache[key] = verdict
+            if len(cache) > QueryExecutor.VALIDATION_CACHE_SIZE:
+                cache.popitem(last=False)
+
+        return verdict
+
+    @staticmethod
+    def _check_tokens(tokens: List[Token], table_name: str = None) -> Tuple[bool, str]:
+        """
+        Validate a tokenized query in a single pass
+
+        Keywords are only matched against bare words, so string literals and
+        quoted identifiers never trigger false positives.
+
+        Args:
+            tokens: Tokens from sql_tokenizer.tokenize
+            table_name: Expected table name (optional)
 
-        # Must be a SELECT statement
-        if not sql_upper.strip().startswith('SELECT'):
+        Returns:
+            Tuple of (is_valid, error_message)
+        """
+        unsafe = (False, "Potentially unsafe SQL pattern detected")
+
+        if not tokens or tokens[0].kind != "word" or tokens[0].value.upper() != "SELECT":
+            if tokens and tokens[0].kind == "comment":
+                return unsafe
             return False, "Only SELECT queries are allowed"
 
-        # Check for forbidden keywords
-        for keyword in QueryExecutor.FORBIDDEN_KEYWORDS:
-            # Use word boundaries to avoid false positives
-            pattern = r'\b' + keyword + r'\b'
-            if re.search(pattern, sql_upper):
-                return False, f"Forbidden keyword detected: {keyword}"
-
-        # Check for SQL injection patterns
-        injection_patterns = [
-            r';\s*SELECT',  # Multiple statements
-            r';\s*DROP',
-            r';\s*DELETE',
-            r'--',  # SQL comments
-            r'/\*',  # Multi-line comments
-            r'\bUNION\b.*\bSELECT\b',  # UNION-based injection (basic check)
-        ]
-
-        for pattern in injection_patterns:
-            if re.search(pattern, sql_upper):
-                return False, "Potentially unsafe SQL pattern detected"
-
-        # Validate table name if provided
-        if table_name:
-            if table_name.upper() not in sql_upper:
-                return False, f"Query must reference table: {table_name}"
-
-        # Check for basic SQL syntax
-        if 'FROM' not in sql_upper:
+        expected_table = table_name.upper() if table_name else None
+        references_table = False
+        has_from = False
+        union_seen = False
+        statement_ended = False
+
+        for index, token in enumerate(tokens):
+            kind = token.kind
+
+            if statement_ended:
+                # Anything after a semicolon is a second statement
+                return unsafe
+
+            if kind == "comment" or not is_terminated(token):
+                return unsafe
+
+            if kind == "punctuation":
+                if token.value == ";":
+                    statement_ended = True
+                continue
+
+            if kind == "word":
+                word = token.value.upper()
+
+                if word in QueryExecutor._FORBIDDEN:
+                    # REPLACE(...) is the string function, not the statement
+                    next_token = tokens[index + 1] if index + 1 < len(tokens) else None
+                    is_call = next_token is not None and next_token.value == "("
+                    if not (word == "REPLACE" and is_call):
+                        return False, f"Forbidden keyword detected: {word}"
+                elif word == "FROM":
+                    has_from = True
+                elif word == "UNION":
+                    union_seen = True
+                elif word == "SELECT" and union_seen:
+                    return unsafe
+
+            if expected_table and kind in ("word", "identifier"):
+                if identifier_name(token).upper() == expected_table:
+                    references_table = True
+
+        if expected_table and not references_table:
+            return False, f"Query must reference table: {table_name}"
+
+        if not has_from:
             return False, "Invalid SQL: missing FROM clause"
 
         return True, ""
@@ -74,7 +148,7 @@ class QueryExecutor:
     @staticmethod
     def sanitize_query(sql: str) -> str:
         """
-        Sanitize SQL query
+        Sanitize SQL query for execution
 
         Args:
             sql: Raw SQL query
@@ -83,26 +157,81 @@ class QueryExecutor:
             Sanitized SQL query
         """
         # Remove trailing semicolons
-        sql = sql.rstrip(';').strip()
+        return sql.strip().rstrip(';').strip()
+
+    @staticmethod
+    def route_query(database_service, sql: str, table_name: str = None) -> Optional[str]:
+        """
+        Rewrite a validated aggregate query to read a precomputed rollup
+
+        See RollupManager.route. A routed query reads only the rollup, so it
+        is executed without attaching (or restoring) the table.
+
+        Args:
+            database_service: DatabaseService instance
+            sql: Validated, sanitized SQL query
+            table_name: Table the query reads
+
+        Returns:
+            SQL against a rollup, or None if no rollup answers the query
+        """
+        if not table_name:
+            return None
+        with stage("route"):
+            return database_service.rollups.route(sql, table_name)
+
+    @staticmethod
+    def rewrite_query(database_service, sql: str, table_name: str = None) -> str:
+        """
+        Rewrite a validated query to use the table's search index
+
+        LIKE predicates on columns with a trigram index are narrowed with FTS5
+        lookups (see TextSearchIndex.rewrite). Returns sql unchanged when the
+        table has no index.
+
+        Args:
+            database_service: DatabaseService instance
+            sql: Validated, sanitized SQL query
+            table_name: Table the query reads
+
+        Returns:
+            SQL to execute
+        """
+        if not table_name or "like" not in sql.lower():
+            return sql
+        with stage("rewrite"):
+            return TextSearchIndex.rewrite(sql, table_name, database_service.search_columns(table_name))
+
+    @staticmethod
+    def format_query(sql: str) -> str:
+        """
+        Pretty-print SQL query for display
+
+        Kept off the execution path; SQLite does not care about layout.
+
+        Args:
+            sql: SQL query
+
+        Returns:
+            Reindented SQL query with upper-case keywords
+        """
+        import sqlparse
 
-        # Format SQL using sqlparse (optional, for readability)
         try:
-            sql = sqlparse.format(
+            return sqlparse.format(
                 sql,
                 reindent=True,
                 keyword_case='upper'
             )
-        except:
-            pass  # If formatting fails, use original
-
-        return sql
+        except Exception:
+            return sql  # If formatting fails, use original
 
     @staticmethod
     def execute_safe_query(
         database_service,
         sql: str,
         table_name: str = None
-    ) -> Tuple[List[Dict[str, Any]], str, str]:
+    ) -> Tuple[ResultSet, str, str]:
         """
         Execute query safely with validation
 
@@ -112,29 +241,217 @@ class QueryExecutor:
             table_name: Expected table name
 
         Returns:
-            Tuple of (results, execution_time, error_message)
+            Tuple of (results, execution_time, error_message); results is
+            empty when there is an error
         """
-        # Validate query
-        is_valid, error_msg = QueryExecutor.validate_query(sql, table_name)
+        # Validate and sanitize query
+        with stage("validate"):
+            is_valid, error_msg = QueryExecutor.validate_query(sql, table_name)
+            if is_valid:
+                sql = QueryExecutor.sanitize_query(sql)
 
         if not is_valid:
-            return [], "0s", error_msg
-
-        # Sanitize query
-        sql = QueryExecutor.sanitize_query(sql)
+            return ResultSet(()), "0s", error_msg
 
         # Execute query with timing
         start_time = time.time()
 
         try:
-            results = database_service.execute_query(sql)
+            rewritten = QueryExecutor.route_query(database_service, sql, table_name)
+            reads = None if rewritten else table_name
+            rewritten = rewritten or QueryExecutor.rewrite_query(database_service, sql, table_name)
+            engine = SQLITE
+            if reads and rewritten == sql:
+                with stage("engine"):
+                    engine, rewritten = database_service.choose_engine(sql, table_name)
+            try:
+                results = database_service.execute_query(rewritten, table_name=reads, engine=engine)
+            except COLUMNAR_ERRORS:
+                # SQLite answers whatever the columnar engine cannot
+                database_service.columnar.record_fallback()
+                results = database_service.execute_query(sql, table_name=table_name)
+            except sqlite3.OperationalError:
+                if rewritten == sql:
+                    raise
+                # The table or rollup was replaced after the rewrite; run the query as written
+                results = database_service.execute_query(sql, table_name=table_name)
             execution_time = time.time() - start_time
 
             return results, f"{execution_time:.3f}s", ""
 
         except Exception as e:
             execution_time = time.time() - start_time
-            return [], f"{execution_time:.3f}s", f"Query execution error: {str(e)}"
+            return ResultSet(()), f"{execution_time:.3f}s", f"Query execution error: {str(e)}"
+
+    @staticmethod
+    def sample_query(
+        database_service,
+        sql: str,
+        table_name: str,
+        mode: str = "auto"
+    ) -> Optional[Tuple[str, List[Tuple[int, int]], Dict[str, Any]]]:
+        """
+        Decide whether to answer a validated query from the table's sample
+
+        "approximate" uses the sample whenever the query can be estimated.
+        "auto" is the cost gate: it also requires a table of at least
+        SampleTable.AUTO_ROWS rows, a plan that scans the whole table, and no
+        rollup that answers the query exactly.
+
+        Args:
+            database_service: DatabaseService instance
+            sql: Validated, sanitized SQL query
+            table_name: Table the query reads
+            mode: "auto" or "approximate"
+
+        Returns:
+            Tuple of (SQL against the sample, variance column pairs, sample
+            info), or None to run the query exactly
+        """
+        sample = database_service.sample_info(table_name)
+        if not sample:
+            return None
+        rewritten = SampleTable.rewrite(sql, table_name)
+        if rewritten is None:
+            return None
+
+        if mode == "auto":
+            if sample["table_rows"] < SampleTable.AUTO_ROWS:
+                return None
+            if database_service.rollups.route(sql, table_name, record=False):
+                return None
+            plan = database_service.query_plan(sql, table_name)
+            if not any(step.startswith("SCAN ") and "INDEX" not in step for step in plan):
+                return None
+        return rewritten[0], rewritten[1], sample
+
+    @staticmethod
+    def execute_approximate_query(
+        database_service,
+        sql: str,
+        table_name: str = None,
+        mode: str = "auto"
+    ) -> Tuple[ResultSet, str, str, Optional[Dict[str, Any]]]:
+        """
+        Execute query safely, estimating it from the table's sample when mode allows
+
+        Args:
+            database_service: DatabaseService instance
+            sql: SQL query
+            table_name: Expected table name
+            mode: "exact", "approximate" or "auto" (see sample_query)
+
+        Returns:
+            Tuple of (results, execution_time, error_message, approximation);
+            approximation is None for exact answers, else a dict with
+            sample_rows, table_rows, confidence and per-column error_bounds
+        """
+        approximated = QueryExecutor.approximate_query(database_service, sql, table_name, mode)
+        if approximated:
+            results, execution_time, approximation = approximated
+            return results, execution_time, "", approximation
+
+        results, execution_time, error = QueryExecutor.execute_safe_query(database_service, sql, table_name)
+        return results, execution_time, error, None
+
+    @staticmethod
+    def approximate_query(
+        database_service,
+        sql: str,
+        table_name: str = None,
+        mode: str = "auto"
+    ) -> Optional[Tuple[ResultSet, str, Dict[str, Any]]]:
+        """
+        Estimate a query from the table's sample, if mode and the query allow it
+
+        Args:
+            database_service: DatabaseService instance
+            sql: SQL query
+            table_name: Expected table name
+            mode: "exact", "approximate" or "auto" (see sample_query)
+
+        Returns:
+            Tuple of (results, execution_time, approximation) as in
+            execute_approximate_query, or None if the query must run exactly
+        """
+        if mode == "exact" or not table_name:
+            return None
+        with stage("validate"):
+            is_valid, _ = QueryExecutor.validate_query(sql, table_name)
+        if not is_valid:
+            return None
+
+        start_time = time.time()
+        clean_sql = QueryExecutor.sanitize_query(sql)
+        with stage("sample"):
+            planned = QueryExecutor.sample_query(database_service, clean_sql, table_name, mode)
+        if not planned:
+            return None
+        sample_sql, bounds, sample = planned
+        try:
+            results = database_service.execute_query(sample_sql, table_name=table_name)
+        except sqlite3.OperationalError:
+            return None  # The table was replaced without a sample; answer exactly
+        results, error_bounds = SampleTable.split_bounds(results, bounds)
+        approximation = {
+            "sample_rows": sample["rows"],
+            "table_rows": sample["table_rows"],
+            "confidence": SampleTable.CONFIDENCE,
+            "error_bounds": error_bounds,
+        }
+        return results, f"{time.time() - start_time:.3f}s", approximation
+
+    @staticmethod
+    def stream_safe_query(
+        database_service,
+        sql: str,
+        table_name: str = None,
+        batch_size: int = 500
+    ) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """
+        Execute query safely with validation, yielding row batches
+
+        Args:
+            database_service: DatabaseService instance
+            sql: SQL query
+            table_name: Expected table name
+            batch_size: Maximum number of rows per batch
+
+        Yields:
+            Tuples of (column_names, rows) as produced by DatabaseService.iter_query
+
+        Raises:
+            ValueError: If the query fails validation
+        """
+        is_valid, error_msg = QueryExecutor.validate_query(sql, table_name)
+
+        if not is_valid:
+            raise ValueError(error_msg)
+
+        sql = QueryExecutor.sanitize_query(sql)
+        rewritten = QueryExecutor.route_query(database_service, sql, table_name)
+        reads = None if rewritten else table_name
+        rewritten = rewritten or QueryExecutor.rewrite_query(database_service, sql, table_name)
+        engine = SQLITE
+        if reads and rewritten == sql:
+            engine, rewritten = database_service.choose_engine(sql, table_name)
+
+        batches = database_service.iter_query(rewritten, batch_size=batch_size, table_name=reads, engine=engine)
+        if rewritten != sql:
+            try:
+                first = next(batches)
+            except StopIteration:
+                return
+            except COLUMNAR_ERRORS:
+                # SQLite answers whatever the columnar engine cannot
+                database_service.columnar.record_fallback()
+                batches = database_service.iter_query(sql, batch_size=batch_size, table_name=table_name)
+            except sqlite3.OperationalError:
+                # The table or rollup was replaced after the rewrite; run the query as written
+                batches = database_service.iter_query(sql, batch_size=batch_size, table_name=table_name)
+            else:
+                yield first
+        yield from batches
 
     @staticmethod
     def analyze_query(sql: str) -> Dict[str, Any]:
@@ -0,0 +1,340 @@
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from .sql_tokenizer import fingerprint_sql, normalize_sql
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class QueryHistoryStore:
+    """
+    Append-only log of executed queries with SQL fingerprints
+
+    record() only enqueues; a background thread writes queued entries in
+    batches to a separate SQLite file, so request handling never waits on
+    history writes or contends with the analytics database. The same thread
+    deletes entries past the retention age or row limit every few minutes.
+    """
+
+    # Entries written per transaction and the longest an entry waits to be written
+    BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", 200))
+    FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 1.0))
+
+    # Entries buffered in memory before new ones are dropped
+    MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", 10000))
+
+    # Entries older than this, or beyond the newest MAX_ROWS, are deleted
+    RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", 30))
+    MAX_ROWS = int(os.getenv("HISTORY_MAX_ROWS", 200000))
+
+    # Seconds between retention passes of the writer
+    PRUNE_INTERVAL = 600
+
+    def __init__(self, db_dir: str = "backend/databases"):
+        os.makedirs(db_dir, exist_ok=True)
+        self.db_path = os.path.join(db_dir, "query_history.db")
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=self.MAX_PENDING)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self.dropped = 0
+        self._init_table()
+
+    def _init_table(self):
+        """Create the history table if needed"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL,
+                    question TEXT,
+                    sql_query TEXT,
+                    normalized_sql TEXT,
+                    fingerprint TEXT,
+                    table_name TEXT,
+                    stages TEXT,
+                    total_ms REAL,
+                    execution_ms REAL,
+                    row_count INTEGER,
+                    cache TEXT,
+                    success INTEGER,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_query_history_created_at ON query_history (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_query_history_fingerprint ON query_history (fingerprint)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record(
+        self,
+        question: str,
+        sql_query: str,
+        table_name: str,
+        stages: Dict[str, float],
+        total_seconds: float,
+        row_count: int,
+        cache: str,
+        error: str = ""
+    ):
+        """
+        Queue an executed query for the history log (never blocks)
+
+        Args:
+            question: Natural language question
+            sql_query: SQL that was executed
+            table_name: Target table
+            stages: Stage name -> duration in seconds
+            total_seconds: End-to-end duration in seconds
+            row_count: Rows returned
+            cache: Question cache outcome, "hit" or "miss"
+            error: Execution error message, empty on success
+        """
+        self._ensure_writer()
+        entry = {
+            "created_at": datetime.now().isoformat(),
+            "question": question,
+            "sql_query": sql_query,
+            "table_name": table_name,
+            "stages": stages,
+            "total_ms": total_seconds * 1000,
+            "execution_ms": stages.get("execute", 0.0) * 1000,
+            "row_count": row_count,
+            "cache": cache,
+            "error": error
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        """Start the background writer on first use"""
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="query-history-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        """Drain the queue in batches until a None sentinel arrives"""
+        # Other worker processes write batches to the same file
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        running = True
+        next_prune = time.monotonic()
+
+        while running:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.FLUSH_INTERVAL)
+                batch.append(item)
+                deadline = time.monotonic() + self.FLUSH_INTERVAL
+                while len(batch) < self.BATCH_SIZE and time.monotonic() < deadline:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+
+            entries = [entry for entry in batch if entry is not None]
+            running = len(entries) == len(batch)
+
+            if entries:
+                try:
+                    self._insert(conn, entries)
+                except sqlite3.Error:
+                    self.dropped += len(entries)
+
+            if time.monotonic() >= next_prune:
+                try:
+                    self._prune(conn)
+                except sqlite3.Error:
+                    pass  # Busy; pruned on the next pass
+                next_prune = time.monotonic() + self.PRUNE_INTERVAL
+
+            for _ in batch:
+                self._queue.task_done()
+
+        conn.close()
+
+    def _prune(self, conn: sqlite3.Connection):
+        """Delete entries past the retention age and beyond the newest MAX_ROWS"""
+        with conn:
+            conn.execute("DELETE FROM query_history WHERE created_at < ?", (self._since(self.RETENTION_DAYS * 24),))
+            conn.execute(
+                "DELETE FROM query_history WHERE id <= (SELECT MAX(id) FROM query_history) - ?", (self.MAX_ROWS,)
+            )
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, entries: List[Dict[str, Any]]):
+        """Write a batch of entries in one transaction"""
+        rows = []
+        for entry in entries:
+            sql = entry["sql_query"] or ""
+            rows.append((
+                entry["created_at"],
+                entry["question"],
+                sql,
+                normalize_sql(sql),
+                fingerprint_sql(sql),
+                entry["table_name"],
+                json.dumps({name: round(seconds * 1000, 3) for name, seconds in entry["stages"].items()}),
+                entry["total_ms"],
+                entry["execution_ms"],
+                entry["row_count"],
+                entry["cache"],
+                0 if entry["error"] else 1,
+                entry["error"] or None
+            ))
+        with conn:
+            conn.executemany("""
+                INSERT INTO query_history (
+                    created_at, question, sql_query, normalized_sql, fingerprint, table_name,
+                    stages, total_ms, execution_ms, row_count, cache, success, error
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def flush(self):
+        """Block until every queued entry has been written"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write pending entries and stop the background writer"""
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join(timeout=10)
+        self._writer = None
+
+    def _read(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _since(hours: float) -> str:
+        return (datetime.now() - timedelta(hours=hours)).isoformat()
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Most recent history entries
+
+        Args:
+            limit: Maximum number of entries
+
+        Returns:
+            List of entries, newest first
+        """
+        rows = self._read("""
+            SELECT created_at, question, sql_query, fingerprint, table_name, stages,
+                   total_ms, execution_ms, row_count, cache, success, error
+            FROM query_history
+            ORDER BY id DESC
+            LIMIT ?
+        """, (limit,))
+
+        return [
+            {**dict(row), "stages": json.loads(row["stages"] or "{}"), "success": bool(row["success"])}
+            for row in rows
+        ]
+
+    def fingerprint_stats(self, hours: float = 24, order_by: str = "count", limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Latency percentiles per SQL fingerprint
+
+        Args:
+            hours: Only consider queries from the last N hours
+            order_by: "count" for the most frequent or "p95" for the slowest
+            limit: Maximum number of fingerprints
+
+        Returns:
+            List of dicts with fingerprint, example SQL, tables, count and
+            p50/p95/p99/max of total and execution latency in milliseconds
+        """
+        rows = self._read("""
+            SELECT fingerprint, normalized_sql, table_name, total_ms, execution_ms, row_count
+            FROM query_history
+            WHERE created_at >= ?
+        """, (self._since(hours),))
+
+        groups: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            group = groups.setdefault(row["fingerprint"], {
+                "fingerprint": row["fingerprint"],
+                "normalized_sql": row["normalized_sql"],
+                "tables": set(),
+                "total": [],
+                "execution": [],
+                "rows": 0
+            })
+            group["tables"].add(row["table_name"])
+            group["total"].append(row["total_ms"] or 0.0)
+            group["execution"].append(row["execution_ms"] or 0.0)
+            group["rows"] += row["row_count"] or 0
+
+        stats = []
+        for group in groups.values():
+            total = sorted(group["total"])
+            execution = sorted(group["execution"])
+            stats.append({
+                "fingerprint": group["fingerprint"],
+                "normalized_sql": group["normalized_sql"],
+                "tables": sorted(group["tables"]),
+                "count": len(total),
+                "avg_rows": group["rows"] / len(total),
+                "p50_ms": _percentile(total, 0.50),
+                "p95_ms": _percentile(total, 0.95),
+                "p99_ms": _percentile(total, 0.99),
+                "max_ms": total[-1],
+                "execution_p50_ms": _percentile(execution, 0.50),
+                "execution_p95_ms": _percentile(execution, 0.95),
+                "execution_p99_ms": _percentile(execution, 0.99)
+            })
+
+        sort_key = "p95_ms" if order_by == "p95" else "count"
+        stats.sort(key=lambda item: item[sort_key], reverse=True)
+        return stats[:limit]
+
+    def table_stats(self, hours: float = 24) -> List[Dict[str, Any]]:
+        """
+        Query volume and time spent per table
+
+        Args:
+            hours: Only consider queries from the last N hours
+
+        Returns:
+            List of dicts with table_name, query count, distinct fingerprints
+            and total/average latency, busiest table first
+        """
+        rows = self._read("""
+            SELECT table_name,
+                   COUNT(*) AS query_count,
+                   COUNT(DISTINCT fingerprint) AS fingerprints,
+                   SUM(total_ms) AS total_ms,
+                   AVG(total_ms) AS avg_ms,
+                   SUM(execution_ms) AS execution_ms
+            FROM query_history
+            WHERE created_at >= ?
+            GROUP BY table_name
+            ORDER BY total_ms DESC
+        """, (self._since(hours),))
+        return [dict(row) for row in rows]
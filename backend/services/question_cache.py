@@ -0,0 +1,402 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+
+class _SchemaIndex:
+    """TF-IDF index over the questions asked against one table schema"""
+
+    def __init__(self):
+        self.entries: Dict[int, Dict[str, Any]] = {}
+        self.by_text: Dict[str, int] = {}
+        self.postings: Dict[str, Set[int]] = {}
+        self.doc_freq: Counter = Counter()
+
+    def add(self, entry_id: int, entry: Dict[str, Any]):
+        self.entries[entry_id] = entry
+        self.by_text[entry["text"]] = entry_id
+        for gram in entry["tf"]:
+            self.postings.setdefault(gram, set()).add(entry_id)
+            self.doc_freq[gram] += 1
+
+    def remove(self, entry_id: int):
+        entry = self.entries.pop(entry_id)
+        self.by_text.pop(entry["text"], None)
+        for gram in entry["tf"]:
+            ids = self.postings[gram]
+            ids.discard(entry_id)
+            if not ids:
+                del self.postings[gram]
+            self.doc_freq[gram] -= 1
+            if self.doc_freq[gram] <= 0:
+                del self.doc_freq[gram]
+
+    def idf(self, gram: str) -> float:
+        # Smoothed IDF so n-grams shared by every question still count a little
+        return math.log((1 + len(self.entries)) / (1 + self.doc_freq.get(gram, 0))) + 1.0
+
+    def norm(self, tf: Dict[str, int]) -> float:
+        return math.sqrt(sum((count * self.idf(gram)) ** 2 for gram, count in tf.items()))
+
+
+class QuestionCache:
+    """
+    Offline near-duplicate question cache for reusing validated SQL
+
+    Questions are embedded as character n-gram TF-IDF vectors, computed
+    locally with no network or external model. Each table schema
+    fingerprint has its own inverted index, so a question only matches
+    earlier questions asked against an identical schema. Total entries are
+    bounded and the least recently used are evicted first.
+
+    With a path, added questions are also appended to a SQLite log that
+    every worker process replays before a lookup, so SQL validated by one
+    worker is reused by all of them and survives restarts.
+    """
+
+    # Minimum cosine similarity for a cache hit
+    SIMILARITY_THRESHOLD = float(os.getenv("QUESTION_CACHE_THRESHOLD", 0.75))
+
+    # Maximum questions kept across all schemas
+    MAX_ENTRIES = int(os.getenv("QUESTION_CACHE_MAX_ENTRIES", 2000))
+
+    NGRAM_SIZE = 3
+
+    # Filler words that do not change what a question asks for
+    STOPWORDS = {
+        'a', 'an', 'the', 'of', 'by', 'per', 'for', 'in', 'on', 'to', 'and',
+        'show', 'me', 'give', 'list', 'get', 'find', 'display', 'what', 'which',
+        'is', 'are', 'was', 'were', 'all', 'total', 'each', 'every', 'please',
+        'i', 'want', 'see', 'can', 'you', 'tell', 'with', 'from', 'there'
+    }
+
+    # Suffixes that turn one spelling of a word into another
+    INFLECTIONS = {'s', 'es', 'ed', 'ing'}
+
+    # Shortest word in which a one-letter typo is forgiven
+    MIN_TYPO_LENGTH = 5
+
+    # Words that ask for the opposite of each other; never the same word, however they are spelled
+    OPPOSITES = {
+        frozenset(pair) for pair in (
+            ('asc', 'desc'), ('ascending', 'descending'), ('min', 'max'), ('minimum', 'maximum'),
+            ('highest', 'lowest'), ('high', 'low'), ('before', 'after'), ('first', 'last'),
+            ('top', 'bottom'), ('most', 'least'), ('more', 'less'), ('above', 'below'),
+            ('largest', 'smallest'), ('earliest', 'latest'), ('oldest', 'newest'), ('increase', 'decrease'),
+        )
+    }
+
+    def __init__(self, threshold: float = None, max_entries: int = None, path: str = None):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            max_entries: Maximum questions kept across all schemas
+            path: SQLite file shared with other worker processes; None keeps
+                the cache in this process only
+        """
+        self.threshold = threshold if threshold is not None else self.SIMILARITY_THRESHOLD
+        self.max_entries = max_entries if max_entries is not None else self.MAX_ENTRIES
+        self._indexes: Dict[str, _SchemaIndex] = {}
+        self._lru: "OrderedDict[int, str]" = OrderedDict()  # entry_id -> fingerprint
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._log: Optional[sqlite3.Connection] = None
+        self._log_version = None  # PRAGMA data_version when the log was last replayed
+        self._replayed = 0  # Highest log id applied
+        if path:
+            self._log = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._log.execute("PRAGMA journal_mode=WAL")
+            self._log.execute("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fingerprint TEXT NOT NULL,
+                    question TEXT,
+                    sql TEXT
+                )
+            """)
+            with self._lock:
+                self._replay()
+
+    @staticmethod
+    def schema_fingerprint(table_name: str, schema: Dict[str, Any]) -> str:
+        """
+        Fingerprint a table schema so SQL is only reused against the same columns
+
+        Args:
+            table_name: Name of the table
+            schema: Table schema information (as returned by get_table_schema)
+
+        Returns:
+            Hex digest identifying the table name and its column names and types
+        """
+        columns = ",".join(f"{col['name']}:{col['type']}" for col in schema.get('columns', []))
+        return hashlib.sha1(f"{table_name}|{columns}".encode("utf-8")).hexdigest()
+
+    @classmethod
+    def _normalize(cls, question: str) -> str:
+        """Lowercase, drop punctuation and filler words, collapse whitespace"""
+        text = re.sub(r"[^a-z0-9.'\s]", " ", question.lower())
+        return " ".join(word for word in text.split() if word not in cls.STOPWORDS)
+
+    @classmethod
+    def _ngrams(cls, text: str) -> Dict[str, int]:
+        """Character n-grams of each word, padded at word boundaries"""
+        grams = Counter()
+        for word in text.split():
+            padded = f" {word} "
+            if len(padded) <= cls.NGRAM_SIZE:
+                grams[padded] += 1
+                continue
+            for i in range(len(padded) - cls.NGRAM_SIZE + 1):
+                grams[padded[i:i + cls.NGRAM_SIZE]] += 1
+        return dict(grams)
+
+    @classmethod
+    def _guard_terms(cls, text: str) -> Tuple[frozenset, List[str]]:
+        """
+        Extract the terms two questions must agree on to share SQL
+
+        Returns:
+            Tuple of (literal tokens such as numbers and quoted values, content words)
+        """
+        literals = frozenset(re.findall(r"\d+(?:\.\d+)?|'[^']*'", text))
+        words = [
+            word for word in re.findall(r"[a-z]+", text)
+            if word not in cls.STOPWORDS
+        ]
+        return literals, words
+
+    @classmethod
+    def _words_match(cls, left: List[str], right: List[str]) -> bool:
+        """Every content word on either side has a close spelling on the other"""
+        def close(a: str, b: str) -> bool:
+            if a == b:
+                return True
+            if frozenset((a, b)) in cls.OPPOSITES:
+                return False
+            shorter, longer = sorted((a, b), key=len)
+            if longer.startswith(shorter):
+                # Inflections of the same word ("order", "orders"), not different words sharing a stem ("count", "county")
+                return len(shorter) >= 4 and longer[len(shorter):] in cls.INFLECTIONS
+            # One typo: a letter added, dropped, replaced or swapped with its neighbour ("salray", "slaary")
+            return len(shorter) >= cls.MIN_TYPO_LENGTH and cls._one_edit_apart(a, b)
+
+        return (
+            all(any(close(a, b) for b in right) for a in left)
+            and all(any(close(b, a) for a in left) for b in right)
+        )
+
+    @staticmethod
+    def _one_edit_apart(a: str, b: str) -> bool:
+        """Damerau-Levenshtein distance of exactly one between two different words"""
+        if len(a) > len(b):
+            a, b = b, a
+        if len(b) - len(a) > 1:
+            return False
+        start = 0
+        while start < len(a) and a[start] == b[start]:
+            start += 1
+        if len(a) < len(b):
+            return a[start:] == b[start + 1:]
+        if a[start + 1:] == b[start + 1:]:
+            return True
+        return (
+            start + 1 < len(a) and a[start] == b[start + 1] and a[start + 1] == b[start]
+            and a[start + 2:] == b[start + 2:]
+        )
+
+    def lookup(self, fingerprint: str, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a previously answered question similar enough to reuse its SQL
+
+        Args:
+            fingerprint: Schema fingerprint of the target table
+            question: Natural language question
+
+        Returns:
+            Dict with sql, question and similarity of the best match, or None
+        """
+        text = self._normalize(question)
+
+        with self._lock:
+            self._replay()
+            index = self._indexes.get(fingerprint)
+            if index is None or not index.entries:
+                self.misses += 1
+                return None
+
+            # Exact (normalized) repeat
+            entry_id = index.by_text.get(text)
+            if entry_id is not None:
+                return self._hit(entry_id, index.entries[entry_id], 1.0)
+
+            tf = self._ngrams(text)
+            query_norm = index.norm(tf)
+            if query_norm == 0:
+                self.misses += 1
+                return None
+
+            # Score only entries sharing at least one n-gram
+            dots: Dict[int, float] = {}
+            for gram, count in tf.items():
+                ids = index.postings.get(gram)
+                if not ids:
+                    continue
+                weight = count * index.idf(gram) ** 2
+                for candidate in ids:
+                    dots[candidate] = dots.get(candidate, 0.0) + weight * index.entries[candidate]["tf"][gram]
+
+            literals, words = self._guard_terms(text)
+            best_id, best_score = None, 0.0
+            for candidate, dot in dots.items():
+                entry = index.entries[candidate]
+                score = dot / (query_norm * index.norm(entry["tf"]))
+                if score < self.threshold or score <= best_score:
+                    continue
+                if entry["literals"] != literals or not self._words_match(words, entry["words"]):
+                    continue
+                best_id, best_score = candidate, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            return self._hit(best_id, index.entries[best_id], best_score)
+
+    def _hit(self, entry_id: int, entry: Dict[str, Any], similarity: float) -> Dict[str, Any]:
+        """Record a hit and refresh the entry's recency (lock held)"""
+        self.hits += 1
+        self._lru.move_to_end(entry_id)
+        return {"sql": entry["sql"], "question": entry["question"], "similarity": similarity}
+
+    def add(self, fingerprint: str, question: str, sql: str):
+        """
+        Remember validated SQL for a question
+
+        Args:
+            fingerprint: Schema fingerprint of the target table
+            question: Natural language question
+            sql: SQL query that was validated and executed successfully
+        """
+        if not self._normalize(question):
+            return
+
+        with self._lock:
+            self._replay()
+            self._add(fingerprint, question, sql)
+            self._append(fingerprint, question, sql)
+
+    def _add(self, fingerprint: str, question: str, sql: str):
+        """Index a question (lock held)"""
+        text = self._normalize(question)
+        if not text:
+            return
+        literals, words = self._guard_terms(text)
+
+        index = self._indexes.setdefault(fingerprint, _SchemaIndex())
+
+        existing = index.by_text.get(text)
+        if existing is not None:
+            index.entries[existing]["sql"] = sql
+            self._lru.move_to_end(existing)
+            return
+
+        entry_id = self._next_id
+        self._next_id += 1
+        index.add(entry_id, {
+            "question": question,
+            "text": text,
+            "sql": sql,
+            "tf": self._ngrams(text),
+            "literals": literals,
+            "words": words
+        })
+        self._lru[entry_id] = fingerprint
+
+        while len(self._lru) > self.max_entries:
+            evicted_id, evicted_fingerprint = self._lru.popitem(last=False)
+            evicted_index = self._indexes[evicted_fingerprint]
+            evicted_index.remove(evicted_id)
+            if not evicted_index.entries:
+                del self._indexes[evicted_fingerprint]
+
+    def _append(self, fingerprint: str, question: Optional[str], sql: Optional[str]):
+        """Write a question (or, without one, an invalidation) to the shared log (lock held)"""
+        if self._log is None:
+            return
+        try:
+            cursor = self._log.execute(
+                "INSERT INTO questions (fingerprint, question, sql) VALUES (?, ?, ?)", (fingerprint, question, sql)
+            )
+            # Our own write is already applied
+            if cursor.lastrowid == self._replayed + 1:
+                self._replayed = cursor.lastrowid
+            # Keep the log short; entries that old are evicted on replay anyway
+            if cursor.lastrowid % self.max_entries == 0:
+                self._log.execute("DELETE FROM questions WHERE id <= ?", (cursor.lastrowid - 2 * self.max_entries,))
+        except sqlite3.Error:
+            pass  # The cache works without the log; other workers miss this entry
+
+    def _replay(self):
+        """Apply entries other workers appended to the shared log (lock held)"""
+        if self._log is None:
+            return
+        try:
+            version = self._log.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._log_version:
+                return  # No other connection wrote since the last replay
+            rows = self._log.execute(
+                "SELECT id, fingerprint, question, sql FROM questions WHERE id > ? ORDER BY id", (self._replayed,)
+            ).fetchall()
+        except sqlite3.Error:
+            return
+        self._log_version = version
+        for log_id, fingerprint, question, sql in rows:
+            if question is None:
+                self._drop(fingerprint, sql)
+            else:
+                self._add(fingerprint, question, sql)
+            self._replayed = log_id
+
+    def invalidate(self, fingerprint: str, sql: str = None):
+        """
+        Drop cached questions of a schema
+
+        Args:
+            fingerprint: Schema fingerprint
+            sql: Only drop the questions answered with this SQL; None drops them all
+        """
+        with self._lock:
+            self._replay()
+            self._drop(fingerprint, sql)
+            self._append(fingerprint, None, sql)
+
+    def _drop(self, fingerprint: str, sql: str = None):
+        """Forget a schema's questions, or only those answered with sql (lock held)"""
+        index = self._indexes.get(fingerprint)
+        if not index:
+            return
+        for entry_id, entry in list(index.entries.items()):
+            if sql is None or entry["sql"] == sql:
+                index.remove(entry_id)
+                self._lru.pop(entry_id, None)
+        if not index.entries:
+            del self._indexes[fingerprint]
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache size and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._lru),
+                "schemas": len(self._indexes),
+                "hits": self.hits,
+                "misses": self.misses
+            }
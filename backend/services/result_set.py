@@ -0,0 +1,208 @@
+import csv
+import io
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TYPE_CHECKING, Tuple
+
+from . import json_encoding
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class RowView(Mapping):
+    """Read-only dict view of one row, resolving names through the shared column index"""
+
+    __slots__ = ("_index", "_row")
+
+    def __init__(self, index: Dict[str, int], row: tuple):
+        self._index = index
+        self._row = row
+
+    def __getitem__(self, column: str) -> Any:
+        return self._row[self._index[column]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class ResultSet:
+    """
+    Query result stored as a column-name tuple plus row tuples
+
+    Rows are kept exactly as the cursor returned them. Dict access goes
+    through lazy RowView objects, and the writers stream the tuples straight
+    into DataFrames, CSV, JSON or Excel, so no per-row dict is built unless a
+    caller asks for one with records().
+    """
+
+    __slots__ = ("columns", "rows", "_index")
+
+    def __init__(self, columns: Sequence[str], rows: Optional[List[tuple]] = None):
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self.rows: List[tuple] = rows if rows is not None else []
+        self._index: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_cursor(cls, cursor) -> "ResultSet":
+        """
+        Fetch every row of an executed cursor
+
+        Args:
+            cursor: sqlite3 cursor with row_factory None
+
+        Returns:
+            ResultSet with the cursor's column names and rows
+        """
+        columns = [description[0] for description in cursor.description] if cursor.description else []
+        return cls(columns, cursor.fetchall())
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "ResultSet":
+        """
+        Build a ResultSet from a list of dicts (e.g. data sent back by the browser)
+
+        Args:
+            records: Rows as dicts; columns are taken from the first row
+
+        Returns:
+            ResultSet with one tuple per record
+        """
+        if not records:
+            return cls(())
+        columns = tuple(records[0].keys())
+        return cls(columns, [tuple(record.get(col) for col in columns) for record in records])
+
+    @property
+    def index(self) -> Dict[str, int]:
+        """Column name -> position, built on first use"""
+        if self._index is None:
+            self._index = {name: position for position, name in enumerate(self.columns)}
+        return self._index
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __bool__(self) -> bool:
+        return bool(self.rows)
+
+    def __iter__(self) -> Iterator[RowView]:
+        index = self.index
+        return (RowView(index, row) for row in self.rows)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return ResultSet(self.columns, self.rows[item])
+        return RowView(self.index, self.rows[item])
+
+    def __repr__(self) -> str:
+        return f"ResultSet(columns={self.columns!r}, rows={len(self.rows)})"
+
+    def column(self, name: str) -> List[Any]:
+        """All values of one column"""
+        position = self.index[name]
+        return [row[position] for row in self.rows]
+
+    def column_major(self) -> List[List[Any]]:
+        """Values grouped per column, in column order"""
+        if not self.rows:
+            return [[] for _ in self.columns]
+        return [list(values) for values in zip(*self.rows)]
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Rows as plain dicts, for callers that need the row-object JSON shape"""
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in self.rows]
+
+    def to_dataframe(self) -> "pd.DataFrame":
+        """Load the rows into a DataFrame without going through dicts"""
+        import pandas as pd
+
+        return pd.DataFrame.from_records(self.rows, columns=list(self.columns))
+
+    def to_json(self) -> bytes:
+        """Encode as {"columns": [...], "rows": [[...], ...]}"""
+        return json_encoding.dumps({"columns": self.columns, "rows": self.rows})
+
+    def iter_csv(self, chunk_rows: int = 1000) -> Iterator[str]:
+        """
+        Encode as CSV text in chunks
+
+        Args:
+            chunk_rows: Rows per chunk
+
+        Returns:
+            Iterator of CSV text chunks, header first
+        """
+        rows = self.rows
+        return iter_csv(self.columns, (rows[start:start + chunk_rows] for start in range(0, len(rows), chunk_rows)))
+
+    def write_csv(self, stream):
+        """Write CSV text to a text stream"""
+        for chunk in self.iter_csv():
+            stream.write(chunk)
+
+    def write_excel(self, stream, sheet_name: str = "Results"):
+        """
+        Write an .xlsx workbook to a binary stream
+
+        Uses openpyxl's write-only mode, which appends rows directly instead
+        of building a cell object graph for the whole sheet.
+
+        Args:
+            stream: Binary file-like object
+            sheet_name: Worksheet title
+        """
+        write_excel(stream, self.columns, [self.rows], sheet_name)
+
+
+def iter_csv(columns: Sequence[str], batches: Iterable[Iterable[tuple]]) -> Iterator[str]:
+    """
+    Encode row batches as CSV text, one chunk per batch
+
+    Args:
+        columns: Header row
+        batches: Iterable of row-tuple batches
+
+    Yields:
+        CSV text, header first
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_excel(stream, columns: Sequence[str], batches: Iterable[Iterable[tuple]], sheet_name: str = "Results"):
+    """
+    Write row batches as an .xlsx workbook in openpyxl write-only mode
+
+    Args:
+        stream: Binary file-like object
+        columns: Header row
+        batches: Iterable of row-tuple batches
+        sheet_name: Worksheet title
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    worksheet.freeze_panes = "A2"  # Freeze the header row
+    worksheet.append(list(columns))
+    for rows in batches:
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(stream)
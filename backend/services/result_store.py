@@ -0,0 +1,319 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .export_formats import column_types, storage_classes_query
+from .result_set import ResultSet
+
+_RESULT_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class ResultStore:
+    """
+    On-disk store for large query results
+
+    Each spilled result is its own SQLite file under <db_dir>/results, named
+    by a random result id. Downloads and page requests read from the file
+    instead of executing the query again or receiving the rows back from the
+    browser. Because the store is plain files, any worker process can serve
+    a result spilled by another.
+    """
+
+    # Results with more rows than this are spilled
+    SPILL_ROWS = int(os.getenv("RESULT_SPILL_ROWS", 1000))
+
+    # Seconds a spilled result stays available
+    TTL_SECONDS = int(os.getenv("RESULT_TTL_SECONDS", 3600))
+
+    # Total disk space for spilled results; the oldest are evicted first
+    QUOTA_BYTES = int(float(os.getenv("RESULT_SPILL_QUOTA_MB", 512)) * 1024 * 1024)
+
+    def __init__(self, db_dir: str = "backend/databases"):
+        self.spill_dir = os.path.join(db_dir, "results")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.cleanup()
+
+    def _path(self, result_id: str) -> Optional[str]:
+        """File for a result id, or None if the id is malformed"""
+        if not _RESULT_ID.fullmatch(result_id or ""):
+            return None
+        return os.path.join(self.spill_dir, f"{result_id}.db")
+
+    def should_spill(self, results: ResultSet) -> bool:
+        """Check whether a result is large enough to spill"""
+        return len(results) > self.SPILL_ROWS
+
+    def spill(self, results: ResultSet, sql_query: str, table_name: str) -> Optional[str]:
+        """
+        Write a result to disk
+
+        Args:
+            results: Query result
+            sql_query: SQL that produced it
+            table_name: Table it was run against
+
+        Returns:
+            Result id, or None if the result does not fit in the quota
+        """
+        writer = self.open_spill(results.columns, sql_query, table_name)
+        try:
+            writer.write(results.rows)
+            return writer.finish()
+        finally:
+            writer.abort()
+
+    def open_spill(self, columns: List[str], sql_query: str, table_name: str) -> "SpillWriter":
+        """
+        Start writing a result to disk batch by batch, for results that are streamed
+
+        Args:
+            columns: Column names
+            sql_query: SQL that produces it
+            table_name: Table it is run against
+
+        Returns:
+            SpillWriter; call write() per batch, then finish(), or abort()
+        """
+        return SpillWriter(self, columns, sql_query, table_name)
+
+    def info(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Metadata of a spilled result
+
+        Args:
+            result_id: Id returned by spill()
+
+        Returns:
+            Dict with result_id, columns, sql_query, table_name, row_count and
+            expires_at, or None if the result is unknown or expired
+        """
+        path = self._path(result_id)
+        if path is None or not os.path.exists(path):
+            return None
+
+        try:
+            values = dict(self._read(path, "SELECT key, value FROM info"))
+        except sqlite3.Error:
+            return None
+
+        expires_at = float(values["created_at"]) + self.TTL_SECONDS
+        if expires_at < time.time():
+            self._remove(path)
+            return None
+
+        return {
+            "result_id": result_id,
+            "columns": json.loads(values["columns"]),
+            "sql_query": values["sql_query"],
+            "table_name": values["table_name"],
+            "row_count": int(values["row_count"]),
+            "expires_at": expires_at
+        }
+
+    def page(self, result_id: str, offset: int = 0, limit: int = 1000) -> Optional[ResultSet]:
+        """
+        Read a contiguous range of rows
+
+        Args:
+            result_id: Id returned by spill()
+            offset: Index of the first row
+            limit: Maximum number of rows
+
+        Returns:
+            ResultSet with the requested rows, or None if the result is
+            unknown or expired
+        """
+        info = self.info(result_id)
+        if info is None:
+            return None
+
+        # Rows were inserted in order, so rowid N is row N-1
+        rows = self._read(
+            self._path(result_id),
+            "SELECT * FROM result WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+            (offset, offset + limit)
+        )
+        return ResultSet(info["columns"], rows)
+
+    def iter_batches(self, result_id: str, batch_size: int = 1000) -> Optional[Tuple[List[str], Iterator[List[tuple]]]]:
+        """
+        Stream every row of a spilled result
+
+        Args:
+            result_id: Id returned by spill()
+            batch_size: Rows per batch
+
+        Returns:
+            Tuple of (column_names, iterator of row batches), or None if the
+            result is unknown or expired
+        """
+        info = self.info(result_id)
+        if info is None:
+            return None
+
+        path = self._path(result_id)
+
+        def batches() -> Iterator[List[tuple]]:
+            conn = self._connect(path)
+            try:
+                cursor = conn.execute("SELECT * FROM result ORDER BY rowid")
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                conn.close()
+
+        return info["columns"], batches()
+
+    def column_types(self, result_id: str) -> Optional[List[set]]:
+        """
+        Python types of the values in each column of a spilled result
+
+        Returns:
+            One set per column (see export_formats.column_types), or None if
+            the result is unknown or expired
+        """
+        info = self.info(result_id)
+        if info is None:
+            return None
+        rows = self._read(self._path(result_id), storage_classes_query("SELECT * FROM result", len(info["columns"])))
+        return column_types(rows[0])
+
+    def delete(self, result_id: str) -> bool:
+        """Delete a spilled result; returns False if it did not exist"""
+        path = self._path(result_id)
+        if path is None or not os.path.exists(path):
+            return False
+        self._remove(path)
+        return True
+
+    def usage(self) -> Dict[str, int]:
+        """Number of spilled results and bytes on disk"""
+        files = self._files()
+        return {"results": len(files), "bytes": sum(size for _, _, size in files)}
+
+    def cleanup(self):
+        """Delete expired results, then the oldest ones while over the disk quota"""
+        with self._lock:
+            now = time.time()
+
+            # Partial files left behind by a crash during spill()
+            for entry in os.scandir(self.spill_dir):
+                if entry.name.endswith(".tmp") and entry.stat().st_mtime + self.TTL_SECONDS < now:
+                    self._remove(entry.path)
+
+            files = []
+            for path, modified, size in self._files():
+                if modified + self.TTL_SECONDS < now:
+                    self._remove(path)
+                else:
+                    files.append((path, modified, size))
+
+            total = sum(size for _, _, size in files)
+            for path, _, size in sorted(files, key=lambda item: item[1]):
+                if total <= self.QUOTA_BYTES:
+                    break
+                self._remove(path)
+                total -= size
+
+    def _files(self) -> List[Tuple[str, float, int]]:
+        """(path, modified time, size) of every spilled result"""
+        files = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.endswith(".db"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((entry.path, stat.st_mtime, stat.st_size))
+        return files
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        # Download generators may resume on a different threadpool thread
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def _read(self, path: str, query: str, params: tuple = ()) -> List[tuple]:
+        conn = self._connect(path)
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class SpillWriter:
+    """A spilled result being written; it only becomes visible once finished"""
+
+    def __init__(self, store: ResultStore, columns: List[str], sql_query: str, table_name: str):
+        self.store = store
+        self.result_id = uuid.uuid4().hex
+        self.path = store._path(self.result_id)
+        self._partial = self.path + ".tmp"
+        self.row_count = 0
+
+        # Streaming responses may resume on a different threadpool thread
+        self._conn = sqlite3.connect(self._partial, check_same_thread=False)
+        try:
+            # Scratch data: nothing to recover after a crash
+            self._conn.execute("PRAGMA journal_mode=OFF")
+            self._conn.execute("PRAGMA synchronous=OFF")
+            column_list = ", ".join(f"c{position}" for position in range(len(columns)))
+            self._conn.execute(f"CREATE TABLE result ({column_list})")
+            self._conn.execute("CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.executemany("INSERT INTO info VALUES (?, ?)", [
+                ("columns", json.dumps(columns)),
+                ("sql_query", sql_query),
+                ("table_name", table_name),
+            ])
+        except Exception:
+            self.abort()
+            raise
+        self._insert = f"INSERT INTO result VALUES ({', '.join('?' for _ in columns)})"
+
+    def write(self, rows: List[tuple]):
+        """Append a batch of rows"""
+        self._conn.executemany(self._insert, rows)
+        self.row_count += len(rows)
+
+    def finish(self) -> Optional[str]:
+        """
+        Make the result available
+
+        Returns:
+            Result id, or None if the result does not fit in the quota
+        """
+        self._conn.executemany("INSERT INTO info VALUES (?, ?)", [
+            ("row_count", str(self.row_count)),
+            ("created_at", str(time.time())),
+        ])
+        self._conn.commit()
+        self._conn.close()
+        self._conn = None
+
+        os.replace(self._partial, self.path)
+        self.store.cleanup()
+        return self.result_id if os.path.exists(self.path) else None
+
+    def abort(self):
+        """Discard an unfinished result; does nothing once finished"""
+        if self._conn is None:
+            return
+        self._conn.close()
+        self._conn = None
+        if os.path.exists(self._partial):
+            os.remove(self._partial)
@@ -0,0 +1,701 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Set, TYPE_CHECKING, Tuple
+
+from .sql_functions import AGGREGATE_FUNCTIONS, WINDOW_FUNCTIONS
+from .sql_tokenizer import TRIVIA, Token, identifier_name, tokenize
+from .workers import FileLock
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+# Aggregates that can be recomputed from per-group partial aggregates
+_DECOMPOSABLE = {"SUM", "TOTAL", "COUNT", "MIN", "MAX", "AVG"}
+
+# Aggregates that cannot (a median of medians is not the median)
+_HOLISTIC = (
+    {"GROUP_CONCAT", "STRING_AGG", "JSON_GROUP_ARRAY", "JSON_GROUP_OBJECT"}
+    | {name.upper() for name in WINDOW_FUNCTIONS}
+    | {name.upper() for name in AGGREGATE_FUNCTIONS}
+)
+
+# Constructs a rollup cannot answer
+_UNSUPPORTED = {
+    "JOIN", "UNION", "INTERSECT", "EXCEPT", "WITH", "DISTINCT", "OVER", "WINDOW", "FILTER",
+    "ROWID", "_ROWID_", "OID",
+}
+
+# Words that are SQL rather than column references
+_KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "GROUP", "BY", "HAVING", "ORDER", "LIMIT", "OFFSET", "AS", "ASC", "DESC",
+    "AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE", "GLOB", "BETWEEN", "CASE", "WHEN", "THEN", "ELSE", "END",
+    "COLLATE", "NOCASE", "RTRIM", "BINARY", "NULLS", "FIRST", "LAST", "ESCAPE", "TRUE", "FALSE",
+    "INTEGER", "REAL", "TEXT", "NUMERIC", "BLOB", "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP",
+}
+
+# Clauses that may follow FROM <table>
+_AFTER_FROM = {"WHERE", "GROUP", "ORDER", "LIMIT", "HAVING"}
+
+ROWS_COLUMN = "__rows"
+MEASURE_KINDS = ("sum", "count", "min", "max")
+
+# Partial aggregates each aggregate function is computed from
+_FUNCTION_KINDS = {
+    "SUM": ("sum",), "TOTAL": ("sum",), "COUNT": ("count",), "MIN": ("min",), "MAX": ("max",), "AVG": ("sum", "count"),
+}
+
+# Declared types (by substring, as SQLite's affinity rules match them) of numeric and date columns
+_NUMERIC_TYPES = ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC")
+_DATE_TYPES = ("DATE", "TIME")
+
+
+class RollupManager:
+    """
+    Materialized GROUP BY rollups and routing of aggregate queries to them
+
+    A rollup stores, for every combination of a few low-cardinality
+    dimension columns, the row count and the partial aggregates that make
+    sense for each column: SUM, COUNT, MIN and MAX of numeric columns,
+    COUNT, MIN and MAX of dates, and none for text or the generated
+    year/month/day parts of dates. A SUM/COUNT/MIN/MAX/AVG query that groups and filters only on a
+    rollup's dimensions gets the same answer from the rollup's groups as
+    from the table's rows, usually thousands of times fewer.
+
+    Rollups live in <db_dir>/rollups.db, which read connections attach as
+    "rollups". Each records the table version it was built from and is
+    only used while that version is current; uploading a table again
+    rebuilds its rollups in the background. Dimension sets come from two
+    places: upload-time column statistics, and GROUP BY column sets that
+    queries asked for MIN_QUERIES times without a rollup to answer them.
+
+    Worker processes sharing db_dir share the rollups: builds are serialized
+    by a lock file, a build another worker already finished is not repeated,
+    and the registry is reloaded whenever another connection changed it.
+    """
+
+    ENABLED = os.getenv("ROLLUPS_ENABLED", "1").lower() not in ("0", "false", "no")
+    MIN_ROWS = int(os.getenv("ROLLUP_MIN_ROWS", 100000))
+    MAX_GROUPS = int(os.getenv("ROLLUP_MAX_GROUPS", 50000))
+    MAX_DIMENSIONS = int(os.getenv("ROLLUP_MAX_DIMENSIONS", 4))
+    MIN_QUERIES = int(os.getenv("ROLLUP_MIN_QUERIES", 3))
+    MAX_PER_TABLE = int(os.getenv("ROLLUP_MAX_PER_TABLE", 4))
+
+    # Columns with more distinct values are never upload-time dimensions
+    MAX_CARDINALITY = 1000
+    SAMPLE_ROWS = 100000
+
+    _instances: Dict[str, "RollupManager"] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_database(cls, database) -> "RollupManager":
+        """Shared manager for a catalog, so every DatabaseService routes to the same rollups"""
+        key = os.path.abspath(database.db_path)
+        with cls._instances_lock:
+            manager = cls._instances.get(key)
+            if manager is None:
+                manager = cls._instances[key] = cls(database)
+            return manager
+
+    def __init__(self, database):
+        """
+        Args:
+            database: DatabaseService whose tables are rolled up
+        """
+        self.database = database
+        self.path = os.path.join(database.db_dir, "rollups.db")
+
+        self.routed = 0
+        self.misses = 0
+        self.builds = 0
+        self.failures = 0
+
+        self._lock = threading.Lock()
+        # One rollup is written at a time, across worker processes
+        self._build_lock = FileLock(os.path.join(database.locks_dir, "rollups.lock"))
+        self._rollups: Dict[str, List[Dict[str, Any]]] = {}  # table -> rollups
+        self._registry: Optional[sqlite3.Connection] = None
+        self._registry_version = None  # PRAGMA data_version when the registry was loaded
+        self._wanted: Dict[Tuple[str, FrozenSet[str]], int] = {}  # Uncovered dimension sets -> query count
+        self._rejected: Dict[Tuple[str, FrozenSet[str]], str] = {}  # Too many groups at this table version
+        self._building: Set[Tuple[str, FrozenSet[str]]] = set()
+
+        self._init_registry()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.path}", uri=True, timeout=30, isolation_level=None)
+        return conn
+
+    def _init_registry(self):
+        conn = self._connect()
+        try:
+            # WAL lets read connections keep querying rollups while one is built
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS _rollups (
+                    name TEXT PRIMARY KEY,
+                    table_name TEXT NOT NULL,
+                    dimensions TEXT NOT NULL,
+                    measures TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    group_count INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+        self._registry = sqlite3.connect(
+            f"file:{self.path}", uri=True, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._refresh()
+
+    def _refresh(self):
+        """Reload the registry if another connection (a build, or another worker) changed it"""
+        with self._lock:
+            version = self._registry.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._registry_version:
+                return
+            self._registry_version = version
+            hits = {rollup["name"]: rollup["hits"] for rollups in self._rollups.values() for rollup in rollups}
+            self._rollups = {}
+            for name, table_name, dimensions, measures, version, group_count, source in self._registry.execute(
+                "SELECT name, table_name, dimensions, measures, version, group_count, source FROM _rollups"
+            ):
+                self._rollups.setdefault(table_name, []).append({
+                    "name": name,
+                    "dimensions": json.loads(dimensions),
+                    "measures": _measures(json.loads(measures)),
+                    "version": version,
+                    "groups": group_count,
+                    "source": source,
+                    "hits": hits.get(name, 0),
+                })
+
+    def attach(self, conn: sqlite3.Connection):
+        """Attach the rollup database to a new pooled read connection"""
+        conn.execute("ATTACH DATABASE ? AS rollups", (f"file:{self.path}?mode=ro",))
+
+    # Choosing dimensions
+
+    def suggest_dimensions(self, df: "pd.DataFrame", date_columns: Dict[str, Dict[str, str]]) -> List[str]:
+        """
+        Pick upload-time dimension columns from column statistics
+
+        Low-cardinality text, integer and boolean columns qualify, and so do
+        the year and month of date columns. Columns are added from the
+        fewest distinct values up while the product of their cardinalities
+        (an upper bound on the number of groups) stays within MAX_GROUPS and
+        a tenth of the rows.
+
+        Args:
+            df: Uploaded DataFrame
+            date_columns: Date column -> derived column names, from the upload
+
+        Returns:
+            Dimension column names, possibly empty
+        """
+        import pandas as pd
+
+        if not self.ENABLED or len(df) < self.MIN_ROWS:
+            return []
+
+        sample = df.sample(self.SAMPLE_ROWS, random_state=0) if len(df) > self.SAMPLE_ROWS else df
+        candidates = []
+        for col in df.columns:
+            name = str(col)
+            series = df[col]
+            if name in date_columns:
+                parts = date_columns[name]
+                candidates.append((series.dt.year.nunique(dropna=False), parts["year"]))
+                candidates.append((series.dt.month.nunique(dropna=False), parts["month"]))
+                continue
+            if pd.api.types.is_float_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+                continue
+            if sample[col].nunique(dropna=False) > self.MAX_CARDINALITY:
+                continue
+            cardinality = series.nunique(dropna=False)
+            if 1 < cardinality <= self.MAX_CARDINALITY:
+                candidates.append((cardinality, name))
+
+        limit = min(self.MAX_GROUPS, len(df) // 10)
+        dimensions, groups = [], 1
+        for cardinality, name in sorted(candidates):
+            if len(dimensions) == self.MAX_DIMENSIONS or groups * cardinality > limit:
+                break
+            dimensions.append(name)
+            groups *= cardinality
+        return dimensions
+
+    # Lifecycle
+
+    def table_replaced(self, table_name: str, dimensions: List[str]):
+        """
+        Rebuild a table's rollups after it was uploaded again
+
+        Rollups of the previous version are dropped. The new upload-time
+        dimension set and the sets queries asked for are rebuilt in the
+        background; until then queries read the table.
+
+        Args:
+            table_name: Table that was replaced
+            dimensions: Upload-time dimensions from suggest_dimensions
+        """
+        previous = self.forget(table_name)
+        if not self.ENABLED:
+            return
+        requested = [(dimensions, "upload")] if dimensions else []
+        requested += [(rollup["dimensions"], "queries") for rollup in previous if rollup["source"] == "queries"]
+        for dims, source in requested:
+            self._build_in_background(table_name, dims, source)
+
+    def forget(self, table_name: str) -> List[Dict[str, Any]]:
+        """
+        Drop all rollups of a table
+
+        Returns:
+            The dropped rollups' registry entries
+        """
+        with self._lock:
+            rollups = self._rollups.pop(table_name, [])
+            for key in [key for key in self._wanted if key[0] == table_name]:
+                del self._wanted[key]
+        with self._build_lock:
+            conn = self._connect()
+            try:
+                for rollup in rollups:
+                    self._drop(conn, rollup["name"])
+                conn.execute("DELETE FROM _rollups WHERE table_name = ?", (table_name,))
+            finally:
+                conn.close()
+        return rollups
+
+    @staticmethod
+    def _drop(conn: sqlite3.Connection, name: str):
+        conn.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        conn.execute("DELETE FROM _rollups WHERE name = ?", (name,))
+
+    def _build_in_background(self, table_name: str, dimensions: List[str], source: str):
+        key = (table_name, frozenset(dimension.lower() for dimension in dimensions))
+        with self._lock:
+            if key in self._building:
+                return
+            self._building.add(key)
+
+        def run():
+            try:
+                self.build(table_name, dimensions, source)
+            except Exception:
+                logger.exception("Rollup build for '%s' failed", table_name)
+                with self._lock:
+                    self.failures += 1
+            finally:
+                with self._lock:
+                    self._building.discard(key)
+
+        threading.Thread(target=run, name=f"rollup-{table_name}", daemon=True).start()
+
+    def build(self, table_name: str, dimensions: List[str], source: str = "upload") -> Optional[str]:
+        """
+        Materialize a rollup of a table over the given dimensions
+
+        Args:
+            table_name: Table to roll up
+            dimensions: GROUP BY columns
+            source: "upload" or "queries", kept so re-uploads rebuild query-driven sets
+
+        Returns:
+            Name of the new rollup, or None if the table is gone, archived,
+            changed during the build or has too many groups
+        """
+        path = self.database.table_path(table_name)
+        version = self.database.table_version(table_name)
+        key = (table_name, frozenset(dimension.lower() for dimension in dimensions))
+        if version is None or not os.path.exists(path) or self._rejected.get(key) == version:
+            return None
+
+        name = f"{table_name}__rollup_{uuid.uuid4().hex[:8]}"
+        with self._build_lock:
+            # Another worker may have built the same rollup while this one waited
+            self._refresh()
+            with self._lock:
+                built = [
+                    rollup for rollup in self._rollups.get(table_name, [])
+                    if rollup["version"] == version
+                    and frozenset(dimension.lower() for dimension in rollup["dimensions"]) == key[1]
+                ]
+            if built:
+                return built[0]["name"]
+
+            conn = self._connect()
+            try:
+                conn.execute("ATTACH DATABASE ? AS src", (f"file:{path}?mode=ro",))
+                types = {
+                    row[1]: row[2] for row in conn.execute(f"PRAGMA src.table_xinfo({_quote(table_name)})")
+                    if row[6] != 1  # Hidden columns of virtual tables
+                }
+                columns = list(types)
+                known = {column.lower(): column for column in columns}
+                if any(dimension.lower() not in known for dimension in dimensions):
+                    return None
+                dimensions = [known[dimension.lower()] for dimension in dimensions]
+
+                measures = self._measure_kinds(table_name, types)
+                select = [_quote(dimension) for dimension in dimensions] + [f"COUNT(*) AS {_quote(ROWS_COLUMN)}"]
+                for column, kinds in measures.items():
+                    for kind in kinds:
+                        select.append(f"{kind.upper()}({_quote(column)}) AS {_quote(f'{column}__{kind}')}")
+                group_by = f" GROUP BY {', '.join(_quote(dimension) for dimension in dimensions)}" if dimensions else ""
+
+                conn.execute("BEGIN")
+                conn.execute(
+                    f"CREATE TABLE {_quote(name)} AS SELECT {', '.join(select)} "
+                    f"FROM src.{_quote(table_name)}{group_by}"
+                )
+                groups, rows = conn.execute(
+                    f"SELECT COUNT(*), TOTAL({_quote(ROWS_COLUMN)}) FROM {_quote(name)}"
+                ).fetchone()
+                if groups > min(self.MAX_GROUPS, max(rows // 10, 1)) or self.database.table_version(table_name) != version:
+                    conn.execute("ROLLBACK")
+                    if self.database.table_version(table_name) == version:
+                        self._rejected[key] = version
+                    return None
+                conn.execute(
+                    "INSERT INTO _rollups (name, table_name, dimensions, measures, version, group_count, source, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (name, table_name, json.dumps(dimensions), json.dumps(measures), version, groups, source, time.time())
+                )
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+
+            entry = {
+                "name": name, "dimensions": dimensions, "measures": measures, "version": version,
+                "groups": groups, "source": source, "hits": 0,
+            }
+            with self._lock:
+                rollups = self._rollups.setdefault(table_name, [])
+                stale = [rollup for rollup in rollups if rollup["version"] != version]
+                rollups[:] = [rollup for rollup in rollups if rollup["version"] == version] + [entry]
+                # Keep the most used rollups within the per-table limit
+                while len(rollups) > self.MAX_PER_TABLE:
+                    evicted = min(rollups[:-1], key=lambda rollup: rollup["hits"])
+                    rollups.remove(evicted)
+                    stale.append(evicted)
+                self.builds += 1
+
+            if stale:
+                conn = self._connect()
+                try:
+                    for rollup in stale:
+                        self._drop(conn, rollup["name"])
+                finally:
+                    conn.close()
+        return name
+
+    # Routing
+
+    def route(self, sql: str, table_name: Optional[str], record: bool = True) -> Optional[str]:
+        """
+        Rewrite an aggregate query to read a rollup instead of the table
+
+        Args:
+            sql: Validated, sanitized SELECT
+            table_name: Table the query reads
+            record: Count the outcome (hits, misses, query-driven builds);
+                False only asks whether a rollup would answer
+
+        Returns:
+            SQL against a rollup, or None when no rollup can answer the query
+        """
+        if not self.ENABLED or not table_name:
+            return None
+        shape = _aggregate_shape(sql, table_name)
+        if shape is None:
+            return None
+        columns, aggregates = shape.columns, shape.aggregates
+
+        self._refresh()
+        with self._lock:
+            candidates = list(self._rollups.get(table_name, []))
+        version = self.database.table_version(table_name) if candidates else None
+        best = None
+        for rollup in candidates:
+            dimensions = {dimension.lower() for dimension in rollup["dimensions"]}
+            measures = {column.lower(): kinds for column, kinds in rollup["measures"].items()}
+            if rollup["version"] != version or not columns <= dimensions:
+                continue
+            if any(
+                column is not None and not set(_FUNCTION_KINDS[function]) <= set(measures.get(column.lower(), ()))
+                for _, _, function, column in aggregates
+            ):
+                continue
+            if best is None or rollup["groups"] < best["groups"]:
+                best = rollup
+
+        if best is None:
+            if record:
+                self._record_miss(table_name, columns)
+            return None
+
+        if record:
+            with self._lock:
+                best["hits"] += 1
+                self.routed += 1
+        return _rewrite(
+            sql, shape, f"rollups.{_quote(best['name'])}",
+            lambda function, column: _rollup_expression(best, function, column)
+        )
+
+    def _measure_kinds(self, table_name: str, types: Dict[str, str]) -> Dict[str, List[str]]:
+        """
+        Partial aggregates worth keeping for each column of a table
+
+        Args:
+            table_name: Table being rolled up
+            types: Column name -> declared type, from table_xinfo
+
+        Returns:
+            Column name -> measure kinds, for columns that get any
+        """
+        with self.database.read_pool.connection() as conn:
+            row = conn.execute("SELECT columns FROM _metadata WHERE table_name = ?", (table_name,)).fetchone()
+        metadata = json.loads(row[0]) if row else {}
+        metadata = metadata if isinstance(metadata, dict) else {}
+        dates = set(metadata.get("datetime_columns", []))
+        date_parts = set()
+        for parts in metadata.get("date_columns", {}).values():
+            dates.add(parts["epoch"])
+            date_parts.update(name for part, name in parts.items() if part != "epoch")
+
+        measures = {}
+        for column, declared in types.items():
+            declared = (declared or "").upper()
+            if column in date_parts:
+                continue
+            if column in dates or any(name in declared for name in _DATE_TYPES):
+                measures[column] = ["count", "min", "max"]
+            elif any(name in declared for name in _NUMERIC_TYPES):
+                measures[column] = list(MEASURE_KINDS)
+        return measures
+
+    def _record_miss(self, table_name: str, columns: FrozenSet[str]):
+        """Count an aggregate query no rollup covers; build one once the set is asked for often enough"""
+        if len(columns) > self.MAX_DIMENSIONS:
+            return
+        key = (table_name, columns)
+        with self._lock:
+            self.misses += 1
+            count = self._wanted[key] = self._wanted.get(key, 0) + 1
+        if count < self.MIN_QUERIES or key in self._building:
+            return
+        with self.database.read_pool.connection() as conn:
+            row = conn.execute("SELECT row_count FROM _metadata WHERE table_name = ?", (table_name,)).fetchone()
+        if row is None or row[0] < self.MIN_ROWS:
+            return
+        with self._lock:
+            self._wanted.pop(key, None)
+        self._build_in_background(table_name, sorted(columns), "queries")
+
+    def stats(self) -> Dict[str, Any]:
+        """Rollups per table and routing counters"""
+        self._refresh()
+        with self._lock:
+            return {
+                "tables": {
+                    table: [
+                        {key: rollup[key] for key in ("name", "dimensions", "groups", "source", "hits")}
+                        for rollup in rollups
+                    ]
+                    for table, rollups in self._rollups.items()
+                },
+                "rollups": sum(len(rollups) for rollups in self._rollups.values()),
+                "routed": self.routed,
+                "misses": self.misses,
+                "builds": self.builds,
+                "failures": self.failures,
+            }
+
+
+class _Shape(NamedTuple):
+    """A query a rollup could answer, as found by _aggregate_shape"""
+    columns: FrozenSet[str]  # Lower-case columns referenced outside aggregates
+    aggregates: List[Tuple[int, int, str, Optional[str]]]  # (first token, last token, function, column or None for *)
+    tokens: List[Token]
+    words: List[Optional[str]]
+    source: int  # Index of the table token after FROM
+
+
+def _aggregate_shape(sql: str, table_name: str) -> Optional[_Shape]:
+    """Check that a query is a single-table SUM/COUNT/MIN/MAX/AVG a rollup could answer"""
+    tokens = [token for token in tokenize(sql) if token.kind not in TRIVIA]
+    words = [token.value.upper() if token.kind == "word" else None for token in tokens]
+    if not tokens or words[0] != "SELECT" or words.count("SELECT") != 1 or words.count("FROM") != 1:
+        return None
+    if any(word in _UNSUPPORTED or word in _HOLISTIC for word in words if word):
+        return None
+
+    source = words.index("FROM") + 1
+    if source >= len(tokens) or tokens[source].kind not in ("word", "identifier"):
+        return None
+    if identifier_name(tokens[source]).lower() != table_name.lower():
+        return None
+    if source + 1 < len(tokens) and words[source + 1] not in _AFTER_FROM:
+        return None  # Table alias, comma join or anything unexpected
+
+    columns, aliases, aggregates = set(), set(), []
+    index = 1
+    while index < len(tokens):
+        token, word = tokens[index], words[index]
+        following = tokens[index + 1].value if index + 1 < len(tokens) else None
+        if index == source or token.kind not in ("word", "identifier"):
+            if token.value == "*" and (words[index - 1] == "SELECT" or tokens[index - 1].value == ","):
+                return None  # SELECT *
+            index += 1
+            continue
+        if following == ".":
+            return None  # Qualified column reference
+        if word in _DECOMPOSABLE and following == "(":
+            argument = tokens[index + 2] if index + 2 < len(tokens) else None
+            closing = tokens[index + 3] if index + 3 < len(tokens) else None
+            if argument is None or closing is None or closing.value != ")":
+                return None
+            if argument.value == "*" and word == "COUNT":
+                aggregates.append((index, index + 3, word, None))
+            elif argument.kind in ("word", "identifier") and (argument.kind == "identifier" or argument.value.upper() not in _KEYWORDS):
+                aggregates.append((index, index + 3, word, identifier_name(argument)))
+            else:
+                return None  # Expression inside the aggregate
+            index += 4
+            continue
+        if following == "(" and token.kind == "word":
+            index += 1  # Scalar function
+            continue
+        if token.kind == "word" and word in _KEYWORDS:
+            index += 1
+            continue
+        if _is_alias(tokens, words, index, source - 1):
+            aliases.add(identifier_name(token).lower())
+        else:
+            columns.add(identifier_name(token).lower())
+        index += 1
+
+    if not aggregates:
+        return None
+    return _Shape(frozenset(columns - aliases), aggregates, tokens, words, source)
+
+
+def _is_alias(tokens: List[Token], words: List[Optional[str]], index: int, from_index: int) -> bool:
+    """Whether the name at index is a result column alias (`expr AS name` or `expr name`)"""
+    if tokens[index].kind not in ("word", "identifier") or words[index] in _KEYWORDS:
+        return False
+    if words[index - 1] == "AS":
+        return True
+    # An implicit alias ends a select item and directly follows a complete operand
+    return (
+        index < from_index
+        and (tokens[index + 1].value == "," or index + 1 == from_index)
+        and (tokens[index - 1].value == ")" or tokens[index - 1].kind in ("word", "identifier", "number", "string"))
+        and words[index - 1] not in ("SELECT", "DISTINCT")
+    )
+
+
+def _select_items(shape: _Shape) -> List[Tuple[int, int, bool]]:
+    """Select list items as (first token index, last token index, has an alias)"""
+    tokens, words = shape.tokens, shape.words
+    from_index = shape.source - 1
+    items, depth, item_start = [], 0, 1
+    for index in range(1, from_index + 1):
+        value = tokens[index].value
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif (value == "," and depth == 0) or index == from_index:
+            item_end = index - 1
+            items.append((item_start, item_end, item_end > item_start and _is_alias(tokens, words, item_end, from_index)))
+            item_start = index + 1
+    return items
+
+
+def _rewrite(
+    sql: str,
+    shape: _Shape,
+    source: str,
+    expression: Callable[[str, Optional[str]], str],
+    extra_columns: Sequence[str] = ()
+) -> str:
+    """
+    Point a query that passed _aggregate_shape at another source
+
+    Args:
+        sql: Query the shape was taken from
+        shape: Result of _aggregate_shape
+        source: Replacement for the table after FROM
+        expression: Called with (function, column or None for COUNT(*)),
+            returns the SQL that replaces the aggregate call
+        extra_columns: Select items appended to the select list
+
+    Returns:
+        Rewritten SQL whose result columns keep the original names
+    """
+    tokens = shape.tokens
+    replacements = [(tokens[shape.source].start, tokens[shape.source].end, source)]
+    for first, last, function, column in shape.aggregates:
+        replacements.append((tokens[first].start, tokens[last].end, expression(function, column)))
+
+    # Unaliased select items are named after their text; keep the names the table query would give
+    for item_start, item_end, has_alias in _select_items(shape):
+        if not has_alias and any(item_start <= first <= item_end for first, _, _, _ in shape.aggregates):
+            text = sql[tokens[item_start].start:tokens[item_end].end]
+            replacements.append((tokens[item_end].end, tokens[item_end].end, f" AS {_quote(text)}"))
+    if extra_columns:
+        # First in the list, so it lands after an alias inserted at the same position
+        end = tokens[shape.source - 2].end
+        replacements.insert(0, (end, end, "".join(f", {column}" for column in extra_columns)))
+
+    for start, end, text in sorted(replacements, key=lambda replacement: replacement[0], reverse=True):
+        sql = f"{sql[:start]}{text}{sql[end:]}"
+    return sql
+
+
+def _rollup_expression(rollup: Dict[str, Any], function: str, column: Optional[str]) -> str:
+    """Aggregate over a rollup's partial aggregates equal to function(column) over the table"""
+    if column is None:
+        return f"COALESCE(SUM({_quote(ROWS_COLUMN)}), 0)"
+    measure = {kind: _quote(f"{_measure_name(rollup, column)}__{kind}") for kind in MEASURE_KINDS}
+    return {
+        "SUM": f"SUM({measure['sum']})",
+        "TOTAL": f"TOTAL({measure['sum']})",
+        "COUNT": f"COALESCE(SUM({measure['count']}), 0)",
+        "MIN": f"MIN({measure['min']})",
+        "MAX": f"MAX({measure['max']})",
+        "AVG": f"(CAST(SUM({measure['sum']}) AS REAL) / SUM({measure['count']}))",
+    }[function]
+
+
+def _measures(measures: Any) -> Dict[str, List[str]]:
+    """Registry measures as column -> kinds; rollups from before per-type measures list columns only"""
+    if isinstance(measures, list):
+        return {column: list(MEASURE_KINDS) for column in measures}
+    return measures
+
+
+def _measure_name(rollup: Dict[str, Any], column: str) -> str:
+    """Column name as stored in the rollup (queries may use any letter case)"""
+    for measure in rollup["measures"]:
+        if measure.lower() == column.lower():
+            return measure
+    return column
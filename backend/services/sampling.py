@@ -0,0 +1,244 @@
+import math
+import os
+import sqlite3
+from typing import Dict, List, Optional, TYPE_CHECKING, Tuple
+
+from .result_set import ResultSet
+from .rollups import _aggregate_shape, _rewrite, _select_items
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SampleTable:
+    """
+    Weighted row samples for approximate answers on very large tables
+
+    At upload, tables with at least MIN_ROWS rows get a Bernoulli sample of
+    about SAMPLE_ROWS rows, stored next to the table in its file. When a
+    low-cardinality column is available the sample is stratified on it:
+    every value keeps at least MIN_STRATUM_ROWS rows (or all of them), so
+    small groups do not vanish from GROUP BY answers. Each sampled row
+    carries its weight, the inverse of its inclusion probability.
+
+    rewrite() turns COUNT/SUM/TOTAL/AVG queries into weighted
+    (Horvitz-Thompson) estimates over the sample and adds a variance column
+    for every select item that is a bare aggregate, from which
+    split_bounds() derives confidence intervals.
+    """
+
+    MIN_ROWS = int(os.getenv("APPROX_MIN_ROWS", 2000000))
+    SAMPLE_ROWS = int(os.getenv("APPROX_SAMPLE_ROWS", 500000))
+    MIN_STRATUM_ROWS = int(os.getenv("APPROX_MIN_STRATUM_ROWS", 1000))
+
+    # "auto" mode answers from the sample when a query would scan at least this many rows
+    AUTO_ROWS = int(os.getenv("APPROX_AUTO_ROWS", 10000000))
+
+    # Stratify on a column with at most this many distinct values
+    MAX_STRATA = 200
+    SAMPLE_CHECK_ROWS = 100000
+
+    SUFFIX = "__sample"
+    WEIGHT_COLUMN = "__weight"
+    VARIANCE_PREFIX = "__variance_"
+
+    CONFIDENCE = 0.95
+    Z = 1.959963984540054  # Two-sided 95% normal quantile
+
+    # Aggregates with an unbiased weighted estimate (MIN/MAX have none)
+    ESTIMABLE = {"COUNT", "SUM", "TOTAL", "AVG"}
+
+    @classmethod
+    def sample_name(cls, table_name: str) -> str:
+        """Name of a table's sample inside its file"""
+        return f"{table_name}{cls.SUFFIX}"
+
+    @classmethod
+    def wanted(cls, row_count: int) -> bool:
+        """Whether a table of row_count rows gets a sample"""
+        return row_count >= cls.MIN_ROWS
+
+    @classmethod
+    def choose_strata(cls, df: "pd.DataFrame") -> Optional[str]:
+        """
+        Pick the column to stratify the sample on
+
+        Text, integer and boolean columns with at most MAX_STRATA distinct
+        values qualify. Text columns (categories, regions) are preferred over
+        numbers, then the column with the most values, since it has the most
+        small groups to protect.
+
+        Args:
+            df: DataFrame being uploaded
+
+        Returns:
+            Column name, or None for a uniform sample
+        """
+        import pandas as pd
+
+        check = df.sample(cls.SAMPLE_CHECK_ROWS, random_state=0) if len(df) > cls.SAMPLE_CHECK_ROWS else df
+        candidates = []
+        for col in df.columns:
+            if pd.api.types.is_float_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col]):
+                continue
+            if check[col].nunique(dropna=False) > cls.MAX_STRATA:
+                continue
+            count = df[col].nunique(dropna=False)
+            if 1 < count <= cls.MAX_STRATA:
+                candidates.append((not pd.api.types.is_numeric_dtype(df[col]), count, str(col)))
+        return max(candidates)[2] if candidates else None
+
+    @classmethod
+    def create(cls, conn: sqlite3.Connection, table_name: str, strata: Optional[str]) -> int:
+        """
+        (Re)build the sample of a table from its rows
+
+        Sampling happens in SQL, so an archived table gets a fresh sample
+        when it is restored.
+
+        Args:
+            conn: Connection to the table's file
+            table_name: Table to sample
+            strata: Column from choose_strata, or None
+
+        Returns:
+            Number of sampled rows
+        """
+        sample = _quote(cls.sample_name(table_name))
+        conn.execute(f"DROP TABLE IF EXISTS {sample}")
+        total = conn.execute(f"SELECT COUNT(*) FROM {_quote(table_name)}").fetchone()[0]
+        if not total:
+            return 0
+        fraction = min(1.0, cls.SAMPLE_ROWS / total)
+
+        join = ""
+        rate = repr(fraction)
+        if strata:
+            # Inclusion probability per value: the overall fraction, raised for small groups
+            conn.execute("CREATE TEMP TABLE _strata (value PRIMARY KEY, rate REAL)")
+            conn.execute(
+                f"INSERT INTO temp._strata SELECT {_quote(strata)}, "
+                f"MIN(1.0, MAX(?, ? * 1.0 / COUNT(*))) FROM {_quote(table_name)} GROUP BY {_quote(strata)}",
+                (fraction, cls.MIN_STRATUM_ROWS)
+            )
+            join = f" LEFT JOIN temp._strata AS strata ON strata.value = source.{_quote(strata)}"
+            rate = "COALESCE(strata.rate, (SELECT rate FROM temp._strata WHERE value IS NULL))"
+        try:
+            conn.execute(
+                f"CREATE TABLE {sample} AS SELECT source.*, 1.0 / {rate} AS {_quote(cls.WEIGHT_COLUMN)} "
+                f"FROM {_quote(table_name)} AS source{join} "
+                f"WHERE random() / 18446744073709551616.0 + 0.5 < {rate}"
+            )
+        finally:
+            if strata:
+                conn.execute("DROP TABLE temp._strata")
+        return conn.execute(f"SELECT COUNT(*) FROM {sample}").fetchone()[0]
+
+    @classmethod
+    def rewrite(cls, sql: str, table_name: str) -> Optional[Tuple[str, List[Tuple[int, int]]]]:
+        """
+        Rewrite an aggregate query into estimates over the table's sample
+
+        Only single-table COUNT/SUM/TOTAL/AVG queries qualify (the same
+        shapes rollups answer, minus MIN and MAX). Groups with no sampled
+        row are missing from the answer.
+
+        Args:
+            sql: Validated, sanitized SELECT
+            table_name: Table the query reads
+
+        Returns:
+            Tuple of (SQL against the sample, [(result column index,
+            variance column index)]), or None if the query cannot be
+            estimated
+        """
+        shape = _aggregate_shape(sql, table_name)
+        if shape is None or any(function not in cls.ESTIMABLE for _, _, function, _ in shape.aggregates):
+            return None
+
+        variances, bounds = [], []
+        items = _select_items(shape)
+        for position, (item_start, item_end, has_alias) in enumerate(items):
+            expression_end = item_end
+            if has_alias:
+                expression_end -= 2 if shape.words[item_end - 1] == "AS" else 1
+            for first, last, function, column in shape.aggregates:
+                if first == item_start and last == expression_end:
+                    bounds.append((position, len(items) + len(variances)))
+                    variances.append(
+                        f"{cls._variance(function, column)} AS {_quote(cls.VARIANCE_PREFIX + str(position))}"
+                    )
+
+        source = f"{_quote('table_' + table_name)}.{_quote(cls.sample_name(table_name))}"
+        return _rewrite(sql, shape, source, cls._estimate, variances), bounds
+
+    @classmethod
+    def _estimate(cls, function: str, column: Optional[str]) -> str:
+        """Weighted estimate of function(column) over the whole table"""
+        weight = _quote(cls.WEIGHT_COLUMN)
+        if column is None:
+            return f"COALESCE(CAST(ROUND(SUM({weight})) AS INTEGER), 0)"
+        value = _quote(column)
+        present = f"CASE WHEN {value} IS NOT NULL THEN {weight} END"
+        return {
+            "COUNT": f"COALESCE(CAST(ROUND(SUM({present})) AS INTEGER), 0)",
+            "SUM": f"SUM({value} * {weight})",
+            "TOTAL": f"TOTAL({value} * {weight})",
+            "AVG": f"(SUM({value} * {weight}) / SUM({present}))",
+        }[function]
+
+    @classmethod
+    def _variance(cls, function: str, column: Optional[str]) -> str:
+        """
+        Estimated variance of _estimate(function, column)
+
+        For Poisson sampling with inclusion probability 1/w the variance of
+        the Horvitz-Thompson total of y is estimated by sum(w * (w - 1) * y^2).
+        AVG is a ratio of two totals; its variance is linearized around the
+        estimate R as sum(w * (w - 1) * (y - R)^2) / N^2.
+        """
+        weight = _quote(cls.WEIGHT_COLUMN)
+        factor = f"{weight} * ({weight} - 1)"
+        if column is None:
+            return f"TOTAL({factor})"
+        value = _quote(column)
+        present = f"CASE WHEN {value} IS NOT NULL THEN {factor} END"
+        if function == "COUNT":
+            return f"TOTAL({present})"
+        if function in ("SUM", "TOTAL"):
+            return f"TOTAL({factor} * {value} * {value})"
+        ratio = cls._estimate("AVG", column)
+        rows = f"SUM(CASE WHEN {value} IS NOT NULL THEN {weight} END)"
+        return (
+            f"((TOTAL({factor} * {value} * {value}) - 2 * {ratio} * TOTAL({factor} * {value})"
+            f" + {ratio} * {ratio} * TOTAL({present})) / ({rows} * {rows}))"
+        )
+
+    @classmethod
+    def split_bounds(
+        cls, results: ResultSet, bounds: List[Tuple[int, int]]
+    ) -> Tuple[ResultSet, Dict[str, List[Optional[float]]]]:
+        """
+        Separate the variance columns added by rewrite() from the answer
+
+        Args:
+            results: Result of the rewritten query
+            bounds: Column index pairs returned by rewrite()
+
+        Returns:
+            Tuple of (results without variance columns, {column name: ±
+            half-width of the CONFIDENCE interval for each row})
+        """
+        width = len(results.columns) - len(bounds)
+        error_bounds = {}
+        for column, variance in bounds:
+            error_bounds[results.columns[column]] = [
+                cls.Z * math.sqrt(max(row[variance], 0.0)) if row[variance] is not None else None
+                for row in results.rows
+            ]
+        rows = results.rows if width == len(results.columns) else [row[:width] for row in results.rows]
+        return ResultSet(results.columns[:width], rows), error_bounds
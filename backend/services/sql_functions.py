@@ -0,0 +1,531 @@
+import bisect
+import math
+import sqlite3
+from collections import Counter
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# Functions advertised to the LLM, in the form it should write them
+FUNCTION_SIGNATURES = [
+    "median(x)",
+    "percentile_cont(x, p)",
+    "percentile_disc(x, p)",
+    "stddev(x)",
+    "stddev_pop(x)",
+    "variance(x)",
+    "var_pop(x)",
+    "corr(x, y)",
+    "covar_samp(x, y)",
+    "covar_pop(x, y)",
+    "mode(x)",
+    "approx_count_distinct(x)",
+]
+
+# Values buffered per aggregate before they are folded into its state
+CHUNK_SIZE = 65536
+
+
+def _number(value) -> Optional[float]:
+    """Numeric value of a column, None for NULL and non-numeric text"""
+    if value.__class__ is int or value.__class__ is float:
+        return value
+    if value is None or isinstance(value, bytes):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _numbers(values: list) -> "np.ndarray":
+    """Float array of the numeric values in a list; NULL and non-numeric text are dropped"""
+    import numpy as np
+
+    try:
+        array = np.array(values, dtype=float)  # None becomes NaN
+    except (TypeError, ValueError):
+        array = np.array([_number(value) for value in values], dtype=float)
+    return array[~np.isnan(array)]
+
+
+def _fraction(p) -> float:
+    fraction = _number(p)
+    if fraction is None or not 0 <= fraction <= 1:
+        raise ValueError("percentile must be between 0 and 1")
+    return fraction
+
+
+# Each aggregate works in two modes. As a plain aggregate, step() only
+# appends to a buffer, which is folded into the state with numpy every
+# CHUNK_SIZE rows and at the end: the per-row Python work is one call and an
+# append. When SQLite first asks for a running value() or calls inverse(),
+# the function is being used as a window function, so the state switches to
+# an incremental one that can add and remove single rows.
+
+
+class _Ordered:
+    """Values collected for an order statistic"""
+
+    def __init__(self):
+        self.buffer: list = []
+        self.chunks: List[np.ndarray] = []
+        self.p = 0.5
+        self.window: Optional[List[float]] = None  # Sorted values once used as a window function
+
+    def step(self, value, p=0.5):
+        if self.window is not None:
+            value = _number(value)
+            if value is not None:
+                bisect.insort(self.window, value)
+            return
+        self.p = p
+        self.buffer.append(value)
+        if len(self.buffer) >= CHUNK_SIZE:
+            self.chunks.append(_numbers(self.buffer))
+            self.buffer = []
+
+    def inverse(self, value, p=0.5):
+        self._start_window()
+        value = _number(value)
+        if value is not None:
+            del self.window[bisect.bisect_left(self.window, value)]
+
+    def _start_window(self):
+        if self.window is None:
+            self.window = sorted(self._collected().tolist())
+
+    def _collected(self) -> "np.ndarray":
+        import numpy as np
+
+        self.chunks.append(_numbers(self.buffer))
+        self.buffer = []
+        values = np.concatenate(self.chunks)
+        self.chunks = []
+        return values
+
+    def value(self):
+        import numpy as np
+
+        self._start_window()
+        if not self.window:
+            return None
+        return self._pick(np.asarray(self.window), _fraction(self.p))
+
+    def finalize(self):
+        if self.window is not None:
+            return self.value()
+        values = self._collected()
+        return self._pick(values, _fraction(self.p)) if len(values) else None
+
+
+class Median(_Ordered):
+    """median(x): middle value, the mean of the two middle values for an even count"""
+
+    @staticmethod
+    def _pick(values: "np.ndarray", fraction: float) -> float:
+        import numpy as np
+
+        return float(np.median(values))
+
+
+class PercentileCont(_Ordered):
+    """percentile_cont(x, p): p-th quantile with linear interpolation between values"""
+
+    @staticmethod
+    def _pick(values: "np.ndarray", fraction: float) -> float:
+        import numpy as np
+
+        return float(np.quantile(values, fraction, method="linear"))
+
+
+class PercentileDisc(_Ordered):
+    """percentile_disc(x, p): smallest value whose cumulative share is at least p"""
+
+    @staticmethod
+    def _pick(values: "np.ndarray", fraction: float) -> float:
+        import numpy as np
+
+        return float(np.quantile(values, fraction, method="inverted_cdf"))
+
+
+class _Moments:
+    """
+    Count, mean and sum of squared deviations
+
+    Chunks are summarized with a two-pass mean/deviation and merged with
+    Chan's formula; windows update them one row at a time with Welford's
+    method, on values shifted by the mean when the window started so
+    removing rows does not accumulate rounding. Both stay accurate for large
+    values with a small spread, where the textbook avg(x*x) - avg(x)*avg(x)
+    loses all precision.
+    """
+
+    def __init__(self):
+        self.buffer: list = []
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.windowed = False
+        self.shift = None
+
+    def step(self, value):
+        if self.windowed:
+            self._add(value)
+            return
+        self.buffer.append(value)
+        if len(self.buffer) >= CHUNK_SIZE:
+            self._fold()
+
+    def _fold(self):
+        values = _numbers(self.buffer)
+        self.buffer = []
+        if not len(values):
+            return
+        count = len(values)
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        total = self.count + count
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+    def _add(self, value):
+        value = _number(value)
+        if value is None:
+            return
+        if self.shift is None:
+            self.shift = value
+        value -= self.shift
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def inverse(self, value):
+        self._start_window()
+        value = _number(value)
+        if value is None:
+            return
+        value -= self.shift
+        self.count -= 1
+        if self.count == 0:
+            self.mean = self.m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= delta * (value - self.mean)
+
+    def _start_window(self):
+        if not self.windowed:
+            self._fold()
+            self.windowed = True
+            if self.count:
+                self.shift, self.mean = self.mean, 0.0
+
+    def value(self):
+        self._start_window()
+        return self._result()
+
+    def finalize(self):
+        self._fold()
+        return self._result()
+
+
+class VarSamp(_Moments):
+    def _result(self):
+        return max(self.m2, 0.0) / (self.count - 1) if self.count > 1 else None
+
+
+class VarPop(_Moments):
+    def _result(self):
+        return max(self.m2, 0.0) / self.count if self.count else None
+
+
+class StddevSamp(_Moments):
+    def _result(self):
+        return math.sqrt(max(self.m2, 0.0) / (self.count - 1)) if self.count > 1 else None
+
+
+class StddevPop(_Moments):
+    def _result(self):
+        return math.sqrt(max(self.m2, 0.0) / self.count) if self.count else None
+
+
+class _CoMoments:
+    """Means and co-moments of two columns, as _Moments; rows where either is NULL are skipped"""
+
+    def __init__(self):
+        self.xs: list = []
+        self.ys: list = []
+        self.count = 0
+        self.mean_x = self.mean_y = 0.0
+        self.m2_x = self.m2_y = self.c_xy = 0.0
+        self.windowed = False
+        self.shift = None
+
+    def step(self, x, y):
+        if self.windowed:
+            self._add(x, y)
+            return
+        self.xs.append(x)
+        self.ys.append(y)
+        if len(self.xs) >= CHUNK_SIZE:
+            self._fold()
+
+    def _fold(self):
+        x, y = _pairs(self.xs, self.ys)
+        self.xs, self.ys = [], []
+        count = len(x)
+        if not count:
+            return
+        mean_x, mean_y = float(x.mean()), float(y.mean())
+        dx, dy = x - mean_x, y - mean_y
+        total = self.count + count
+        delta_x, delta_y = mean_x - self.mean_x, mean_y - self.mean_y
+        weight = self.count * count / total
+        self.m2_x += float((dx * dx).sum()) + delta_x * delta_x * weight
+        self.m2_y += float((dy * dy).sum()) + delta_y * delta_y * weight
+        self.c_xy += float((dx * dy).sum()) + delta_x * delta_y * weight
+        self.mean_x += delta_x * count / total
+        self.mean_y += delta_y * count / total
+        self.count = total
+
+    def _add(self, x, y):
+        x, y = _number(x), _number(y)
+        if x is None or y is None:
+            return
+        if self.shift is None:
+            self.shift = (x, y)
+        x -= self.shift[0]
+        y -= self.shift[1]
+        self.count += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.count
+        self.mean_y += dy / self.count
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c_xy += dx * (y - self.mean_y)
+
+    def inverse(self, x, y):
+        self._start_window()
+        x, y = _number(x), _number(y)
+        if x is None or y is None:
+            return
+        x -= self.shift[0]
+        y -= self.shift[1]
+        self.count -= 1
+        if self.count == 0:
+            self.mean_x = self.mean_y = self.m2_x = self.m2_y = self.c_xy = 0.0
+            return
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x -= dx / self.count
+        self.mean_y -= dy / self.count
+        self.m2_x -= dx * (x - self.mean_x)
+        self.m2_y -= dy * (y - self.mean_y)
+        self.c_xy -= (x - self.mean_x) * dy
+
+    def _start_window(self):
+        if not self.windowed:
+            self._fold()
+            self.windowed = True
+            if self.count:
+                self.shift = (self.mean_x, self.mean_y)
+                self.mean_x = self.mean_y = 0.0
+
+    def value(self):
+        self._start_window()
+        return self._result()
+
+    def finalize(self):
+        self._fold()
+        return self._result()
+
+
+def _pairs(xs: list, ys: list):
+    """Float arrays of the rows where both values are numeric"""
+    import numpy as np
+
+    try:
+        x = np.array(xs, dtype=float)
+        y = np.array(ys, dtype=float)
+    except (TypeError, ValueError):
+        x = np.array([_number(value) for value in xs], dtype=float)
+        y = np.array([_number(value) for value in ys], dtype=float)
+    both = ~(np.isnan(x) | np.isnan(y))
+    return x[both], y[both]
+
+
+class CovarSamp(_CoMoments):
+    def _result(self):
+        return self.c_xy / (self.count - 1) if self.count > 1 else None
+
+
+class CovarPop(_CoMoments):
+    def _result(self):
+        return self.c_xy / self.count if self.count else None
+
+
+class Corr(_CoMoments):
+    """corr(x, y): Pearson correlation coefficient"""
+
+    def _result(self):
+        if self.count < 2 or self.m2_x <= 0 or self.m2_y <= 0:
+            return None
+        return max(-1.0, min(1.0, self.c_xy / math.sqrt(self.m2_x * self.m2_y)))
+
+
+class Mode:
+    """mode(x): most frequent non-NULL value; ties go to the smallest value"""
+
+    def __init__(self):
+        self.buffer: list = []
+        self.counts: Counter = Counter()
+        self.windowed = False
+
+    def step(self, value):
+        if self.windowed:
+            if value is not None:
+                self.counts[value] += 1
+            return
+        self.buffer.append(value)
+        if len(self.buffer) >= CHUNK_SIZE:
+            self._fold()
+
+    def _fold(self):
+        self.counts.update(self.buffer)
+        self.counts.pop(None, None)
+        self.buffer = []
+
+    def inverse(self, value):
+        self._start_window()
+        if value is not None:
+            self.counts[value] -= 1
+            if not self.counts[value]:
+                del self.counts[value]
+
+    def _start_window(self):
+        if not self.windowed:
+            self._fold()
+            self.windowed = True
+
+    def value(self):
+        self._start_window()
+        return self._result()
+
+    def finalize(self):
+        self._fold()
+        return self._result()
+
+    def _result(self):
+        if not self.counts:
+            return None
+        top = max(self.counts.values())
+        # Text and numbers do not compare; order them the way SQLite does
+        return min(
+            (value for value, count in self.counts.items() if count == top),
+            key=lambda value: (isinstance(value, (str, bytes)), isinstance(value, bytes), value)
+        )
+
+
+class ApproxCountDistinct:
+    """
+    approx_count_distinct(x): HyperLogLog estimate of COUNT(DISTINCT x)
+
+    Memory stays at 2**PRECISION registers however many distinct values
+    there are; the standard error is about 1.04 / sqrt(2**PRECISION), 0.8%
+    at the default precision. Small counts use linear counting and are close
+    to exact.
+    """
+
+    PRECISION = 14
+
+    def __init__(self):
+        import numpy as np
+
+        self.buffer: list = []
+        self.registers = np.zeros(1 << self.PRECISION, dtype=np.uint8)
+
+    def step(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= CHUNK_SIZE:
+            self._fold()
+
+    def _fold(self):
+        import numpy as np
+
+        values = [value for value in self.buffer if value is not None]
+        self.buffer = []
+        if not values:
+            return
+        # SplitMix64 finalizer over Python's hash, which maps small ints to themselves
+        h = np.fromiter(map(hash, values), dtype=np.int64, count=len(values)).view(np.uint64)
+        h = h + np.uint64(0x9E3779B97F4A7C15)
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+
+        bits = 64 - self.PRECISION
+        index = (h >> np.uint64(bits)).astype(np.intp)
+        rest = h & np.uint64((1 << bits) - 1)
+        # Rank: position of the first set bit in the remaining bits
+        rank = np.full(len(rest), bits + 1, dtype=np.uint8)
+        nonzero = rest > 0
+        rank[nonzero] = bits - np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def finalize(self):
+        import numpy as np
+
+        self._fold()
+        m = len(self.registers)
+        zeros = int((self.registers == 0).sum())
+        if zeros == m:
+            return 0
+        harmonic = float(np.ldexp(1.0, -self.registers.astype(np.int32)).sum())
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / harmonic
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # Linear counting for small cardinalities
+        return int(round(estimate))
+
+
+# name -> (argument count, implementation); these work as aggregates and window functions
+WINDOW_FUNCTIONS: Dict[str, tuple] = {
+    "median": (1, Median),
+    "percentile_cont": (2, PercentileCont),
+    "percentile_disc": (2, PercentileDisc),
+    "stddev": (1, StddevSamp),
+    "stddev_samp": (1, StddevSamp),
+    "stddev_pop": (1, StddevPop),
+    "variance": (1, VarSamp),
+    "var": (1, VarSamp),
+    "var_samp": (1, VarSamp),
+    "var_pop": (1, VarPop),
+    "corr": (2, Corr),
+    "covar_samp": (2, CovarSamp),
+    "covar_pop": (2, CovarPop),
+    "mode": (1, Mode),
+}
+
+# Aggregate-only functions (no way to remove a row from the state)
+AGGREGATE_FUNCTIONS: Dict[str, tuple] = {
+    "approx_count_distinct": (1, ApproxCountDistinct),
+}
+
+
+def register_functions(conn: sqlite3.Connection):
+    """
+    Register the statistical aggregate and window functions on a connection
+
+    Args:
+        conn: Connection to register them on
+    """
+    for name, (arguments, implementation) in WINDOW_FUNCTIONS.items():
+        conn.create_window_function(name, arguments, implementation)
+    for name, (arguments, implementation) in AGGREGATE_FUNCTIONS.items():
+        conn.create_aggregate(name, arguments, implementation)
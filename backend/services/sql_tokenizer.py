@@ -0,0 +1,135 @@
+import hashlib
+import re
+from typing import List, NamedTuple
+
+
+class Token(NamedTuple):
+    """A lexical SQL token with its position in the source string"""
+    kind: str
+    value: str
+    start: int
+    end: int
+
+
+# Single compiled scanner for SQLite's lexical grammar. Alternation order
+# matters: comments before operators, numbers before words.
+_TOKEN_PATTERN = re.compile(
+    r"""
+      (?P<whitespace>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<string>'(?:[^']|'')*'?)
+    | (?P<identifier>"(?:[^"]|"")*"?|`(?:[^`]|``)*`?|\[[^\]]*\]?)
+    | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<parameter>[?][0-9]*|[:@$][A-Za-z0-9_]+)
+    | (?P<operator>\|\||<>|<=|>=|==|!=|<<|>>|[-+*/%<>=~&|])
+    | (?P<punctuation>[;,().])
+    | (?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL
+)
+
+# Token kinds that carry no meaning for validation or rewriting
+TRIVIA = {"whitespace", "comment"}
+
+# Complete (closed) forms of the tokens that can run to the end of input
+_CLOSED = {
+    "'": re.compile(r"'(?:[^']|'')*'", re.DOTALL),
+    '"': re.compile(r'"(?:[^"]|"")*"', re.DOTALL),
+    '`': re.compile(r"`(?:[^`]|``)*`", re.DOTALL),
+    '[': re.compile(r"\[[^\]]*\]", re.DOTALL),
+}
+
+
+def tokenize(sql: str, keep_whitespace: bool = False) -> List[Token]:
+    """
+    Split SQL into tokens in a single pass
+
+    String literals, quoted identifiers and comments each come back as one
+    token, so keywords inside them are never mistaken for SQL keywords.
+
+    Args:
+        sql: SQL query string
+        keep_whitespace: Include whitespace tokens (comments are always kept)
+
+    Returns:
+        List of Token tuples in source order
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if not keep_whitespace and kind == "whitespace":
+            continue
+        tokens.append(Token(kind, match.group(), match.start(), match.end()))
+    return tokens
+
+
+def is_terminated(token: Token) -> bool:
+    """Check that a string literal, quoted identifier or block comment is closed"""
+    value = token.value
+    if token.kind in ("string", "identifier"):
+        return _CLOSED[value[0]].fullmatch(value) is not None
+    if token.kind == "comment" and value.startswith("/*"):
+        return value.endswith("*/") and len(value) >= 4
+    return True
+
+
+def identifier_name(token: Token) -> str:
+    """Unquoted name of a word or quoted identifier token"""
+    value = token.value
+    if token.kind == "identifier":
+        quote = value[0]
+        inner = value[1:-1] if is_terminated(token) else value[1:]
+        if quote == '[':
+            return inner
+        return inner.replace(quote * 2, quote)
+    return value
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize SQL so queries differing only in literals compare equal
+
+    Literals become "?", comma-separated runs of literals (IN lists) collapse
+    to a single "?", comments are dropped, words are lowercased and
+    whitespace is collapsed.
+
+    Args:
+        sql: SQL query string
+
+    Returns:
+        Normalized SQL text
+    """
+    parts: List[str] = []
+    for token in tokenize(sql):
+        kind = token.kind
+        if kind == "comment":
+            continue
+        if kind in ("string", "number", "parameter"):
+            # Collapse "?, ?, ?" as in IN (...) lists
+            if len(parts) >= 2 and parts[-1] == "," and parts[-2] == "?":
+                parts.pop()
+                continue
+            parts.append("?")
+        elif kind == "word":
+            parts.append(token.value.lower())
+        elif kind == "identifier":
+            parts.append(identifier_name(token).lower())
+        elif token.value == ";":
+            continue
+        else:
+            parts.append(token.value)
+    return " ".join(parts)
+
+
+def fingerprint_sql(sql: str) -> str:
+    """
+    Stable short identifier for the shape of a query
+
+    Args:
+        sql: SQL query string
+
+    Returns:
+        16-character hex digest of the normalized SQL
+    """
+    return hashlib.sha1(normalize_sql(sql).encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,612 @@
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import json_encoding
+from .export_formats import HAS_PYARROW, column_types, iter_parquet, storage_classes_query
+from .sampling import SampleTable
+from .text_search import TextSearchIndex
+from .workers import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Extension of the archive file for each format
+ARCHIVE_EXTENSIONS = {"parquet": "parquet", "jsonl.gz": "jsonl.gz"}
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _file_identity(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class StorageManager:
+    """
+    Disk budget for uploaded tables and the stores derived from them
+
+    Tracks when each table was last queried. When the files under <db_dir>
+    exceed the budget, the least recently used tables first lose their
+    columnar copies and rollups, then are moved to a compressed archive under <db_dir>/archive and their files deleted:
+    Parquet with zstd when pyarrow is installed, gzip-compressed JSON lines
+    otherwise and for tables with a column that mixes storage classes, which
+    Parquet's typed columns would not give back unchanged. The catalog keeps each archived table's CREATE statements, so
+    the next query rebuilds the same table file. A background thread enforces
+    the budget and runs incremental VACUUM on the databases in <db_dir>.
+
+    Archiving and restoring a table hold its lock file in <db_dir>/locks, so
+    worker processes sharing db_dir never move the same table at once. Only
+    one of them runs each maintenance pass.
+    """
+
+    # Disk space for everything under <db_dir>
+    BUDGET_BYTES = int(float(os.getenv("STORAGE_BUDGET_MB", 2048)) * 1024 * 1024)
+
+    # Tables queried more recently than this are never archived
+    MIN_IDLE_SECONDS = int(os.getenv("STORAGE_MIN_IDLE_SECONDS", 3600))
+
+    # Seconds between budget checks and incremental VACUUM runs
+    CHECK_INTERVAL_SECONDS = int(os.getenv("STORAGE_CHECK_INTERVAL_SECONDS", 300))
+
+    # parquet or jsonl.gz
+    ARCHIVE_FORMAT = os.getenv("STORAGE_ARCHIVE_FORMAT", "parquet" if HAS_PYARROW else "jsonl.gz")
+
+    # Free pages returned per database on each incremental VACUUM
+    VACUUM_PAGES = int(os.getenv("STORAGE_VACUUM_PAGES", 2000))
+
+    BATCH_SIZE = 10000
+
+    _instances: Dict[str, "StorageManager"] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_database(cls, database) -> "StorageManager":
+        """Shared manager for a catalog, so access times recorded by any DatabaseService are seen"""
+        key = os.path.abspath(database.db_path)
+        with cls._instances_lock:
+            manager = cls._instances.get(key)
+            if manager is None:
+                manager = cls._instances[key] = cls(database)
+            return manager
+
+    def __init__(self, database):
+        """
+        Args:
+            database: DatabaseService whose tables are managed
+        """
+        self.database = database
+        self.archive_dir = os.path.join(database.db_dir, "archive")
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        if self.ARCHIVE_FORMAT not in ARCHIVE_EXTENSIONS:
+            raise ValueError(f"Unsupported archive format '{self.ARCHIVE_FORMAT}'")
+        if self.ARCHIVE_FORMAT == "parquet" and not HAS_PYARROW:
+            raise ValueError("The parquet archive format requires pyarrow to be installed")
+
+        self.archived = 0
+        self.derived_dropped = 0
+        self.rehydrated = 0
+        self.rehydrate_seconds = 0.0
+        self.failed_runs = 0
+        self.failed_archives = 0
+
+        self._lock = threading.Lock()
+        self._table_locks: Dict[str, FileLock] = {}
+        self._maintenance_lock = FileLock(os.path.join(database.locks_dir, "maintenance.lock"))
+        self._accessed: Dict[str, float] = {}  # Not yet written to the catalog
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._init_storage_table()
+
+    def _catalog(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.database.db_path, timeout=30)
+
+    def _init_storage_table(self):
+        conn = self._catalog()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS _storage (
+                    table_name TEXT PRIMARY KEY,
+                    last_accessed REAL,
+                    archive_format TEXT,
+                    archive_bytes INTEGER,
+                    archived_at REAL,
+                    table_sql TEXT
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _table_lock(self, table_name: str) -> FileLock:
+        with self._lock:
+            lock = self._table_locks.get(table_name)
+            if lock is None:
+                lock = self._table_locks[table_name] = FileLock(
+                    os.path.join(self.database.locks_dir, f"table_{table_name}.lock")
+                )
+            return lock
+
+    def _archive_path(self, table_name: str, archive_format: str) -> str:
+        return os.path.join(self.archive_dir, f"{table_name}.{ARCHIVE_EXTENSIONS[archive_format]}")
+
+    def record_access(self, table_name: str):
+        """Note that a table was queried; written to the catalog on the next budget check"""
+        with self._lock:
+            self._accessed[table_name] = time.time()
+
+    def flush_access(self):
+        """Write recorded access times to the catalog"""
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+        if not accessed:
+            return
+
+        conn = self._catalog()
+        try:
+            conn.executemany("""
+                INSERT INTO _storage (table_name, last_accessed) VALUES (?, ?)
+                ON CONFLICT (table_name) DO UPDATE
+                SET last_accessed = MAX(COALESCE(last_accessed, 0), excluded.last_accessed)
+            """, accessed.items())
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _archive_row(self, table_name: str) -> Optional[Tuple[str, str]]:
+        """(archive_format, table_sql) of an archived table, None if it is not archived"""
+        conn = self._catalog()
+        try:
+            return conn.execute(
+                "SELECT archive_format, table_sql FROM _storage WHERE table_name = ? AND archive_format IS NOT NULL",
+                (table_name,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+    def _sample(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """Sample settings recorded at upload, None if the table has no sample"""
+        conn = self._catalog()
+        try:
+            row = conn.execute("SELECT columns FROM _metadata WHERE table_name = ?", (table_name,)).fetchone()
+        finally:
+            conn.close()
+        metadata = json.loads(row[0]) if row else {}
+        return metadata.get("sample") if isinstance(metadata, dict) else None
+
+    def is_archived(self, table_name: str) -> bool:
+        """Check whether a table only exists in the archive"""
+        return self._archive_row(table_name) is not None
+
+    def archive(self, table_name: str) -> bool:
+        """
+        Move a table file to the compressed archive
+
+        Args:
+            table_name: Table to archive
+
+        Returns:
+            True if the table was archived, False if it has no table file
+        """
+        with self._table_lock(table_name):
+            path = self.database.table_path(table_name)
+            if not os.path.exists(path):
+                return False
+
+            # Stop serving the in-memory and columnar copies; they are rebuilt after rehydration
+            self.database.hot_tables.demote(table_name)
+            self.database.columnar.forget(table_name)
+
+            archive_format = self.ARCHIVE_FORMAT
+            archive_path = tmp_path = None
+            identity = _file_identity(path)
+            source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                # Shadow tables of search indexes are recreated by their virtual table
+                shadow = {row[1] for row in source.execute("PRAGMA main.table_list") if row[2] == "shadow"}
+                statements = [
+                    (object_type, sql) for object_type, name, sql in source.execute(
+                        "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL ORDER BY type = 'index'"
+                    )
+                    if name not in shadow
+                ]
+                # Generated columns are recomputed when the table is rebuilt
+                columns = [
+                    row[1] for row in source.execute(f"PRAGMA table_xinfo({_quote(table_name)})") if row[6] == 0
+                ]
+                select = f"SELECT {', '.join(_quote(column) for column in columns)} FROM {_quote(table_name)}"
+                types = None
+                if archive_format == "parquet":
+                    types = column_types(source.execute(storage_classes_query(select, len(columns))).fetchone())
+                    if any(len(seen) > 1 for seen in types):
+                        archive_format = "jsonl.gz"
+                archive_path = self._archive_path(table_name, archive_format)
+                tmp_path = f"{archive_path}.tmp"
+                cursor = source.execute(select)
+                batches = iter(lambda: cursor.fetchmany(self.BATCH_SIZE), [])
+                if archive_format == "parquet":
+                    with open(tmp_path, "wb") as archive_file:
+                        for chunk in iter_parquet(columns, batches, compression="zstd", types=types):
+                            archive_file.write(chunk)
+                else:
+                    with gzip.open(tmp_path, "wb", compresslevel=6) as archive_file:
+                        archive_file.write(json_encoding.dumps(columns) + b"\n")
+                        for rows in batches:
+                            archive_file.write(b"\n".join(json_encoding.dumps(row) for row in rows) + b"\n")
+                if _file_identity(path) != identity:
+                    os.remove(tmp_path)  # Uploaded again while being archived
+                    return False
+                os.replace(tmp_path, archive_path)
+            except BaseException:
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            finally:
+                source.close()
+
+            conn = self._catalog()
+            try:
+                conn.execute("""
+                    INSERT INTO _storage (table_name, archive_format, archive_bytes, archived_at, table_sql)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (table_name) DO UPDATE SET
+                        archive_format = excluded.archive_format,
+                        archive_bytes = excluded.archive_bytes,
+                        archived_at = excluded.archived_at,
+                        table_sql = excluded.table_sql
+                """, (
+                    table_name, archive_format, os.path.getsize(archive_path), time.time(),
+                    json.dumps(statements)
+                ))
+                conn.commit()
+            finally:
+                conn.close()
+
+            # Connections with the file attached keep reading it until their next checkout
+            os.remove(path)
+
+        with self._lock:
+            self.archived += 1
+        return True
+
+    def _read_archive(self, path: str, archive_format: str) -> Tuple[List[str], Iterator[List[tuple]]]:
+        """Column names and row batches stored in an archive file"""
+        if archive_format == "parquet":
+            import pyarrow.parquet as pq
+
+            parquet_file = pq.ParquetFile(path)
+            batches = (
+                list(zip(*(column.to_pylist() for column in batch.columns)))
+                for batch in parquet_file.iter_batches(batch_size=self.BATCH_SIZE)
+            )
+            return parquet_file.schema_arrow.names, batches
+
+        with gzip.open(path, "rb") as archive_file:
+            columns = json.loads(archive_file.readline())
+        return columns, self._iter_json_lines(path)
+
+    def _iter_json_lines(self, path: str) -> Iterator[List[tuple]]:
+        with gzip.open(path, "rb") as archive_file:
+            archive_file.readline()  # Column names
+            rows = []
+            for line in archive_file:
+                rows.append(tuple(json.loads(line)))
+                if len(rows) == self.BATCH_SIZE:
+                    yield rows
+                    rows = []
+            if rows:
+                yield rows
+
+    def rehydrate(self, table_name: str) -> Optional[float]:
+        """
+        Rebuild an archived table's file
+
+        Args:
+            table_name: Table to restore
+
+        Returns:
+            Seconds spent restoring, 0.0 if another thread restored it first,
+            or None if the table is not archived
+        """
+        with self._table_lock(table_name):
+            if os.path.exists(self.database.table_path(table_name)):
+                return 0.0
+            row = self._archive_row(table_name)
+            if row is None:
+                return None
+
+            start = time.perf_counter()
+            archive_format, table_sql = row
+            archive_path = self._archive_path(table_name, archive_format)
+            statements = json.loads(table_sql)
+            sample = self._sample(table_name)
+
+            def fill(conn: sqlite3.Connection):
+                for object_type, sql in statements:
+                    if object_type == "table":
+                        conn.execute(sql)
+                columns, batches = self._read_archive(archive_path, archive_format)
+                insert = (
+                    f"INSERT INTO {_quote(table_name)} ({', '.join(_quote(column) for column in columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})"
+                )
+                for rows in batches:
+                    conn.executemany(insert, rows)
+                # Indexes are cheaper to build once the rows are in
+                for object_type, sql in statements:
+                    if object_type != "table":
+                        conn.execute(sql)
+                for row in conn.execute("PRAGMA main.table_list").fetchall():
+                    if row[2] == "virtual":
+                        TextSearchIndex.rebuild(conn, row[1])
+                # The archive holds only the table's rows; draw a new sample from them
+                if sample is not None:
+                    SampleTable.create(conn, table_name, sample.get("strata"))
+
+            self.database.write_table_file(table_name, fill)
+
+            conn = self._catalog()
+            try:
+                conn.execute("""
+                    UPDATE _storage
+                    SET archive_format = NULL, archive_bytes = NULL, archived_at = NULL, table_sql = NULL,
+                        last_accessed = ?
+                    WHERE table_name = ?
+                """, (time.time(), table_name))
+                conn.commit()
+            finally:
+                conn.close()
+            os.remove(archive_path)
+
+            seconds = time.perf_counter() - start
+
+        with self._lock:
+            self.rehydrated += 1
+            self.rehydrate_seconds += seconds
+        return seconds
+
+    def forget(self, table_name: str):
+        """Remove a deleted or re-uploaded table's archive and access record"""
+        with self._table_lock(table_name):
+            with self._lock:
+                self._accessed.pop(table_name, None)
+            conn = self._catalog()
+            try:
+                conn.execute("DELETE FROM _storage WHERE table_name = ?", (table_name,))
+                conn.commit()
+            finally:
+                conn.close()
+            for archive_format in ARCHIVE_EXTENSIONS:
+                try:
+                    os.remove(self._archive_path(table_name, archive_format))
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _files(directory: str, suffix: str) -> List[Tuple[str, int, float]]:
+        """(name, size, modified time) of the files in a directory ending with suffix"""
+        files = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(suffix):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((entry.name[:-len(suffix)], stat.st_size, stat.st_mtime))
+        return files
+
+    @staticmethod
+    def _tree_bytes(path: str) -> int:
+        """Bytes of the files under a directory"""
+        total = 0
+        for root, _, names in os.walk(path):
+            for name in names:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def _database_bytes(self, name: str) -> int:
+        """Bytes of a SQLite file in <db_dir> with its WAL and shared memory files"""
+        total = 0
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            try:
+                total += os.path.getsize(os.path.join(self.database.db_dir, name + suffix))
+            except FileNotFoundError:
+                pass
+        return total
+
+    def usage(self) -> Dict[str, Any]:
+        """
+        Bytes on disk under <db_dir>, by store
+
+        total_bytes counts every file the budget covers: table files,
+        archives, columnar copies, rollups, spilled results, the query
+        history and question cache logs and the catalog.
+        """
+        db_dir = self.database.db_dir
+        live = self._files(self.database.tables_dir, ".db")
+        archived = [
+            item for archive_format in ARCHIVE_EXTENSIONS
+            for item in self._files(self.archive_dir, f".{ARCHIVE_EXTENSIONS[archive_format]}")
+        ]
+        stores = {
+            "columnar_bytes": self._tree_bytes(os.path.join(db_dir, "columnar")),
+            "rollup_bytes": self._database_bytes("rollups.db"),
+            "results_bytes": self._tree_bytes(os.path.join(db_dir, "results")),
+            "history_bytes": self._database_bytes("query_history.db"),
+            "question_cache_bytes": self._database_bytes("question_cache.db"),
+        }
+        with self._lock:
+            return {
+                "live_tables": len(live),
+                "live_bytes": sum(size for _, size, _ in live),
+                "archived_tables": len(archived),
+                "archive_bytes": sum(size for _, size, _ in archived),
+                **stores,
+                "total_bytes": self._tree_bytes(db_dir),
+                "budget_bytes": self.BUDGET_BYTES,
+                "archived": self.archived,
+                "derived_dropped": self.derived_dropped,
+                "rehydrated": self.rehydrated,
+                "rehydrate_seconds": self.rehydrate_seconds,
+                "failed_runs": self.failed_runs,
+                "failed_archives": self.failed_archives
+            }
+
+    def enforce_budget(self) -> List[str]:
+        """
+        Bring everything under <db_dir> within the budget
+
+        Idle tables lose their columnar copies and rollups first, least
+        recently used first; both are rebuilt when queries need them again.
+        If that is not enough, the same tables are archived. Spilled results
+        and the history and question cache logs are counted but kept within
+        their own limits (RESULT_SPILL_QUOTA_MB, the history's retention
+        and QUESTION_CACHE_MAX_ENTRIES).
+
+        Returns:
+            Names of the archived tables
+        """
+        self.flush_access()
+
+        total = self.usage()["total_bytes"]
+        if total <= self.BUDGET_BYTES:
+            return []
+
+        conn = self._catalog()
+        try:
+            last_accessed = dict(conn.execute("SELECT table_name, last_accessed FROM _storage"))
+        finally:
+            conn.close()
+
+        now = time.time()
+        candidates = []
+        for table_name, size, modified in self._files(self.database.tables_dir, ".db"):
+            accessed = last_accessed.get(table_name) or modified  # Never queried: time of upload
+            if now - accessed >= self.MIN_IDLE_SECONDS:
+                candidates.append((accessed, table_name, size))
+        candidates.sort()
+
+        # Derived copies first: nothing is lost, they are rebuilt on demand
+        rollups_dropped = False
+        for _, table_name, _ in candidates:
+            if total <= self.BUDGET_BYTES:
+                break
+            columnar_path = self.database.columnar.path(table_name)
+            if os.path.exists(columnar_path):
+                total -= os.path.getsize(columnar_path)
+                self.database.columnar.forget(table_name)
+                with self._lock:
+                    self.derived_dropped += 1
+            if self.database.rollups.forget(table_name):
+                rollups_dropped = True
+                with self._lock:
+                    self.derived_dropped += 1
+        if rollups_dropped:
+            # Dropped rollup tables only shrink rollups.db once their pages are returned
+            self._vacuum(self.database.rollups.path, full=True)
+            total = self.usage()["total_bytes"]
+
+        archived = []
+        for _, table_name, size in candidates:
+            if total <= self.BUDGET_BYTES:
+                break
+            try:
+                if not self.archive(table_name):
+                    continue
+            except (sqlite3.Error, OSError, ValueError):
+                # Leave this table live and keep going, or every pass would stop at it
+                logger.exception("Archiving '%s' failed", table_name)
+                with self._lock:
+                    self.failed_archives += 1
+                continue
+            archived.append(table_name)
+            total -= size
+            archive_format = self._archive_row(table_name)[0]  # jsonl.gz for tables Parquet cannot hold
+            total += os.path.getsize(self._archive_path(table_name, archive_format))
+        return archived
+
+    def incremental_vacuum(self):
+        """Return free pages of the databases in <db_dir> to the file system"""
+        for entry in os.scandir(self.database.db_dir):
+            if entry.name.endswith(".db"):
+                self._vacuum(entry.path)
+
+    def _vacuum(self, path: str, full: bool = False):
+        """Return up to VACUUM_PAGES free pages of a database, or all of them with full"""
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # Switching modes rewrites the file once; later runs are incremental
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            conn.execute(f"PRAGMA incremental_vacuum{'' if full else f'({self.VACUUM_PAGES})'}").fetchall()
+        except sqlite3.OperationalError:
+            pass  # Busy; try again on the next run
+        finally:
+            conn.close()
+
+    def _remove_stale_tmp_files(self):
+        """Partial table files and archives left behind by a crash"""
+        cutoff = time.time() - self.CHECK_INTERVAL_SECONDS
+        for directory in (self.database.tables_dir, self.archive_dir):
+            for entry in os.scandir(directory):
+                try:
+                    if entry.name.endswith(".tmp") and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def run(self):
+        """
+        One maintenance pass: budget, temporary files and incremental VACUUM
+
+        Skipped, apart from saving access times, while another worker runs one.
+        """
+        if not self._maintenance_lock.acquire(blocking=False):
+            self.flush_access()
+            return
+        try:
+            self.enforce_budget()
+            self._remove_stale_tmp_files()
+            self.incremental_vacuum()
+        finally:
+            self._maintenance_lock.release()
+
+    def _run_loop(self):
+        while not self._stop.wait(self.CHECK_INTERVAL_SECONDS):
+            try:
+                self.run()
+            except (sqlite3.Error, OSError, ValueError):
+                with self._lock:
+                    self.failed_runs += 1  # Retried on the next interval
+
+    def start(self):
+        """Run maintenance in a background thread every CHECK_INTERVAL_SECONDS"""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run_loop, name="storage-manager", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and save recorded access times"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        self.flush_access()
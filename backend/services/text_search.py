@@ -0,0 +1,257 @@
+import os
+import sqlite3
+from typing import List, Optional, TYPE_CHECKING
+
+from .sql_tokenizer import TRIVIA, Token, identifier_name, tokenize
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class TextSearchIndex:
+    """
+    FTS5 trigram indexes for substring search on text columns
+
+    `LOWER(col) LIKE '%term%'` can never use a B-tree index, so it scans every
+    row. At upload, high-cardinality text columns get an external-content
+    FTS5 table with the trigram tokenizer, stored next to the table in its
+    file. rewrite() then narrows LIKE predicates on those columns to the
+    rowids the index returns. The original predicate is kept, so results are
+    exactly the same; the index only decides which rows are checked.
+    """
+
+    # "auto": pick columns by cardinality, "all": every text column, "off": no index
+    MODE = os.getenv("TEXT_SEARCH_INDEX", "auto").lower()
+    MIN_ROWS = int(os.getenv("TEXT_SEARCH_MIN_ROWS", 50000))
+    MIN_DISTINCT_RATIO = float(os.getenv("TEXT_SEARCH_MIN_DISTINCT_RATIO", 0.2))
+    MAX_COLUMNS = int(os.getenv("TEXT_SEARCH_MAX_COLUMNS", 3))
+    SAMPLE_ROWS = 100000
+
+    SUFFIX = "__fts"
+
+    # Trigram index lookups need at least three characters
+    MIN_TERM_LENGTH = 3
+
+    # Words that end the WHERE clause of a single SELECT
+    _CLAUSE_END = {"GROUP", "ORDER", "LIMIT", "HAVING", "WINDOW"}
+    # Predicates under these may observe NULL vs false, which the rewrite changes
+    _UNSAFE = {"NOT", "IS", "CASE", "ESCAPE"}
+
+    @classmethod
+    def index_name(cls, table_name: str) -> str:
+        """Name of a table's FTS5 table inside its file"""
+        return f"{table_name}{cls.SUFFIX}"
+
+    @classmethod
+    def choose_columns(cls, df: "pd.DataFrame") -> List[str]:
+        """
+        Pick the text columns worth indexing
+
+        In "auto" mode a column qualifies when the table has at least MIN_ROWS
+        rows and, in a sample, most values are distinct (free text, names,
+        identifiers). Low-cardinality columns such as categories are better
+        served by equality filters. At most MAX_COLUMNS columns are chosen,
+        most distinct first, since every indexed column adds upload time.
+
+        Args:
+            df: DataFrame being uploaded
+
+        Returns:
+            Column names to index
+        """
+        import pandas as pd
+
+        if cls.MODE == "off" or df.empty or (cls.MODE == "auto" and len(df) < cls.MIN_ROWS):
+            return []
+
+        sample = df.sample(cls.SAMPLE_ROWS, random_state=0) if len(df) > cls.SAMPLE_ROWS else df
+        candidates = []
+        for col in df.columns:
+            values = sample[col].dropna()
+            if values.empty or pd.api.types.infer_dtype(values, skipna=True) != "string":
+                continue
+            if values.str.len().mean() < cls.MIN_TERM_LENGTH:
+                continue
+            ratio = values.nunique() / len(values)
+            if cls.MODE == "all" or ratio >= cls.MIN_DISTINCT_RATIO:
+                candidates.append((ratio, str(col)))
+
+        candidates.sort(key=lambda candidate: -candidate[0])
+        return [name for _, name in candidates[:cls.MAX_COLUMNS]]
+
+    @classmethod
+    def create(cls, conn: sqlite3.Connection, table_name: str, columns: List[str]):
+        """
+        Build the FTS5 table for columns of a freshly written table
+
+        The index reads its text from the table itself (external content), so
+        the strings are not stored twice.
+
+        Args:
+            conn: Connection to the table's file
+            table_name: Table whose columns are indexed
+            columns: Columns from choose_columns
+        """
+        index = _quote(cls.index_name(table_name))
+        conn.execute(
+            f"CREATE VIRTUAL TABLE {index} USING fts5("
+            f"{', '.join(_quote(column) for column in columns)}, "
+            f"content={_literal(table_name)}, tokenize='trigram')"
+        )
+        cls.rebuild(conn, cls.index_name(table_name))
+
+    @staticmethod
+    def rebuild(conn: sqlite3.Connection, index_name: str):
+        """Re-read all rows of an external-content FTS5 table"""
+        conn.execute(f"INSERT INTO {_quote(index_name)}({_quote(index_name)}) VALUES ('rebuild')")
+
+    @classmethod
+    def match_expression(cls, column: str, pattern: str) -> Optional[str]:
+        """
+        FTS5 query returning a superset of the rows where column LIKE pattern
+
+        Every literal run of the pattern between % and _ wildcards must occur
+        in the column, so runs long enough for the trigram index are ANDed.
+
+        Args:
+            column: Indexed column
+            pattern: LIKE pattern
+
+        Returns:
+            FTS5 MATCH expression, or None if no run is long enough
+        """
+        runs = pattern.replace("_", "%").split("%")
+        phrases = [
+            f'{_quote(column)} : "{run.replace(chr(34), chr(34) * 2)}"'
+            for run in runs if len(run) >= cls.MIN_TERM_LENGTH
+        ]
+        return " AND ".join(phrases) if phrases else None
+
+    @classmethod
+    def rewrite(cls, sql: str, table_name: str, columns: List[str]) -> str:
+        """
+        Narrow LIKE predicates on indexed columns with FTS5 lookups
+
+        `col LIKE 'p'` and `LOWER(col) LIKE 'p'` in the WHERE clause become
+        `(rowid IN (SELECT rowid FROM <index> WHERE <index> MATCH ...) AND
+        col LIKE 'p')`, and the table is read from its file rather than the
+        hot tier. Only plain single-table SELECTs are rewritten, and
+        not when the WHERE clause has NOT, IS or CASE, where the rewritten
+        predicate could turn NULL into false. Anything else is returned
+        unchanged.
+
+        Args:
+            sql: Validated, sanitized SELECT
+            table_name: Table the query reads
+            columns: Columns with a search index
+
+        Returns:
+            Rewritten SQL, or sql itself when nothing applies
+        """
+        if not columns or "like" not in sql.lower():
+            return sql
+
+        indexed = {column.lower(): column for column in columns}
+
+        tokens = [token for token in tokenize(sql) if token.kind not in TRIVIA]
+        words = [token.value.upper() if token.kind == "word" else None for token in tokens]
+        if words.count("SELECT") != 1 or words.count("FROM") != 1 or "JOIN" in words:
+            return sql
+
+        # FROM <table> [[AS] alias] WHERE
+        position = words.index("FROM") + 1
+        if position >= len(tokens) or identifier_name(tokens[position]).lower() != table_name.lower():
+            return sql
+        source = tokens[position]
+        names = {table_name.lower()}
+        position += 1
+        if position < len(tokens) and words[position] == "AS":
+            position += 1
+        if position < len(tokens) and words[position] != "WHERE" and tokens[position].kind in ("word", "identifier"):
+            names.add(identifier_name(tokens[position]).lower())
+            position += 1
+        if position >= len(tokens) or words[position] != "WHERE":
+            return sql
+
+        where_start = position + 1
+        where_end, depth = len(tokens), 0
+        for index in range(where_start, len(tokens)):
+            value = tokens[index].value
+            if value == "(":
+                depth += 1
+            elif value == ")":
+                depth -= 1
+            elif depth == 0 and words[index] in cls._CLAUSE_END:
+                where_end = index
+                break
+        if any(words[index] in cls._UNSAFE for index in range(where_start, where_end)):
+            return sql
+
+        schema = _quote("table_" + table_name)
+        index_name = f"{schema}.{_quote(cls.index_name(table_name))}"
+        replacements = []
+        for like in range(where_start, where_end):
+            if words[like] != "LIKE" or like + 1 >= where_end or tokens[like + 1].kind != "string":
+                continue
+            predicate = cls._predicate_start(tokens, words, like, where_start, names)
+            if predicate is None:
+                continue
+            start, column = predicate
+            column = indexed.get(column.lower())
+            if column is None:
+                continue
+            pattern = tokens[like + 1].value[1:-1].replace("''", "'")
+            match = cls.match_expression(column, pattern)
+            if match is None:
+                continue
+            lookup = (
+                f"(rowid IN (SELECT rowid FROM {index_name} "
+                f"WHERE {_quote(cls.index_name(table_name))} MATCH {_literal(match)}) AND "
+            )
+            replacements.append((tokens[start].start, tokens[like + 1].end, lookup))
+
+        if not replacements:
+            return sql
+        for start, end, lookup in reversed(replacements):
+            sql = f"{sql[:start]}{lookup}{sql[start:end]}){sql[end:]}"
+        # Read the table file itself: a hot-tier view has no rowids matching the index
+        return f"{sql[:source.start]}{schema}.{_quote(table_name)}{sql[source.end:]}"
+
+    @staticmethod
+    def _predicate_start(tokens: List[Token], words: List[Optional[str]], like: int, lower_bound: int, names: set):
+        """
+        Find the column operand left of LIKE
+
+        Accepts `col`, `t.col`, `LOWER(col)` and `UPPER(t.col)`.
+
+        Returns:
+            Tuple of (index of the operand's first token, column name), or None
+        """
+        def column_at(end: int):
+            # Column reference ending at token index end: (start, name)
+            if end < lower_bound or tokens[end].kind not in ("word", "identifier"):
+                return None
+            if end - 2 >= lower_bound and tokens[end - 1].value == ".":
+                if identifier_name(tokens[end - 2]).lower() not in names:
+                    return None
+                return end - 2, identifier_name(tokens[end])
+            return end, identifier_name(tokens[end])
+
+        end = like - 1
+        if end >= lower_bound and tokens[end].value == ")":
+            inner = column_at(end - 1)
+            if inner is None:
+                return None
+            start = inner[0] - 2
+            if start < lower_bound or tokens[start + 1].value != "(" or words[start] not in ("LOWER", "UPPER"):
+                return None
+            return start, inner[1]
+        return column_at(end)
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .question_cache import QuestionCache
+from .sql_tokenizer import Token, tokenize
+
+
+class TrafficCapture:
+    """
+    Anonymized log of /api/query traffic for replay load tests
+
+    Off unless QUERY_CAPTURE_PATH is set. Each captured query is appended to
+    that file as one JSON line with its arrival time, table, mode, the SQL
+    the LLM answered, the question cache outcome, status, row count and
+    stage timings; the first query against each version of a table also
+    writes the table's columns and row count. benchmarks/replay.py rebuilds
+    the tables from those records and replays the queries.
+
+    Questions and free-text string literals in SQL are replaced word by
+    word with pseudo-words derived from a salted hash, so repeated questions
+    and filter values stay recognizably equal without the text being kept.
+    Filler words, numbers, dates, date function arguments, and table and
+    column names are kept, since they decide what SQL runs. The salt comes from QUERY_CAPTURE_SALT or a
+    random one kept next to the capture file, shared by all workers.
+
+    Like the query history, record() only enqueues and a background thread
+    appends the lines, so requests never wait on the file.
+    """
+
+    PATH = os.getenv("QUERY_CAPTURE_PATH", "")
+
+    # Fraction of queries captured
+    SAMPLE_RATE = float(os.getenv("QUERY_CAPTURE_SAMPLE", 1.0))
+
+    SALT = os.getenv("QUERY_CAPTURE_SALT", "")
+
+    # Records buffered in memory before new ones are dropped
+    MAX_PENDING = 10000
+    FLUSH_INTERVAL = 1.0
+
+    _WORD = re.compile(r"[A-Za-z]+")
+
+    # String literals kept as they are: dates, times and numbers
+    _KEPT_LITERAL = re.compile(
+        r"\d{4}(-\d{2}(-\d{2})?)?([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?|\d{2}:\d{2}(:\d{2})?|[-+]?\d+(\.\d+)?"
+    )
+
+    # SQLite date functions, whose string arguments are dates, formats and modifiers
+    DATE_FUNCTIONS = {"date", "time", "datetime", "julianday", "unixepoch", "strftime", "timediff"}
+
+    def __init__(self, path: str = None, sample_rate: float = None, salt: str = None):
+        """
+        Args:
+            path: JSON lines file to append to; empty disables capture
+            sample_rate: Fraction of queries captured
+            salt: Secret mixed into the pseudo-word hashes
+        """
+        self.path = path if path is not None else self.PATH
+        self.sample_rate = sample_rate if sample_rate is not None else self.SAMPLE_RATE
+        self._salt = (salt if salt is not None else self.SALT).encode("utf-8")
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=self.MAX_PENDING)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._tables_seen = set()
+        self.dropped = 0
+        if self.enabled and not self._salt:
+            self._salt = self._shared_salt()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _shared_salt(self) -> bytes:
+        """Salt stored beside the capture file, created by whichever worker gets there first"""
+        salt_path = f"{self.path}.salt"
+        os.makedirs(os.path.dirname(os.path.abspath(salt_path)), exist_ok=True)
+        if not os.path.exists(salt_path):
+            partial = f"{salt_path}.{os.getpid()}"
+            with open(partial, "w") as f:
+                f.write(secrets.token_hex(16))
+            try:
+                os.link(partial, salt_path)  # Fails if another worker linked its salt first
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(partial)
+        with open(salt_path) as f:
+            return f.read().strip().encode("utf-8")
+
+    def pseudo_word(self, word: str) -> str:
+        """Stable stand-in for a word: lowercase letters of the same length"""
+        digest = hashlib.blake2b(word.encode("utf-8"), key=self._salt[:64], digest_size=32).digest()
+        return "".join(chr(ord("a") + byte % 26) for byte in digest[:max(len(word), 3)])
+
+    def anonymize_question(self, question: str, schema: Dict[str, Any]) -> str:
+        """
+        Replace the words of a question that are neither filler nor column names
+
+        Args:
+            question: Natural language question
+            schema: Table schema, whose column names are kept
+
+        Returns:
+            Question with the same punctuation, numbers and word boundaries
+        """
+        kept = set(QuestionCache.STOPWORDS)
+        for column in schema.get("columns", []):
+            kept.update(part for part in column["name"].lower().split("_") if part)
+
+        def replace(match: re.Match) -> str:
+            word = match.group().lower()
+            return word if word in kept else self.pseudo_word(word)
+
+        return self._WORD.sub(replace, question)
+
+    def anonymize_sql(self, sql: str) -> str:
+        """
+        Replace the text of free-text string literals and drop comments
+
+        Literals that are dates, times or numbers, and every literal passed
+        to a date function (formats such as '%Y-%m' and modifiers such as
+        'start of month'), are kept, so date filters select the same range
+        on replay. LIKE wildcards are kept too, so patterns still match the
+        pseudo-words of the values they matched before.
+        """
+        parts = []
+        for token, free_text in self._literals(sql):
+            if not free_text:
+                parts.append(token.value)
+                continue
+            text = token.value[1:-1] if token.value.endswith("'") and len(token.value) > 1 else token.value[1:]
+            pieces = re.split(r"([%_\s]+)", text.replace("''", "'"))
+            text = "".join(
+                piece if not piece or re.fullmatch(r"[%_\s]+", piece) else self.pseudo_word(piece)
+                for piece in pieces
+            )
+            parts.append(f"'{text}'")
+        return "".join(parts)
+
+    @classmethod
+    def free_text_literals(cls, sql: str) -> List[str]:
+        """Contents of the string literals anonymize_sql replaces"""
+        return [token.value.strip("'") for token, free_text in cls._literals(sql) if free_text]
+
+    @classmethod
+    def _literals(cls, sql: str) -> Iterator[Tuple[Token, bool]]:
+        """Tokens other than comments, each with whether it is a free-text string literal"""
+        calls = []  # Function name, or None, for each open parenthesis
+        previous = None
+        for token in tokenize(sql, keep_whitespace=True):
+            if token.kind == "comment":
+                continue
+            if token.kind == "punctuation" and token.value == "(":
+                calls.append(previous.value.lower() if previous and previous.kind == "word" else None)
+            elif token.kind == "punctuation" and token.value == ")" and calls:
+                calls.pop()
+            if token.kind != "whitespace":
+                previous = token
+            free_text = (
+                token.kind == "string"
+                and not (calls and calls[-1] in cls.DATE_FUNCTIONS)
+                and token.value.strip("'") != ""
+                and not cls._KEPT_LITERAL.fullmatch(token.value.strip("'"))
+            )
+            yield token, free_text
+
+    def record(
+        self,
+        question: str,
+        table_name: str,
+        schema: Dict[str, Any],
+        table_rows: int,
+        mode: str,
+        result_format: str,
+        sql_query: str,
+        cache: str,
+        status: int,
+        row_count: int,
+        stages: Dict[str, float],
+        total_seconds: float
+    ):
+        """
+        Queue a query for the capture file (never blocks)
+
+        Args:
+            question: Natural language question
+            table_name: Target table
+            schema: Table schema (as returned by get_table_schema)
+            table_rows: Rows in the table
+            mode: Requested mode, "auto", "exact" or "approximate"
+            result_format: Negotiated result format
+            sql_query: SQL from the LLM or the question cache
+            cache: Question cache outcome, "hit" or "miss"
+            status: HTTP status of the response
+            row_count: Rows returned
+            stages: Stage name -> duration in seconds
+            total_seconds: Time from arrival to this record
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return
+        self._ensure_writer()
+        now = time.time()
+
+        # Generated date parts are rebuilt from their source column on upload
+        derived = {
+            name for parts in schema.get("date_columns", {}).values() for name in parts.values()
+        }
+        columns = [column for column in schema.get("columns", []) if column["name"] not in derived]
+        table_key = (table_name, table_rows, tuple((column["name"], column["type"]) for column in columns))
+        if table_key not in self._tables_seen:
+            self._tables_seen.add(table_key)
+            self._enqueue({
+                "type": "table",
+                "ts": round(now, 3),
+                "table_name": table_name,
+                "row_count": table_rows,
+                "columns": columns
+            })
+
+        self._enqueue({
+            "type": "query",
+            "ts": round(now - total_seconds, 3),
+            "table_name": table_name,
+            "question": self.anonymize_question(question, schema),
+            "mode": mode,
+            "format": result_format,
+            "sql": self.anonymize_sql(sql_query),
+            "cache": cache,
+            "status": status,
+            "row_count": row_count,
+            "total_ms": round(total_seconds * 1000, 3),
+            "stages": {name: round(seconds * 1000, 3) for name, seconds in stages.items()}
+        })
+
+    def _enqueue(self, entry: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        """Start the background writer on first use"""
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="traffic-capture-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        """Append queued records until a None sentinel arrives"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # O_APPEND keeps each write whole when several workers share the file
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        running = True
+
+        while running:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.FLUSH_INTERVAL))
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            entries = [entry for entry in batch if entry is not None]
+            running = len(entries) == len(batch)
+
+            if entries:
+                try:
+                    os.write(fd, "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8"))
+                except OSError:
+                    self.dropped += len(entries)
+
+            for _ in batch:
+                self._queue.task_done()
+
+        os.close(fd)
+
+    def flush(self):
+        """Block until every queued record has been written"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write pending records and stop the background writer"""
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join(timeout=10)
+        self._writer = None
@@ -0,0 +1,90 @@
+import os
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover the threads of one process
+    fcntl = None
+
+# Worker processes serving the app (uvicorn --workers and gunicorn both read WEB_CONCURRENCY)
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+
+
+def per_worker(total: int, minimum: int = 1) -> int:
+    """
+    One worker's share of a limit meant for the whole machine
+
+    Args:
+        total: Limit across all worker processes
+        minimum: Smallest share a worker gets
+
+    Returns:
+        total divided by WORKERS, rounded up, and at least minimum
+    """
+    return max(minimum, -(-total // WORKERS))
+
+
+class FileLock:
+    """
+    Exclusive lock held across threads and worker processes
+
+    Threads of one process queue on a threading.Lock; the thread holding it
+    then takes an flock on the lock file, which excludes other processes.
+    The kernel releases the flock if the process dies, so a crashed worker
+    never leaves a table or the catalog locked. Lock files are never
+    deleted: a process waiting on the old file would not exclude one
+    locking a new file at the same path.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Lock file, created on first use
+        """
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Take the lock
+
+        Args:
+            blocking: Wait for the lock; False returns at once if it is held
+
+        Returns:
+            True if the lock was taken
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        fd = None
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BaseException as e:
+            if fd is not None:
+                os.close(fd)
+            self._thread_lock.release()
+            if isinstance(e, BlockingIOError):
+                return False  # Held by another process
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        """Release the lock"""
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,157 @@
+"""
+Parity and latency benchmark: SQLite vs. the columnar engine
+
+Loads a wide synthetic table (text, integers, floats with NULLs, a date
+column), waits for its DuckDB copy, then runs a shared corpus of query
+shapes on both engines. Every result is compared row by row (floats with a
+relative tolerance, since the engines sum in different orders) and the
+timings are printed next to each other. Queries translate() keeps on SQLite
+are listed as such.
+
+Usage:
+    python benchmarks/bench_engines.py [--rows N] [--repeat N] [--check]
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("COLUMNAR_ENGINE", "all")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.database import DatabaseService  # noqa: E402
+from services.engines import COLUMNAR, SQLITE  # noqa: E402
+
+CORPUS = [
+    ("count", "SELECT COUNT(*) FROM sales"),
+    ("sum by region", "SELECT region, SUM(amount) FROM sales GROUP BY region"),
+    ("avg by two keys", "SELECT region, channel, AVG(amount), COUNT(discount) FROM sales GROUP BY region, channel"),
+    ("min/max", "SELECT MIN(amount), MAX(amount), MIN(product), MAX(order_date) FROM sales"),
+    (
+        "having",
+        "SELECT product, SUM(quantity) AS units FROM sales GROUP BY product HAVING SUM(quantity) > 1000",
+    ),
+    (
+        "top products",
+        "SELECT product, ROUND(SUM(amount), 2) AS revenue FROM sales GROUP BY product ORDER BY revenue DESC LIMIT 10",
+    ),
+    ("like", "SELECT COUNT(*) FROM sales WHERE product LIKE '%widget 1%'"),
+    ("nulls", "SELECT discount, COUNT(*) FROM sales GROUP BY discount ORDER BY discount LIMIT 20"),
+    ("by year", "SELECT order_date_year, SUM(amount) FROM sales GROUP BY order_date_year"),
+    (
+        "filtered group",
+        "SELECT channel, COUNT(*), AVG(quantity) FROM sales WHERE amount > 100 AND region IN ('north', 'east') "
+        "GROUP BY channel",
+    ),
+    ("distinct", "SELECT DISTINCT region FROM sales ORDER BY region"),
+    ("case", "SELECT SUM(CASE WHEN channel = 'online' THEN amount ELSE 0 END) FROM sales"),
+    ("subquery", "SELECT COUNT(*) FROM sales WHERE amount > (SELECT AVG(amount) FROM sales)"),
+    ("order by", "SELECT order_id, amount FROM sales ORDER BY amount DESC, order_id LIMIT 25"),
+    ("group by limit", "SELECT customer_id, COUNT(*) FROM sales GROUP BY customer_id LIMIT 50"),
+    # Kept on SQLite by translate()
+    ("lookup", "SELECT * FROM sales WHERE order_id = 42"),
+    ("integer division", "SELECT SUM(quantity) / 7 FROM sales"),
+]
+
+
+def make_table(rows):
+    rng = np.random.default_rng(7)
+    discount = rng.choice([0.05, 0.1, 0.15, 0.2], rows)
+    discount[rng.random(rows) < 0.3] = np.nan
+    frame = pd.DataFrame({
+        "order_id": np.arange(rows),
+        "order_date": pd.Timestamp("2019-01-01") + pd.to_timedelta(rng.integers(0, 5 * 365, rows), unit="D"),
+        "region": rng.choice(["north", "south", "east", "west", "central"], rows),
+        "channel": rng.choice(["online", "retail", "partner"], rows),
+        "product": rng.choice([f"Widget {i}" for i in range(300)], rows),
+        "customer_id": rng.integers(0, rows // 10, rows),
+        "quantity": rng.integers(1, 20, rows),
+        "amount": rng.lognormal(4, 0.8, rows).round(2),
+        "discount": discount,
+    })
+    # Padding columns: the row store reads them on every scan, the column store does not
+    for i in range(12):
+        frame[f"note_{i}"] = rng.choice(["pending review", "approved", "returned to sender"], rows)
+    return frame
+
+
+def same(left, right):
+    if isinstance(left, float) or isinstance(right, float):
+        if left is None or right is None:
+            return left is right
+        return math.isclose(left, right, rel_tol=1e-9, abs_tol=1e-9)
+    return left == right
+
+
+def matches(sqlite_result, columnar_result):
+    if list(sqlite_result.columns) != list(columnar_result.columns):
+        return False
+    if len(sqlite_result.rows) != len(columnar_result.rows):
+        return False
+    return all(
+        len(left) == len(right) and all(same(a, b) for a, b in zip(left, right))
+        for left, right in zip(sqlite_result.rows, columnar_result.rows)
+    )
+
+
+def timed(db, sql, engine, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = db.execute_query(sql, table_name="sales", engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query; the best time is reported")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if any result differs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        db = DatabaseService(db_dir=db_dir)
+        db.hot_tables.enabled = False  # Compare the engines, not the tier the table is in
+        if not db.columnar.enabled:
+            sys.exit("The columnar engine is unavailable (install duckdb, and do not set COLUMNAR_ENGINE=off)")
+        db.create_table_from_dataframe(make_table(args.rows), "sales")
+
+        start = time.perf_counter()
+        if not db.columnar.build("sales"):
+            sys.exit("Building the columnar copy failed")
+        print(f"{args.rows:,} rows, columnar copy built in {time.perf_counter() - start:.1f}s, "
+              f"best of {args.repeat}\n")
+
+        mismatches = 0
+        print(f"{'query':<18} {'sqlite':>10} {'columnar':>10} {'speedup':>8}   result")
+        for name, sql in CORPUS:
+            sqlite_result, sqlite_seconds = timed(db, sql, SQLITE, args.repeat)
+            translated = db.columnar.translate(sql, "sales")
+            if translated is None:
+                print(f"{name:<18} {sqlite_seconds * 1000:>8.1f}ms {'-':>10} {'':>8}   stays on SQLite")
+                continue
+            columnar_result, columnar_seconds = timed(db, translated, COLUMNAR, args.repeat)
+            same_result = matches(sqlite_result, columnar_result)
+            mismatches += not same_result
+            print(
+                f"{name:<18} {sqlite_seconds * 1000:>8.1f}ms {columnar_seconds * 1000:>8.1f}ms"
+                f" {sqlite_seconds / columnar_seconds:>7.2f}x   "
+                f"{'same' if same_result else 'DIFFERENT'} ({len(sqlite_result.rows)} rows)"
+            )
+            if not same_result:
+                print(f"    sqlite:   {sqlite_result.columns} {sqlite_result.rows[:3]}")
+                print(f"    columnar: {columnar_result.columns} {columnar_result.rows[:3]}")
+
+        print(f"\n{mismatches} of {len(CORPUS)} queries differ")
+        if args.check and mismatches:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
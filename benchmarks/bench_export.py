@@ -0,0 +1,135 @@
+"""
+Throughput benchmark: download export formats
+
+Loads a synthetic table, then encodes SELECT * through each /api/download
+format from DatabaseService.iter_query batches and reads the file back with
+the usual downstream reader. The original download paths (rows -> dicts ->
+DataFrame -> to_csv / to_excel) are included for comparison.
+
+Usage:
+    python benchmarks/bench_export.py [--rows N] [--excel-rows N]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.database import DatabaseService  # noqa: E402
+from services.export_formats import EXPORT_FORMATS, HAS_PYARROW  # noqa: E402
+
+BATCH_SIZE = 10000
+
+
+def make_table(rows):
+    rng = np.random.default_rng(42)
+    return pd.DataFrame({
+        "order_id": np.arange(rows),
+        "region": rng.choice(["north", "south", "east", "west"], rows),
+        "product": rng.choice([f"product_{i}" for i in range(200)], rows),
+        "quantity": rng.integers(1, 50, rows),
+        "amount": rng.normal(250, 80, rows).round(2),
+        "order_date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D"),
+    })
+
+
+def legacy_records(db, sql):
+    """Row dicts as DatabaseService.execute_query returned them originally"""
+    results = db.execute_query(sql)
+    return [dict(zip(results.columns, row)) for row in results.rows]
+
+
+def legacy_csv(db, sql):
+    output = io.StringIO()
+    pd.DataFrame(legacy_records(db, sql)).to_csv(output, index=False, chunksize=1000)
+    return output.getvalue().encode("utf-8")
+
+
+def legacy_excel(db, sql):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        pd.DataFrame(legacy_records(db, sql)).to_excel(writer, index=False, sheet_name="Results")
+    return output.getvalue()
+
+
+def encode(db, sql, export_format):
+    batches = db.iter_query(sql, batch_size=BATCH_SIZE)
+    columns, first = next(batches)
+
+    def all_batches():
+        yield first
+        for _, rows in batches:
+            yield rows
+
+    return b"".join(export_format.encode(columns, all_batches()))
+
+
+def read_arrow(data):
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(data).read_all()
+
+
+READERS = {
+    "csv": lambda data: pd.read_csv(io.BytesIO(data)),
+    "excel": lambda data: pd.read_excel(io.BytesIO(data)),
+    "ndjson": lambda data: pd.read_json(io.BytesIO(data), lines=True),
+    "parquet": lambda data: pd.read_parquet(io.BytesIO(data)),
+    "arrow": read_arrow,
+}
+
+
+def report(label, rows, write_seconds, data, read_seconds):
+    print(
+        f"{label:<18} {rows / write_seconds:>12,.0f} rows/s  {len(data) / 1e6:>8.2f} MB"
+        f"  write {write_seconds:>7.3f}s  read {read_seconds:>7.3f}s"
+    )
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--excel-rows", type=int, default=20_000, help="Excel is slow; benchmark it on fewer rows")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        db = DatabaseService(db_dir=db_dir)
+        db.create_table_from_dataframe(make_table(args.rows), "orders")
+
+        sql = "SELECT * FROM orders"
+        excel_sql = f"SELECT * FROM orders LIMIT {args.excel_rows}"
+
+        print(f"{args.rows:,} rows ({args.excel_rows:,} for Excel), batch size {BATCH_SIZE:,}\n")
+
+        data, seconds = timed(lambda: legacy_csv(db, sql))
+        _, read_seconds = timed(lambda: READERS["csv"](data))
+        report("csv (legacy)", args.rows, seconds, data, read_seconds)
+
+        data, seconds = timed(lambda: legacy_excel(db, excel_sql))
+        _, read_seconds = timed(lambda: READERS["excel"](data))
+        report("excel (legacy)", args.excel_rows, seconds, data, read_seconds)
+
+        for name, export_format in EXPORT_FORMATS.items():
+            if export_format.requires_pyarrow and not HAS_PYARROW:
+                print(f"{name:<18} skipped (pyarrow not installed)")
+                continue
+            rows = args.excel_rows if name == "excel" else args.rows
+            data, seconds = timed(lambda: encode(db, excel_sql if name == "excel" else sql, export_format))
+            _, read_seconds = timed(lambda: READERS[name](data))
+            report(name, rows, seconds, data, read_seconds)
+
+
+if __name__ == "__main__":
+    main()
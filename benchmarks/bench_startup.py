@@ -0,0 +1,116 @@
+"""
+Cold start benchmark: API import time per module and lifespan startup
+
+Starts fresh interpreters that import backend/main.py with -X importtime,
+run the app's lifespan hook and answer /health, and reports the median
+time of each phase plus the slowest modules by cumulative import time.
+
+Fails (exit status 1) when importing the app exceeds --budget-ms, or when
+any of the heavy dependencies that are deferred to first use (pandas,
+numpy, openai, ...) is imported at startup.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs N] [--budget-ms MS] [--top N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+# Loaded on first upload, query, export or columnar copy, never at startup
+DEFERRED = ("pandas", "numpy", "openai", "openpyxl", "pyarrow", "duckdb", "sqlparse")
+
+PROBE = f"""
+import sys, time
+sys.path.insert(0, {os.path.abspath(BACKEND_DIR)!r})
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+loaded = sorted(name for name in {DEFERRED!r} if name in sys.modules)
+ready = time.perf_counter()
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    client.get("/health")
+    answered = time.perf_counter()
+print("PHASES", imported - start, started - ready, answered - started, ",".join(loaded))
+"""
+
+
+def run_probe():
+    """Import the app in a fresh interpreter; returns (phases, {module: cumulative us}, deferred modules loaded)"""
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "benchmark"))
+    with tempfile.TemporaryDirectory() as workdir:
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE],
+            cwd=workdir, env=env, capture_output=True, text=True, check=True
+        )
+
+    # -X importtime prints each module after its own imports, indented two spaces per level
+    pending = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        node = (name.strip(), int(cumulative), pending.pop(depth + 1, []))
+        pending.setdefault(depth, []).append(node)
+
+    # Everything main imports, two levels deep
+    modules = {}
+    app = next(node for node in pending.get(0, []) if node[0] == "main")
+    for name, micros, children in app[2]:
+        modules[name] = micros
+        for child, child_micros, _ in children:
+            modules[f"{name} > {child}"] = child_micros
+
+    fields = next(line for line in completed.stdout.splitlines() if line.startswith("PHASES")).split(" ")
+    phases = {"import": float(fields[1]), "lifespan": float(fields[2]), "first request": float(fields[3])}
+    deferred = [name for name in fields[4].split(",") if name] if len(fields) > 4 else []
+    return phases, modules, deferred
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000, help="Maximum median time to import the app")
+    parser.add_argument("--top", type=int, default=15, help="Modules to list")
+    args = parser.parse_args()
+
+    phases, modules, deferred = [], {}, set()
+    for _ in range(args.runs):
+        run_phases, run_modules, run_deferred = run_probe()
+        phases.append(run_phases)
+        deferred.update(run_deferred)
+        for name, micros in run_modules.items():
+            modules.setdefault(name, []).append(micros)
+
+    print(f"median of {args.runs} cold starts\n")
+    for phase in phases[0]:
+        print(f"{phase:<14} {statistics.median(run[phase] for run in phases) * 1000:>8.1f}ms")
+
+    medians = {name: statistics.median(values) for name, values in modules.items()}
+    print(f"\n{'imported by main':<48} {'cumulative':>10}")
+    for name, micros in sorted(medians.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<48} {micros / 1000:>8.1f}ms")
+
+    failures = []
+    import_ms = statistics.median(run["import"] for run in phases) * 1000
+    if import_ms > args.budget_ms:
+        failures.append(f"importing the app took {import_ms:.0f}ms, budget {args.budget_ms:.0f}ms")
+    if deferred:
+        failures.append(f"imported at startup: {', '.join(sorted(deferred))}")
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,530 @@
+"""
+End-to-end benchmark: upload, query and download through the running API
+
+Generates synthetic sales files (CSV, and Excel up to --excel-max-rows),
+narrow (9 columns) and wide (41 columns), at each --rows size. Starts the
+backend with uvicorn in a scratch directory, pointed at a local
+OpenAI-compatible stub (benchmarks/stub_llm.py) that answers after
+--llm-latency-ms. Then, for each dataset:
+
+- upload: POST /api/upload of the CSV and Excel files
+- query: --queries questions on /api/query at --concurrency, from a fixed
+  workload of aggregates, filters, top-N and a spilled result
+- download: --downloads full-table exports per format on /api/download
+
+Each stage reports throughput, latency percentiles, errors, the server's
+peak RSS while it ran (summed over worker processes) and, for queries, the
+mean of each Server-Timing stage. Results are written as JSON; compare two
+runs with the compare command, which exits with status 1 when a metric got
+worse by more than --threshold percent.
+
+Generated files are cached in --data-dir, so later runs skip generation.
+
+Usage:
+    python benchmarks/bench_suite.py run [--rows 10000,100000] [--shapes narrow,wide] [--output FILE]
+    python benchmarks/bench_suite.py compare BASELINE.json CANDIDATE.json [--threshold 10]
+"""
+import argparse
+import concurrent.futures
+import datetime
+import http.client
+import json
+import os
+import platform
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_llm import StubLLM  # noqa: E402
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BACKEND_DIR = os.path.join(REPO_DIR, "backend")
+
+# Question -> SQL answered by the stub; {table} is the uploaded table
+WORKLOAD = [
+    ("How many orders are there", "SELECT COUNT(*) AS orders FROM {table}"),
+    ("Total amount by region",
+     "SELECT region, SUM(amount) AS total FROM {table} GROUP BY region ORDER BY total DESC"),
+    ("Average quantity by channel and region",
+     "SELECT channel, region, AVG(quantity) AS avg_quantity FROM {table} GROUP BY channel, region"),
+    ("Top 10 products by revenue",
+     "SELECT product, ROUND(SUM(amount), 2) AS revenue FROM {table} GROUP BY product ORDER BY revenue DESC LIMIT 10"),
+    ("Monthly revenue in 2023",
+     "SELECT order_date_month AS month, SUM(amount) AS revenue FROM {table} "
+     "WHERE order_date_year = 2023 GROUP BY month ORDER BY month"),
+    ("Orders of Widget 12 in the north",
+     "SELECT * FROM {table} WHERE product = 'Widget 12' AND region = 'north' LIMIT 100"),
+    ("The 2000 largest orders", "SELECT * FROM {table} ORDER BY amount DESC LIMIT 2000"),
+    ("Median amount by channel", "SELECT channel, median(amount) AS median_amount FROM {table} GROUP BY channel"),
+    ("Number of distinct customers", "SELECT COUNT(DISTINCT customer_id) AS customers FROM {table}"),
+    ("Discounted partner orders",
+     "SELECT COUNT(*) AS orders, SUM(amount) AS total FROM {table} WHERE discount > 0.1 AND channel = 'partner'"),
+]
+
+DOWNLOAD_FORMATS = ("csv", "parquet", "excel")
+
+# Metric -> True when a larger value is better
+COMPARED = {
+    "throughput": True,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "peak_rss_mb": False,
+}
+
+
+# Datasets
+
+def make_frame(rows: int, shape: str, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    discount = rng.choice([0.05, 0.1, 0.15, 0.2], rows)
+    discount[rng.random(rows) < 0.3] = np.nan
+    frame = pd.DataFrame({
+        "order_id": np.arange(rows),
+        "order_date": (pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 4 * 365, rows), unit="D"))
+        .strftime("%Y-%m-%d"),
+        "region": rng.choice(["north", "south", "east", "west", "central"], rows),
+        "channel": rng.choice(["online", "retail", "partner"], rows),
+        "product": rng.choice([f"Widget {i}" for i in range(300)], rows),
+        "customer_id": rng.integers(0, max(rows // 10, 1), rows),
+        "quantity": rng.integers(1, 20, rows),
+        "amount": rng.lognormal(4, 0.8, rows).round(2),
+        "discount": discount,
+    })
+    if shape == "wide":
+        for i in range(16):
+            frame[f"metric_{i}"] = rng.normal(100, 25, rows).round(3)
+        for i in range(8):
+            frame[f"count_{i}"] = rng.integers(0, 1000, rows)
+        for i in range(8):
+            frame[f"note_{i}"] = rng.choice(["pending review", "approved", "returned to sender", "on hold"], rows)
+    return frame
+
+
+def dataset_file(data_dir: str, rows: int, shape: str, extension: str) -> str:
+    """Path of a generated file, writing it on first use"""
+    path = os.path.join(data_dir, f"{shape}_{rows}.{extension}")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"  generating {os.path.basename(path)}", flush=True)
+        frame = make_frame(rows, shape)
+        partial = os.path.join(data_dir, f".{uuid.uuid4().hex}.{extension}")
+        if extension == "csv":
+            frame.to_csv(partial, index=False)
+        else:
+            frame.to_excel(partial, index=False, engine="openpyxl")
+        os.replace(partial, path)
+    return path
+
+
+# HTTP
+
+class Reply(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    size: int
+    seconds: float
+
+
+def request(port: int, method: str, path: str, payload: Any = None, upload: Optional[str] = None,
+            keep_body: bool = True, timeout: float = 3600) -> Reply:
+    """One HTTP request on a new connection; the body is only kept when keep_body is set"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    start = time.perf_counter()
+    try:
+        if upload is not None:
+            boundary = uuid.uuid4().hex
+            head = (
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; "
+                f"filename=\"{os.path.basename(upload)}\"\r\nContent-Type: application/octet-stream\r\n\r\n"
+            ).encode()
+            tail = f"\r\n--{boundary}--\r\n".encode()
+            conn.putrequest(method, path)
+            conn.putheader("Content-Type", f"multipart/form-data; boundary={boundary}")
+            conn.putheader("Content-Length", str(len(head) + os.path.getsize(upload) + len(tail)))
+            conn.endheaders()
+            conn.send(head)
+            with open(upload, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    conn.send(block)
+            conn.send(tail)
+        else:
+            body = json.dumps(payload).encode() if payload is not None else None
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"} if body else {})
+        response = conn.getresponse()
+        chunks, size = [], 0
+        for block in iter(lambda: response.read(1 << 16), b""):
+            size += len(block)
+            if keep_body:
+                chunks.append(block)
+        return Reply(response.status, dict(response.getheaders()), b"".join(chunks), size,
+                     time.perf_counter() - start)
+    finally:
+        conn.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Server
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _descendants(pid: int) -> List[int]:
+    """pid and every process below it, from /proc"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields after it are fixed
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+    found, frontier = [pid], [pid]
+    while frontier:
+        frontier = [child for child, parent in parents.items() if parent in frontier]
+        found += frontier
+    return found
+
+
+class RssSampler(threading.Thread):
+    """Samples the summed RSS of a process tree; peak() is the largest since reset()"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.available = os.path.exists(f"/proc/{pid}/statm")
+        self._peak = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def sample(self) -> int:
+        return sum(_rss_bytes(pid) for pid in _descendants(self.pid))
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            rss = self.sample()
+            with self._lock:
+                self._peak = max(self._peak, rss)
+
+    def reset(self):
+        rss = self.sample() if self.available else 0
+        with self._lock:
+            self._peak = rss
+
+    def peak(self) -> Optional[float]:
+        """Peak RSS in MB, None where /proc is unavailable"""
+        if not self.available:
+            return None
+        with self._lock:
+            return round(max(self._peak, self.sample()) / (1024 * 1024), 1)
+
+    def stop(self):
+        self._stop.set()
+
+
+class Server:
+    """The backend under uvicorn, in a scratch working directory so every run starts empty"""
+
+    def __init__(self, base_url: str, workers: int, extra_env: Dict[str, str]):
+        self.workdir = tempfile.mkdtemp(prefix="analytics_gpt_bench_")
+        os.makedirs(os.path.join(self.workdir, "backend", "uploads"))
+        self.port = free_port()
+        env = dict(os.environ, OPENAI_API_KEY="benchmark", OPENAI_BASE_URL=base_url, WEB_CONCURRENCY=str(workers))
+        env.update(extra_env)
+        self.log = open(os.path.join(self.workdir, "server.log"), "wb")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.abspath(BACKEND_DIR),
+             "--port", str(self.port), "--workers", str(workers), "--log-level", "warning"],
+            cwd=self.workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if request(self.port, "GET", "/health", timeout=1).status == 200:
+                    break
+            except OSError:
+                pass
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                sys.exit(f"The server did not start; see {self.log.name}")
+            time.sleep(0.2)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+# Stages
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _server_timing(header: str) -> Dict[str, float]:
+    stages = {}
+    for part in header.split(","):
+        match = re.match(r"\s*([\w-]+);dur=([\d.]+)", part)
+        if match:
+            stages[match.group(1)] = stages.get(match.group(1), 0.0) + float(match.group(2))
+    return stages
+
+
+def run_stage(name: str, calls: List[Callable[[], Reply]], concurrency: int, sampler: RssSampler,
+              rows: int = 0) -> Dict[str, Any]:
+    """Run calls at the given concurrency and summarize them"""
+    sampler.reset()
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        replies = list(pool.map(lambda call: call(), calls))
+    return summarize(name, replies, time.perf_counter() - start, sampler, rows)
+
+
+def summarize(name: str, replies: List[Reply], seconds: float, sampler: RssSampler, rows: int = 0) -> Dict[str, Any]:
+    """Report row for replies received over seconds, printed as one line"""
+    latencies = sorted(reply.seconds * 1000 for reply in replies)
+    errors = [reply for reply in replies if reply.status >= 400]
+    timings: Dict[str, List[float]] = {}
+    for reply in replies:
+        for stage, ms in _server_timing(reply.headers.get("server-timing", "")).items():
+            timings.setdefault(stage, []).append(ms)
+    result = {
+        "name": name,
+        "requests": len(replies),
+        "errors": len(errors),
+        "seconds": round(seconds, 3),
+        "throughput": round(len(replies) / seconds, 3),  # Requests per second
+        "bytes_per_second": round(sum(reply.size for reply in replies) / seconds),
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 2),
+            "p50": round(percentile(latencies, 0.5), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(latencies[-1], 2),
+        },
+        "peak_rss_mb": sampler.peak(),
+        "server_timing_ms": {stage: round(statistics.fmean(values), 2) for stage, values in sorted(timings.items())},
+    }
+    if rows:
+        result["rows_per_second"] = round(rows * len(replies) / seconds)
+    if errors:
+        result["first_error"] = f"{errors[0].status} {errors[0].body[:300].decode(errors='replace')}"
+    print(
+        f"  {name:<34} {result['throughput']:>8.2f}/s  p50 {result['latency_ms']['p50']:>9.1f}ms  "
+        f"p99 {result['latency_ms']['p99']:>9.1f}ms  rss {result['peak_rss_mb'] or 0:>7.1f}MB"
+        + (f"  {len(errors)} errors" if errors else ""),
+        flush=True
+    )
+    return result
+
+
+def benchmark_dataset(args, port: int, sampler: RssSampler, rows: int, shape: str) -> List[Dict[str, Any]]:
+    dataset = f"{shape}_{rows}"
+    results = []
+    extensions = ["csv"] + (["xlsx"] if "xlsx" in args.formats and rows <= args.excel_max_rows else [])
+    tables = []
+
+    def upload(path: str) -> Reply:
+        reply = request(port, "POST", "/api/upload", upload=path)
+        if reply.status == 200:
+            tables.append(json.loads(reply.body)["table_name"])
+        return reply
+
+    for extension in extensions:
+        path = dataset_file(args.data_dir, rows, shape, extension)
+        result = run_stage(f"{dataset}/upload/{extension}", [lambda: upload(path)] * args.upload_repeat, 1, sampler, rows)
+        result["file_mb"] = round(os.path.getsize(path) / (1024 * 1024), 2)
+        results.append(result)
+    if not tables:
+        print(f"  {dataset}: upload failed, skipping queries and downloads")
+        return results
+    table_name = tables[0]
+
+    questions = [WORKLOAD[i % len(WORKLOAD)][0] for i in range(args.queries)]
+    if not args.repeat_questions:
+        # Distinct numbers keep near-duplicate questions out of the question cache
+        questions = [f"{question} (request {i})" for i, question in enumerate(questions)]
+    queries = [
+        lambda question=question: request(port, "POST", "/api/query", {"question": question, "table_name": table_name})
+        for question in questions
+    ]
+    results.append(run_stage(f"{dataset}/query", queries, args.concurrency, sampler))
+
+    for export_format in args.download_formats:
+        if export_format == "excel" and rows > args.excel_max_rows:
+            continue
+        payload = {"sql_query": f"SELECT * FROM {table_name}", "table_name": table_name, "format": export_format}
+        downloads = [lambda: request(port, "POST", "/api/download", payload, keep_body=False)] * args.downloads
+        results.append(run_stage(f"{dataset}/download/{export_format}", downloads, args.concurrency, sampler, rows))
+    return results
+
+
+def run(args):
+    responses = {}
+    for i in range(args.queries):
+        question, sql = WORKLOAD[i % len(WORKLOAD)]
+        responses[question if args.repeat_questions else f"{question} (request {i})"] = sql
+    stub = StubLLM(responses, latency=args.llm_latency_ms / 1000, jitter=args.llm_jitter_ms / 1000).start()
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    server = Server(stub.base_url, args.workers, extra_env)
+    sampler = RssSampler(server.process.pid)
+    sampler.start()
+    print(f"server on port {server.port}, {args.workers} worker(s), stub LLM at {args.llm_latency_ms:.0f}ms\n")
+
+    results = []
+    try:
+        for rows in args.rows:
+            for shape in args.shapes:
+                results += benchmark_dataset(args, server.port, sampler, rows, shape)
+    finally:
+        sampler.stop()
+        server.stop()
+        stub.shutdown()
+        if not args.keep:
+            shutil.rmtree(server.workdir, ignore_errors=True)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "options": {key: value for key, value in vars(args).items() if key not in ("func", "data_dir", "output")},
+            "llm_completions": stub.requests,
+            "llm_unmatched": stub.unmatched,
+        },
+        "results": results,
+    }
+    output = args.output or f"bench-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n{len(results)} stages written to {output}")
+    if any(result["errors"] for result in results):
+        sys.exit(1)
+
+
+# Comparison
+
+def _metric(result: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = result
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+    with open(args.candidate) as f:
+        candidate = {result["name"]: result for result in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"{'stage':<34} {'metric':<15} {'baseline':>11} {'candidate':>11} {'change':>8}")
+    for name, after in candidate.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<34} (not in baseline)")
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = _metric(before, metric), _metric(after, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > args.threshold else ""
+            regressions += bool(flag)
+            print(f"{name:<34} {metric:<15} {old:>11.2f} {new:>11.2f} {change:>+7.1f}%{flag}")
+    for name in sorted(baseline.keys() - candidate.keys()):
+        print(f"{name:<34} (not in candidate)")
+
+    print(f"\n{regressions} metric(s) worse by more than {args.threshold:g}%")
+    if regressions:
+        sys.exit(1)
+
+
+def _csv_list(cast=str):
+    return lambda value: [cast(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark and write a JSON report")
+    run_parser.add_argument("--rows", type=_csv_list(int), default=[10_000, 100_000],
+                            help="Dataset sizes, e.g. 10000,1000000,10000000")
+    run_parser.add_argument("--shapes", type=_csv_list(), default=["narrow", "wide"])
+    run_parser.add_argument("--formats", type=_csv_list(), default=["csv", "xlsx"], help="Upload file formats")
+    run_parser.add_argument("--excel-max-rows", type=int, default=100_000,
+                            help="Largest dataset uploaded and downloaded as Excel")
+    run_parser.add_argument("--upload-repeat", type=int, default=1, help="Uploads of each file")
+    run_parser.add_argument("--queries", type=int, default=40, help="Questions per dataset")
+    run_parser.add_argument("--repeat-questions", action="store_true",
+                            help="Ask the workload's questions verbatim, so repeats hit the question cache")
+    run_parser.add_argument("--downloads", type=int, default=4, help="Downloads per dataset and format")
+    run_parser.add_argument("--download-formats", type=_csv_list(), default=list(DOWNLOAD_FORMATS))
+    run_parser.add_argument("--concurrency", type=int, default=4, help="Concurrent queries and downloads")
+    run_parser.add_argument("--workers", type=int, default=1, help="Server worker processes")
+    run_parser.add_argument("--llm-latency-ms", type=float, default=300)
+    run_parser.add_argument("--llm-jitter-ms", type=float, default=50)
+    run_parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                            help="Server setting, e.g. --env COLUMNAR_ENGINE=off (repeatable)")
+    run_parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "analytics_gpt_bench_data"),
+                            help="Cache of generated files")
+    run_parser.add_argument("--keep", action="store_true", help="Keep the server's scratch directory and log")
+    run_parser.add_argument("--output", help="Report path (default bench-<timestamp>.json)")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=10, help="Percent change reported as a regression")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
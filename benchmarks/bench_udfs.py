@@ -0,0 +1,146 @@
+"""
+Latency benchmark: statistical UDFs vs. their SQL emulations
+
+Loads a synthetic table, then runs each function registered by
+services.sql_functions next to the plain-SQLite query an LLM writes when the
+function does not exist (ORDER BY ... LIMIT 1 OFFSET count/2, ROW_NUMBER
+windows, sum-of-squares formulas). Both results are printed, so differences
+in the answer (e.g. the precision lost by avg(x*x) - avg(x)*avg(x)) show up
+next to the timings.
+
+Usage:
+    python benchmarks/bench_udfs.py [--rows N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.database import DatabaseService  # noqa: E402
+
+CASES = [
+    (
+        "median",
+        "SELECT median(amount) FROM orders",
+        "SELECT amount FROM orders ORDER BY amount LIMIT 1 OFFSET (SELECT COUNT(*) FROM orders) / 2",
+    ),
+    (
+        "median by region",
+        "SELECT region, median(amount) FROM orders GROUP BY region",
+        """
+        SELECT region, AVG(amount) FROM (
+            SELECT region, amount,
+                   ROW_NUMBER() OVER (PARTITION BY region ORDER BY amount) AS rn,
+                   COUNT(*) OVER (PARTITION BY region) AS cnt
+            FROM orders
+        ) WHERE rn IN ((cnt + 1) / 2, (cnt + 2) / 2) GROUP BY region
+        """,
+    ),
+    (
+        "p90",
+        "SELECT percentile_cont(amount, 0.9) FROM orders",
+        "SELECT amount FROM orders ORDER BY amount LIMIT 1 OFFSET (SELECT COUNT(*) * 9 / 10 FROM orders)",
+    ),
+    (
+        "stddev",
+        "SELECT stddev(balance) FROM orders",
+        """
+        SELECT SQRT((SUM(balance * balance) - SUM(balance) * SUM(balance) / COUNT(balance))
+                    / (COUNT(balance) - 1)) FROM orders
+        """,
+    ),
+    (
+        "corr",
+        "SELECT corr(amount, quantity) FROM orders",
+        """
+        SELECT (AVG(amount * quantity) - AVG(amount) * AVG(quantity))
+               / SQRT((AVG(amount * amount) - AVG(amount) * AVG(amount))
+                      * (AVG(quantity * quantity) - AVG(quantity) * AVG(quantity))) FROM orders
+        """,
+    ),
+    (
+        "mode",
+        "SELECT mode(product) FROM orders",
+        "SELECT product FROM orders GROUP BY product ORDER BY COUNT(*) DESC, product LIMIT 1",
+    ),
+    (
+        "distinct customers",
+        "SELECT approx_count_distinct(customer_id) FROM orders",
+        "SELECT COUNT(DISTINCT customer_id) FROM orders",
+    ),
+    (
+        "moving stddev (7)",
+        """
+        SELECT MAX(s) FROM (
+            SELECT stddev(amount) OVER (ORDER BY order_id ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS s
+            FROM orders
+        )
+        """,
+        """
+        SELECT MAX(s) FROM (
+            SELECT SQRT(AVG(amount * amount) OVER w - AVG(amount) OVER w * AVG(amount) OVER w) * SQRT(7.0 / 6) AS s
+            FROM orders WINDOW w AS (ORDER BY order_id ROWS BETWEEN 6 PRECEDING AND CURRENT ROW)
+        )
+        """,
+    ),
+]
+
+
+def make_table(rows):
+    rng = np.random.default_rng(42)
+    return pd.DataFrame({
+        "order_id": np.arange(rows),
+        "region": rng.choice(["north", "south", "east", "west", "central", "online"], rows),
+        "product": rng.choice([f"product_{i}" for i in range(500)], rows, p=np.full(500, 1 / 500)),
+        "customer_id": rng.integers(0, rows // 4, rows),
+        "quantity": rng.integers(1, 50, rows),
+        "amount": rng.lognormal(5, 0.6, rows).round(2),
+        "balance": rng.normal(1e9, 25, rows).round(2),  # Large values, small spread
+    })
+
+
+def timed(db, sql, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = db.execute_query(sql, table_name="orders").rows
+        best = min(best, time.perf_counter() - start)
+    return rows, best
+
+
+def short(rows):
+    first = rows[0][-1] if rows else None
+    text = f"{first:.6g}" if isinstance(first, float) else str(first)
+    return text if len(rows) == 1 else f"{text} (+{len(rows) - 1} rows)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query; the best time is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        db = DatabaseService(db_dir=db_dir)
+        db.hot_tables.enabled = False  # Measure the functions, not the tier the table is in
+        db.create_table_from_dataframe(make_table(args.rows), "orders")
+
+        print(f"{args.rows:,} rows, best of {args.repeat}\n")
+        print(f"{'case':<20} {'udf':>10} {'emulation':>10} {'speedup':>8}   udf result / emulation result")
+        for name, udf_sql, emulation_sql in CASES:
+            udf_rows, udf_seconds = timed(db, udf_sql, args.repeat)
+            emulation_rows, emulation_seconds = timed(db, emulation_sql, args.repeat)
+            print(
+                f"{name:<20} {udf_seconds * 1000:>8.1f}ms {emulation_seconds * 1000:>8.1f}ms"
+                f" {emulation_seconds / udf_seconds:>7.2f}x   {short(udf_rows)} / {short(emulation_rows)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Microbenchmark: SQL validation + sanitization on the execution hot path
+
+Compares the original per-keyword regex validator followed by
+sqlparse.format(reindent=True) against QueryExecutor's single-pass
+tokenizer validator, both cold (every query new) and memoized (repeats).
+
+Usage:
+    python benchmarks/bench_validator.py [--iterations N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+import sqlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.query_executor import QueryExecutor  # noqa: E402
+from services.sql_tokenizer import tokenize  # noqa: E402
+
+
+LEGACY_FORBIDDEN_KEYWORDS = [
+    'DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER',
+    'CREATE', 'TRUNCATE', 'REPLACE', 'RENAME',
+    'GRANT', 'REVOKE', 'COMMIT', 'ROLLBACK',
+    'EXEC', 'EXECUTE', 'PRAGMA'
+]
+
+
+def legacy_validate_query(sql, table_name=None):
+    """QueryExecutor.validate_query before the tokenizer rewrite"""
+    if not sql or not sql.strip():
+        return False, "Empty query"
+
+    sql_upper = sql.upper()
+
+    if not sql_upper.strip().startswith('SELECT'):
+        return False, "Only SELECT queries are allowed"
+
+    for keyword in LEGACY_FORBIDDEN_KEYWORDS:
+        pattern = r'\b' + keyword + r'\b'
+        if re.search(pattern, sql_upper):
+            return False, f"Forbidden keyword detected: {keyword}"
+
+    injection_patterns = [
+        r';\s*SELECT',
+        r';\s*DROP',
+        r';\s*DELETE',
+        r'--',
+        r'/\*',
+        r'\bUNION\b.*\bSELECT\b',
+    ]
+
+    for pattern in injection_patterns:
+        if re.search(pattern, sql_upper):
+            return False, "Potentially unsafe SQL pattern detected"
+
+    if table_name:
+        if table_name.upper() not in sql_upper:
+            return False, f"Query must reference table: {table_name}"
+
+    if 'FROM' not in sql_upper:
+        return False, "Invalid SQL: missing FROM clause"
+
+    return True, ""
+
+
+def legacy_sanitize_query(sql):
+    """QueryExecutor.sanitize_query before pretty-printing moved off the hot path"""
+    sql = sql.rstrip(';').strip()
+    try:
+        sql = sqlparse.format(sql, reindent=True, keyword_case='upper')
+    except Exception:
+        pass
+    return sql
+
+
+QUERIES = [
+    "SELECT * FROM sales LIMIT 100",
+    "SELECT region, SUM(amount) AS total FROM sales GROUP BY region ORDER BY total DESC",
+    "SELECT product, COUNT(*) FROM sales WHERE LOWER(category) LIKE '%electronics%' GROUP BY product",
+    "SELECT strftime('%Y-%m', order_date) AS month, AVG(amount) FROM sales "
+    "WHERE order_date >= '2024-01-01' GROUP BY month ORDER BY month",
+    "SELECT customer_id, created_at, amount FROM sales WHERE status = 'updated by admin' "
+    "AND amount > 1000 ORDER BY created_at DESC LIMIT 50",
+]
+
+
+def bench(label, fn, queries, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(queries[i % len(queries)])
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / iterations * 1e6
+    print(f"{label:<42} {per_call:10.1f} us/query")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    def legacy(sql):
+        legacy_validate_query(sql, "sales")
+        legacy_sanitize_query(sql)
+
+    def current_cold(sql):
+        QueryExecutor._check_tokens(tokenize(sql), "sales")
+        QueryExecutor.sanitize_query(sql)
+
+    def current_memoized(sql):
+        QueryExecutor.validate_query(sql, "sales")
+        QueryExecutor.sanitize_query(sql)
+
+    print(f"{len(QUERIES)} distinct queries, {args.iterations} iterations\n")
+    baseline = bench("legacy regex validate + sqlparse format", legacy, QUERIES, args.iterations)
+    cold = bench("tokenizer validate (no memo)", current_cold, QUERIES, args.iterations)
+    warm = bench("tokenizer validate (memoized)", current_memoized, QUERIES, args.iterations)
+
+    print(f"\nspeed-up cold: {baseline / cold:.1f}x, memoized: {baseline / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
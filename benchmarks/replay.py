@@ -0,0 +1,322 @@
+"""
+Replay captured /api/query traffic against a local server
+
+Reads a capture file written with QUERY_CAPTURE_PATH set (see
+TrafficCapture), rebuilds each captured table as a synthetic CSV with the
+recorded columns and row count, starts the backend under uvicorn in a
+scratch directory and replays the queries on their recorded schedule.
+
+The LLM is replaced by benchmarks/stub_llm.py answering each question with
+the SQL recorded for it, after the LLM latency recorded for it (or
+--llm-latency-ms), so the run measures this server and needs no network.
+Text columns are filled with the pseudo-words found in the recorded SQL,
+and date columns span the dates it filters on, so captured filters still
+match some rows.
+
+--speedup 2 sends requests twice as fast as they arrived; --speedup 0 sends
+them back to back. At most --concurrency requests are in flight; requests
+that could not start on time are reported as schedule lag.
+
+The report has the same layout as bench_suite.py, so two replays can be
+compared with:
+
+    python benchmarks/bench_suite.py compare before.json after.json
+
+Usage:
+    python benchmarks/replay.py CAPTURE.jsonl [--speedup 1] [--concurrency 16] [--table NAME=FILE] [--output FILE]
+"""
+import argparse
+import concurrent.futures
+import datetime
+import json
+import math
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from bench_suite import Reply, RssSampler, Server, _server_timing, percentile, request, summarize  # noqa: E402
+from services.sql_tokenizer import identifier_name, tokenize  # noqa: E402
+from services.traffic_capture import TrafficCapture  # noqa: E402
+from stub_llm import StubLLM  # noqa: E402
+
+
+def load_capture(paths: List[str]) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Read capture files
+
+    Returns:
+        Tuple of (table name -> latest table record, query records by arrival time)
+    """
+    tables, queries = {}, []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line still being written
+                if record.get("type") == "table":
+                    if record["table_name"] not in tables or tables[record["table_name"]]["ts"] <= record["ts"]:
+                        tables[record["table_name"]] = record
+                elif record.get("type") == "query":
+                    queries.append(record)
+    queries.sort(key=lambda record: record["ts"])
+    return tables, queries
+
+
+def sql_literals(queries: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Free-text string literals of the recorded SQL per table, without LIKE wildcards"""
+    literals: Dict[str, set] = {}
+    for record in queries:
+        found = literals.setdefault(record["table_name"], set())
+        for literal in TrafficCapture.free_text_literals(record["sql"]):
+            value = literal.replace("%", "").strip()
+            if value:
+                found.add(value)
+    return {table: sorted(values) for table, values in literals.items()}
+
+
+def sql_dates(queries: List[Dict[str, Any]]) -> Dict[str, Tuple[pd.Timestamp, pd.Timestamp]]:
+    """Earliest and latest date literal in the recorded SQL per table"""
+    found: Dict[str, List[pd.Timestamp]] = {}
+    for record in queries:
+        for value in re.findall(r"'(\d{4}-\d{2}-\d{2})", record["sql"]):
+            try:
+                found.setdefault(record["table_name"], []).append(pd.Timestamp(value))
+            except ValueError:
+                continue
+    return {table: (min(dates), max(dates)) for table, dates in found.items()}
+
+
+def synthesize(table: Dict[str, Any], rows: int, literals: List[str], path: str,
+               dates: Optional[Tuple[pd.Timestamp, pd.Timestamp]] = None, seed: int = 7):
+    """
+    Write a CSV with the recorded columns of a table, filled with random values by type
+
+    Text values are drawn from literals, and dates from a year either side
+    of the dates range, so recorded filters select some rows.
+    """
+    rng = np.random.default_rng(seed)
+    first, last = dates or (pd.Timestamp("2021-01-01"), pd.Timestamp("2022-12-31"))
+    first, span = first - pd.Timedelta(days=365), (last - first).days + 2 * 365
+    words = literals + [f"value{i}" for i in range(max(20, len(literals)))]
+    columns = {}
+    for column in table["columns"]:
+        column_type = (column["type"] or "").upper()
+        if any(name in column_type for name in ("INT", "BOOL")):
+            columns[column["name"]] = rng.integers(0, 1000, rows)
+        elif any(name in column_type for name in ("REAL", "FLOA", "DOUB", "NUM", "DEC")):
+            columns[column["name"]] = rng.lognormal(4, 0.8, rows).round(2)
+        elif any(name in column_type for name in ("DATE", "TIME")):
+            days = pd.to_timedelta(rng.integers(0, span + 1, rows), unit="D")
+            columns[column["name"]] = (first + days).strftime("%Y-%m-%d")
+        else:
+            columns[column["name"]] = rng.choice(words, rows)
+    pd.DataFrame(columns).to_csv(path, index=False)
+
+
+def retarget(sql: str, recorded: str) -> str:
+    """Replace references to the recorded table with {table}, filled in by the stub"""
+    parts = []
+    for token in tokenize(sql, keep_whitespace=True):
+        if token.kind in ("word", "identifier") and identifier_name(token) == recorded:
+            parts.append("{table}")
+        else:
+            parts.append(token.value)
+    return "".join(parts)
+
+
+def prepare_tables(args, tables: Dict[str, Dict[str, Any]], queries: List[Dict[str, Any]],
+                   data_dir: str) -> Dict[str, str]:
+    """Files to upload per captured table, from --table or synthesized"""
+    given = dict(item.split("=", 1) for item in args.table)
+    literals = sql_literals(queries)
+    dates = sql_dates(queries)
+    files = {}
+    for name in sorted({record["table_name"] for record in queries}):
+        if name in given:
+            files[name] = given[name]
+        elif name in tables:
+            rows = max(1, min(args.max_rows, math.ceil(tables[name]["row_count"] * args.scale)))
+            files[name] = os.path.join(data_dir, f"{name}.csv")
+            print(f"  synthesizing {name}: {rows:,} rows, {len(tables[name]['columns'])} columns", flush=True)
+            synthesize(tables[name], rows, literals.get(name, []), files[name], dates.get(name))
+        else:
+            print(f"  {name}: no table record in the capture and no --table file, skipping its queries")
+    return files
+
+
+def replay(port: int, queries: List[Dict[str, Any]], names: Dict[str, str], speedup: float,
+           concurrency: int) -> Tuple[List[Reply], List[float], float]:
+    """
+    Send queries on their recorded schedule
+
+    Returns:
+        Tuple of (replies in query order, schedule lag per query in seconds, elapsed seconds)
+    """
+    replies: List[Optional[Reply]] = [None] * len(queries)
+    lags = [0.0] * len(queries)
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def send(index: int, record: Dict[str, Any]):
+        try:
+            path = "/api/query" + (f"?format={record['format']}" if record.get("format", "records") != "records" else "")
+            payload = {"question": record["question"], "table_name": names[record["table_name"]],
+                       "mode": record.get("mode", "auto")}
+            replies[index] = request(port, "POST", path, payload, keep_body=False)
+        except OSError as e:
+            replies[index] = Reply(599, {}, str(e).encode(), 0, 0.0)
+        finally:
+            slots.release()
+
+    first = queries[0]["ts"] if queries else 0.0
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        for index, record in enumerate(queries):
+            due = start + ((record["ts"] - first) / speedup if speedup > 0 else 0.0)
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            slots.acquire()
+            lags[index] = max(0.0, time.perf_counter() - due)
+            pool.submit(send, index, record)
+    return replies, lags, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", nargs="+", help="Capture files (JSON lines)")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Replay rate relative to the recording; 0 = no gaps")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum requests in flight")
+    parser.add_argument("--limit", type=int, help="Replay only the first N queries")
+    parser.add_argument("--table", action="append", default=[], metavar="NAME=FILE",
+                        help="Upload FILE for captured table NAME instead of synthetic data (repeatable)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Synthetic rows as a fraction of the recorded rows")
+    parser.add_argument("--max-rows", type=int, default=1_000_000, help="Largest synthetic table")
+    parser.add_argument("--llm-latency-ms", type=float,
+                        help="Stub LLM latency for every question (default: as recorded, else 300)")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Server setting, e.g. --env QUESTION_CACHE_THRESHOLD=1 (repeatable)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directories and server log")
+    parser.add_argument("--output", help="Report path (default replay-<timestamp>.json)")
+    args = parser.parse_args()
+
+    tables, queries = load_capture(args.capture)
+    if args.limit:
+        queries = queries[:args.limit]
+    if not queries:
+        sys.exit("No queries in the capture")
+    span = queries[-1]["ts"] - queries[0]["ts"]
+    print(f"{len(queries)} queries over {span:.0f}s on {len({q['table_name'] for q in queries})} table(s)")
+
+    data_dir = tempfile.mkdtemp(prefix="analytics_gpt_replay_")
+    files = prepare_tables(args, tables, queries, data_dir)
+
+    responses = [
+        {
+            "question": record["question"],
+            "table_name": record["table_name"],
+            "sql": retarget(record["sql"], record["table_name"]),
+            "latency": None if args.llm_latency_ms is not None else
+            (record["stages"]["llm"] / 1000 if "llm" in record.get("stages", {}) else None),
+        }
+        for record in queries if record["table_name"] in files
+    ]
+    latency = (args.llm_latency_ms if args.llm_latency_ms is not None else 300) / 1000
+    stub = StubLLM([], latency=latency).start()
+
+    server = Server(stub.base_url, args.workers, dict(item.split("=", 1) for item in args.env))
+    sampler = RssSampler(server.process.pid)
+    sampler.start()
+    try:
+        names = {}
+        for recorded, path in files.items():
+            reply = request(server.port, "POST", "/api/upload", upload=path)
+            if reply.status != 200:
+                sys.exit(f"Uploading {path} failed: {reply.status} {reply.body[:300].decode(errors='replace')}")
+            names[recorded] = json.loads(reply.body)["table_name"]
+            print(f"  uploaded {os.path.basename(path)} as {names[recorded]} in {reply.seconds:.1f}s", flush=True)
+
+        # The stub sees the uploaded table's name in the prompt
+        for record in responses:
+            stub.answers[(names[record["table_name"]], record["question"])] = (record["sql"], record["latency"])
+        queries = [record for record in queries if record["table_name"] in names]
+
+        rate = f"{args.speedup:g}x" if args.speedup > 0 else "back to back"
+        print(f"\nreplaying {len(queries)} queries {rate}, at most {args.concurrency} in flight\n")
+        sampler.reset()
+        replies, lags, seconds = replay(server.port, queries, names, args.speedup, args.concurrency)
+
+        results = [summarize("replay/all", replies, seconds, sampler)]
+        if len(names) > 1:
+            for recorded in names:
+                subset = [reply for reply, record in zip(replies, queries) if record["table_name"] == recorded]
+                results.append(summarize(f"replay/{recorded}", subset, seconds, sampler))
+    finally:
+        sampler.stop()
+        server.stop()
+        stub.shutdown()
+        if not args.keep:
+            shutil.rmtree(server.workdir, ignore_errors=True)
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    lag_ms = sorted(lag * 1000 for lag in lags)
+    recorded_ms = sorted(record["total_ms"] for record in queries)
+    recorded_misses = sum(record["cache"] == "miss" for record in queries)
+    replayed_misses = sum("llm" in _server_timing(reply.headers.get("server-timing", "")) for reply in replies)
+    results[0].update(
+        schedule_lag_ms={
+            "p50": round(percentile(lag_ms, 0.5), 2),
+            "p99": round(percentile(lag_ms, 0.99), 2),
+            "max": round(lag_ms[-1], 2),
+        },
+        recorded_latency_ms={
+            "mean": round(statistics.fmean(recorded_ms), 2),
+            "p50": round(percentile(recorded_ms, 0.5), 2),
+            "p99": round(percentile(recorded_ms, 0.99), 2),
+        },
+        recorded_llm_calls=recorded_misses,
+        llm_calls=replayed_misses,
+        status_changes=sum(reply.status != record["status"] for reply, record in zip(replies, queries)),
+    )
+    print(
+        f"\nrecorded p50 {results[0]['recorded_latency_ms']['p50']:.1f}ms, "
+        f"p99 {results[0]['recorded_latency_ms']['p99']:.1f}ms; "
+        f"LLM calls {replayed_misses} (recorded {recorded_misses}); "
+        f"schedule lag p99 {results[0]['schedule_lag_ms']['p99']:.1f}ms; "
+        f"{results[0]['status_changes']} responses with a different status than recorded"
+    )
+
+    report = {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "capture": [os.path.abspath(path) for path in args.capture],
+            "queries": len(queries),
+            "recorded_seconds": round(span, 3),
+            "options": {key: value for key, value in vars(args).items() if key not in ("capture", "output")},
+            "llm_completions": stub.requests,
+            "llm_unmatched": stub.unmatched,
+        },
+        "results": results,
+    }
+    output = args.output or f"replay-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
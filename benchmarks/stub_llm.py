@@ -0,0 +1,215 @@
+"""
+OpenAI-compatible stub server for benchmarks
+
+Answers POST /v1/chat/completions, plain and streamed, after a configurable
+latency, so benchmarks measure this server and not the OpenAI API. The SQL
+for a prompt is looked up by the question in the prompt (and the table
+name, when responses are given per table) in a JSON file:
+
+    {"How many orders?": "SELECT COUNT(*) FROM {table}", ...}
+    [{"question": "...", "table_name": "...", "sql": "...", "latency": 0.8}, ...]
+
+{table} in the SQL is replaced by the table named in the prompt. A record's
+latency (seconds) replaces --latency-ms for that question. Unknown
+questions get --default-sql.
+
+Usage:
+    python benchmarks/stub_llm.py --responses FILE [--port 8001] [--latency-ms 300] [--jitter-ms 50]
+
+Then start the backend with OPENAI_BASE_URL=http://127.0.0.1:8001/v1.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+# Fields of the prompt built by LLMService._build_prompt
+_QUESTION = re.compile(r"^Question: (.*?)\n\nImportant Instructions", re.MULTILINE | re.DOTALL)
+_TABLE = re.compile(r"^Table Name: (\S+)", re.MULTILINE)
+
+# Characters per streamed chunk, about one token
+CHUNK_SIZE = 4
+
+
+class StubLLM(ThreadingHTTPServer):
+    """
+    HTTP server answering chat completion requests with canned SQL
+
+    Attributes:
+        requests: Completions served
+        unmatched: Completions answered with the default SQL
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        responses: Union[Dict[str, str], Iterable[Dict[str, Any]]],
+        latency: float = 0.3,
+        jitter: float = 0.0,
+        token_delay: float = 0.005,
+        default_sql: str = "SELECT COUNT(*) FROM {table}",
+        port: int = 0,
+        seed: int = 7
+    ):
+        """
+        Args:
+            responses: Question -> SQL, or records with question, sql and optionally
+                table_name and latency
+            latency: Seconds before the answer (or its first streamed chunk)
+            jitter: Maximum extra seconds added to latency, drawn uniformly
+            token_delay: Seconds between streamed chunks
+            default_sql: SQL for questions not in responses
+            port: Port to listen on; 0 picks a free one
+            seed: Seed for the jitter
+        """
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.answers: Dict[Tuple[Optional[str], str], Tuple[str, Optional[float]]] = {}
+        if isinstance(responses, dict):
+            responses = [{"question": question, "sql": sql} for question, sql in responses.items()]
+        for record in responses:
+            self.answers[(record.get("table_name"), record["question"])] = (record["sql"], record.get("latency"))
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.default_sql = default_sql
+        self.requests = 0
+        self.unmatched = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        """Value for OPENAI_BASE_URL"""
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def answer(self, prompt: str) -> Tuple[str, float]:
+        """SQL for a prompt and the seconds to wait before sending it"""
+        question = _QUESTION.search(prompt)
+        table = _TABLE.search(prompt)
+        question = question.group(1) if question else ""
+        table = table.group(1) if table else ""
+        sql, latency = self.answers.get((table, question)) or self.answers.get((None, question)) or (None, None)
+        with self._lock:
+            self.requests += 1
+            if sql is None:
+                self.unmatched += 1
+            delay = (self.latency if latency is None else latency) + self._random.uniform(0, self.jitter)
+        return (sql or self.default_sql).replace("{table}", table), delay
+
+    def start(self) -> "StubLLM":
+        """Serve from a background thread"""
+        threading.Thread(target=self.serve_forever, name="stub-llm", daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StubLLM
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate benchmark output
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "\n".join(message.get("content") or "" for message in request.get("messages", []))
+        sql, delay = self.server.answer(prompt)
+        time.sleep(delay)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = request.get("model", "stub")
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": sql},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(sql) // 4,
+                          "total_tokens": (len(prompt) + len(sql)) // 4}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(delta: Dict[str, Any], finish_reason: Optional[str] = None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        event({"role": "assistant", "content": ""})
+        for start in range(0, len(sql), CHUNK_SIZE):
+            event({"content": sql[start:start + CHUNK_SIZE]})
+            time.sleep(self.server.token_delay)
+        event({}, "stop")
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def load_responses(path: str) -> Union[Dict[str, str], list]:
+    """Read a responses file"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", help="JSON file of questions and their SQL")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--token-ms", type=float, default=5, help="Delay between streamed chunks")
+    parser.add_argument("--default-sql", default="SELECT COUNT(*) FROM {table}")
+    args = parser.parse_args()
+
+    server = StubLLM(
+        load_responses(args.responses) if args.responses else {},
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        token_delay=args.token_ms / 1000,
+        default_sql=args.default_sql,
+        port=args.port
+    )
+    print(f"Stub LLM on {server.base_url} ({len(server.answers)} canned answers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"{server.requests} completions, {server.unmatched} with the default SQL")
+
+
+if __name__ == "__main__":
+    main()
@@ -220,7 +220,8 @@ class AnalyticsGPTApp {
         }
 
         try {
-            const response = await fetch(`${this.apiBaseUrl}/query`, {
+            // Columnar responses send column names once instead of per row
+            const response = await fetch(`${this.apiBaseUrl}/query?format=columnar`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -244,6 +245,119 @@ class AnalyticsGPTApp {
             throw error;
         }
     }
+
+    async streamQuery(question, handlers = {}) {
+        if (!this.currentTable) {
+            this.showToast('error', 'Please upload a file first');
+            return null;
+        }
+
+        const tableName = this.currentTable;
+
+        try {
+            const response = await fetch(`${this.apiBaseUrl}/query/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
+                },
+                body: JSON.stringify({
+                    question: question,
+                    table_name: tableName
+                })
+            });
+
+            if (!response.ok) {
+                const error = await response.json();
+                throw new Error(error.detail || 'Query failed');
+            }
+
+            // Assemble the same shape as a columnar /api/query response while events arrive
+            const result = {
+                question: question,
+                table_name: tableName,
+                sql_query: '',
+                columns: [],
+                rows: [],
+                row_count: 0,
+                execution_time: '',
+                result_id: null,
+                approximation: null,
+                message: null
+            };
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+
+                buffer += decoder.decode(value, { stream: true });
+
+                // Events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const frame = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    this.handleStreamEvent(frame, result, handlers);
+                }
+            }
+
+            return result;
+
+        } catch (error) {
+            this.showToast('error', error.message);
+            throw error;
+        }
+    }
+
+    handleStreamEvent(frame, result, handlers) {
+        let event = 'message';
+        let data = '';
+
+        frame.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data += line.slice(5).trim();
+            }
+        });
+
+        const payload = data ? JSON.parse(data) : {};
+
+        switch (event) {
+            case 'token':
+                if (handlers.onToken) handlers.onToken(payload.text);
+                break;
+            case 'sql':
+                result.sql_query = payload.sql_query;
+                if (handlers.onSql) handlers.onSql(payload.sql_query);
+                break;
+            case 'columns':
+                result.columns = payload.columns;
+                break;
+            case 'rows':
+                // Keep rows as arrays aligned with result.columns
+                for (const row of payload.rows) {
+                    result.rows.push(row);
+                }
+                result.row_count = result.rows.length;
+                if (handlers.onRows) handlers.onRows(result.row_count);
+                break;
+            case 'done':
+                result.row_count = payload.row_count;
+                result.execution_time = payload.execution_time;
+                // Large results are also kept on the server, so downloads read them from there
+                result.result_id = payload.result_id;
+                result.approximation = payload.approximation;
+                result.message = payload.message;
+                break;
+            case 'error':
+                throw new Error(payload.detail || 'Query failed');
+        }
+    }
 }
 
 // Initialize app when DOM is ready
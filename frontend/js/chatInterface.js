@@ -53,8 +53,12 @@ export class ChatInterface {
         const thinkingId = this.addThinkingIndicator();
 
         try {
-            // Send query to backend
-            const result = await this.app.sendQuery(question);
+            // Stream query from backend, showing the SQL as it is generated
+            const result = await this.app.streamQuery(question, {
+                onToken: (text) => this.appendThinkingText(thinkingId, text),
+                onSql: (sql) => this.setThinkingText(thinkingId, sql),
+                onRows: (count) => this.setThinkingStatus(thinkingId, `Fetched ${count.toLocaleString()} rows...`)
+            });
 
             // Remove thinking indicator
             this.removeThinkingIndicator(thinkingId);
@@ -108,13 +112,22 @@ export class ChatInterface {
         `;
 
         const resultsHtml = result.row_count > 0
-            ? this.app.tableDisplay.createResultsTable(result.results, result.row_count)
+            ? this.app.tableDisplay.createResultsTable(result.columns, result.rows, result.row_count)
             : '<p style="color: var(--text-secondary); margin-top: 0.5rem;">No results found.</p>';
 
+        // E.g. that the answer was estimated from a sample
+        const noteHtml = result.message ? `
+            <div class="truncation-notice">
+                <span class="truncation-icon">ℹ️</span>
+                <span class="truncation-message">${this.escapeHtml(result.message)}</span>
+            </div>
+        ` : '';
+
         messageDiv.innerHTML = `
             <div class="message-avatar">🤖</div>
             <div class="message-content">
                 ${sqlHtml}
+                ${noteHtml}
                 ${resultsHtml}
             </div>
         `;
@@ -127,7 +140,7 @@ export class ChatInterface {
             // Pass SQL query and table name for efficient large dataset downloads
             this.app.tableDisplay.setupDownloadButtons(
                 messageDiv,
-                result.results,
+                result,
                 result.sql_query,
                 this.app.currentTable
             );
@@ -150,6 +163,7 @@ export class ChatInterface {
                         <div class="thinking-dot"></div>
                         <div class="thinking-dot"></div>
                     </div>
+                    <div class="thinking-status"></div>
                 </div>
             </div>
         `;
@@ -160,6 +174,42 @@ export class ChatInterface {
         return thinkingId;
     }
 
+    appendThinkingText(thinkingId, text) {
+        const sqlDiv = this.getThinkingSql(thinkingId);
+        if (sqlDiv) {
+            sqlDiv.textContent += text;
+            this.scrollToBottom();
+        }
+    }
+
+    setThinkingText(thinkingId, text) {
+        const sqlDiv = this.getThinkingSql(thinkingId);
+        if (sqlDiv) {
+            sqlDiv.textContent = text;
+        }
+    }
+
+    setThinkingStatus(thinkingId, text) {
+        const thinkingDiv = document.getElementById(thinkingId);
+        const statusDiv = thinkingDiv ? thinkingDiv.querySelector('.thinking-status') : null;
+        if (statusDiv) {
+            statusDiv.textContent = text;
+        }
+    }
+
+    getThinkingSql(thinkingId) {
+        const thinkingDiv = document.getElementById(thinkingId);
+        if (!thinkingDiv) return null;
+
+        let sqlDiv = thinkingDiv.querySelector('.sql-query');
+        if (!sqlDiv) {
+            sqlDiv = document.createElement('div');
+            sqlDiv.className = 'sql-query';
+            thinkingDiv.querySelector('.message-content').appendChild(sqlDiv);
+        }
+        return sqlDiv;
+    }
+
     removeThinkingIndicator(thinkingId) {
         const thinkingDiv = document.getElementById(thinkingId);
         if (thinkingDiv) {
@@ -5,14 +5,13 @@ export class TableDisplay {
         this.DISPLAY_LIMIT = 100; // Maximum rows to display in UI
     }
 
-    createResultsTable(results, rowCount) {
-        if (!results || results.length === 0) {
+    createResultsTable(columns, rows, rowCount) {
+        if (!rows || rows.length === 0) {
             return '<p style="color: var(--text-secondary);">No results found.</p>';
         }
 
-        const columns = Object.keys(results[0]);
-        const displayResults = results.slice(0, this.DISPLAY_LIMIT);
-        const hasMoreRows = results.length > this.DISPLAY_LIMIT;
+        const displayRows = rows.slice(0, this.DISPLAY_LIMIT);
+        const hasMoreRows = rows.length > this.DISPLAY_LIMIT;
 
         // Notification banner for truncated results
         const truncationNotice = hasMoreRows ? `
@@ -50,10 +49,10 @@ export class TableDisplay {
                             </tr>
                         </thead>
                         <tbody>
-                            ${displayResults.map(row => `
+                            ${displayRows.map(row => `
                                 <tr>
-                                    ${columns.map(col => `
-                                        <td>${this.formatValue(row[col])}</td>
+                                    ${row.map(value => `
+                                        <td>${this.formatValue(value)}</td>
                                     `).join('')}
                                 </tr>
                             `).join('')}
@@ -66,35 +65,39 @@ export class TableDisplay {
         return tableHtml;
     }
 
-    setupDownloadButtons(messageDiv, data, sqlQuery = null, tableName = null) {
+    setupDownloadButtons(messageDiv, result, sqlQuery = null, tableName = null) {
         const downloadButtons = messageDiv.querySelectorAll('.btn-download');
 
         downloadButtons.forEach(btn => {
             btn.addEventListener('click', async () => {
                 const format = btn.dataset.format;
-                await this.downloadResults(data, format, sqlQuery, tableName);
+                await this.downloadResults(result, format, sqlQuery, tableName);
             });
         });
     }
 
-    async downloadResults(data, format, sqlQuery = null, tableName = null) {
+    async downloadResults(result, format, sqlQuery = null, tableName = null) {
         try {
             const filename = `query_results_${Date.now()}`;
+            const rowCount = result.row_count;
 
             // Show loading toast for large downloads
-            if (data.length > 1000) {
+            if (rowCount > 1000) {
                 this.app.showToast('info', `Preparing ${format.toUpperCase()} download...`);
             }
 
-            if (format === 'csv') {
+            if (result.result_id) {
+                // Large results were kept on the server; stream the full copy from there
+                await this.downloadFromServer(format, { result_id: result.result_id, filename: filename }, filename);
+            } else if (format === 'csv') {
                 // For CSV, use client-side download (faster for most cases)
-                this.downloadAsCSV(data, filename);
+                this.downloadAsCSV(result.columns, result.rows, filename);
             } else if (format === 'excel') {
                 // For Excel, use backend for better formatting and large file support
-                await this.downloadAsExcel(data, filename, sqlQuery, tableName);
+                await this.downloadAsExcel(result.columns, result.rows, filename, sqlQuery, tableName);
             }
 
-            this.app.showToast('success', `Downloaded ${data.length.toLocaleString()} rows as ${format.toUpperCase()}`);
+            this.app.showToast('success', `Downloaded ${rowCount.toLocaleString()} rows as ${format.toUpperCase()}`);
 
         } catch (error) {
             console.error('Download error:', error);
@@ -102,14 +105,12 @@ export class TableDisplay {
         }
     }
 
-    downloadAsCSV(data, filename) {
+    downloadAsCSV(columns, rows, filename) {
         // Convert to CSV
-        const columns = Object.keys(data[0]);
         const csvContent = [
             columns.join(','),
-            ...data.map(row =>
-                columns.map(col => {
-                    let value = row[col];
+            ...rows.map(row =>
+                row.map(value => {
                     if (value === null || value === undefined) value = '';
                     value = String(value);
                     // Escape quotes and wrap in quotes if contains comma or quote
@@ -137,7 +138,7 @@ export class TableDisplay {
         URL.revokeObjectURL(url);
     }
 
-    async downloadAsExcel(data, filename, sqlQuery = null, tableName = null) {
+    async downloadAsExcel(columns, rows, filename, sqlQuery = null, tableName = null) {
         try {
             // Prepare request payload
             const requestBody = {
@@ -145,40 +146,21 @@ export class TableDisplay {
             };
 
             // Use SQL query method for large datasets (more efficient)
-            if (sqlQuery && tableName && data.length > 100) {
+            if (sqlQuery && tableName && rows.length > 100) {
                 requestBody.sql_query = sqlQuery;
                 requestBody.table_name = tableName;
             } else {
                 // Use data method for small datasets
-                requestBody.data = data;
+                requestBody.data = rows.map(row => {
+                    const record = {};
+                    columns.forEach((col, idx) => {
+                        record[col] = row[idx];
+                    });
+                    return record;
+                });
             }
 
-            const response = await fetch(`${this.app.apiBaseUrl}/download/excel`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(requestBody)
-            });
-
-            if (!response.ok) {
-                const error = await response.json();
-                throw new Error(error.detail || 'Failed to generate Excel file');
-            }
-
-            // Get blob from response
-            const blob = await response.blob();
-
-            // Create download link
-            const url = window.URL.createObjectURL(blob);
-            const link = document.createElement('a');
-            link.href = url;
-            link.download = `${filename}.xlsx`;
-            document.body.appendChild(link);
-            link.click();
-            document.body.removeChild(link);
-
-            window.URL.revokeObjectURL(url);
+            await this.downloadFromServer('excel', requestBody, filename);
 
         } catch (error) {
             console.error('Excel download error:', error);
@@ -186,6 +168,35 @@ export class TableDisplay {
         }
     }
 
+    async downloadFromServer(format, requestBody, filename) {
+        const response = await fetch(`${this.app.apiBaseUrl}/download/${format}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(requestBody)
+        });
+
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.detail || `Failed to generate ${format.toUpperCase()} file`);
+        }
+
+        // Get blob from response
+        const blob = await response.blob();
+
+        // Create download link
+        const url = window.URL.createObjectURL(blob);
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = `${filename}.${format === 'excel' ? 'xlsx' : format}`;
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+
+        window.URL.revokeObjectURL(url);
+    }
+
     formatValue(value) {
         if (value === null || value === undefined) {
             return '<span style="color: var(--text-muted);">NULL</span>';
@@ -0,0 +1,56 @@
+"""
+Parquet and Arrow exports of columns holding several SQLite storage classes
+
+Usage:
+    python -m pytest tests
+"""
+import io
+import os
+import sqlite3
+import sys
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.export_formats import column_types, iter_arrow, iter_parquet, storage_classes_query  # noqa: E402
+
+# Integers for a few batches, then text: the text arrives after a sampled schema would be fixed
+BATCHES = [[(1, 1.5), (2, None)], [(3, 2)], [("n/a", 4.0), (None, 5)]]
+
+
+def _types(batches):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (a, b)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [row for rows in batches for row in rows])
+    return column_types(conn.execute(storage_classes_query("SELECT a, b FROM t;", 2)).fetchone())
+
+
+def test_storage_classes_query_lists_every_class():
+    assert _types(BATCHES) == [{int, str}, {float, int}]
+
+
+def test_parquet_widens_mixed_column_to_text():
+    data = b"".join(iter_parquet(["a", "b"], BATCHES, types=_types(BATCHES)))
+    table = pq.read_table(io.BytesIO(data))
+
+    assert table.schema.field("a").type == pa.string()
+    assert table.schema.field("b").type == pa.float64()
+    assert table.column("a").to_pylist() == ["1", "2", "3", "n/a", None]
+    assert table.column("b").to_pylist() == [1.5, None, 2.0, 4.0, 5.0]
+
+
+def test_arrow_widens_mixed_column_to_text():
+    data = b"".join(iter_arrow(["a", "b"], BATCHES, types=_types(BATCHES)))
+    table = pa.ipc.open_stream(io.BytesIO(data)).read_all()
+
+    assert table.column("a").to_pylist() == ["1", "2", "3", "n/a", None]
+
+
+def test_sampled_schema_rejects_late_text():
+    # Without the types the schema comes from the first batch, where every column has a value
+    with pytest.raises(ValueError):
+        b"".join(iter_parquet(["a", "b"], BATCHES))
@@ -0,0 +1,52 @@
+"""
+Question cache matching: reworded and misspelled questions hit, different questions never do
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.question_cache import QuestionCache  # noqa: E402
+
+FINGERPRINT = "employees"
+
+
+@pytest.fixture
+def cache():
+    cache = QuestionCache()
+    cache.add(FINGERPRINT, "sort employees by salary ascending", "SELECT * FROM employees ORDER BY salary ASC")
+    return cache
+
+
+def test_opposite_sort_order_is_not_served(cache):
+    assert cache.lookup(FINGERPRINT, "sort employees by salary descending") is None
+
+
+@pytest.mark.parametrize("question", [
+    "Sort employees by salary ascending?",
+    "sort employee by salary ascending",
+    "sort employees by salry ascending",
+    "sort employees by slaary ascending",
+])
+def test_rewording_and_typos_hit(cache, question):
+    assert cache.lookup(FINGERPRINT, question)["sql"].endswith("ASC")
+
+
+@pytest.mark.parametrize("left, right", [
+    ("asc", "desc"),
+    ("ascending", "descending"),
+    ("min", "max"),
+    ("highest", "lowest"),
+    ("before", "after"),
+    ("first", "last"),
+    ("count", "country"),
+    ("count", "county"),
+])
+def test_guard_pairs_never_match(left, right):
+    assert not QuestionCache._words_match([left], [right])
+    assert not QuestionCache._words_match([right], [left])